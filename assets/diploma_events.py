@@ -0,0 +1,16 @@
+# The events logged by the diploma smart contract. Every event is one log starting with a
+# one byte kind followed by the 32 byte address of the account it concerns, or the Merkle
+# root of the cohort it concerns. An issuance goes on with the diploma as stored, in the
+# layout of `diploma_codec`. Both the PyTEAL contract and the client import this module,
+# so it must not depend on PyTEAL.
+ISSUED = b'\x01'
+REVOKED = b'\x02'
+ISSUED_BOX = b'\x03'
+REVOKED_BOX = b'\x04'
+REGISTRAR_REASSIGNED = b'\x05'
+COHORT_COMMITTED = b'\x06'
+COHORT_REVOKED = b'\x07'
+REINSTATED = b'\x08'
+
+# The size of the kind and address, or root, that every event starts with
+HEADER_SIZE = 33
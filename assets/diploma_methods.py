@@ -0,0 +1,21 @@
+# The method selectors of the diploma smart contract. Every NoOp call, other than the one
+# creating the contract, names its method with a one byte selector as its first application
+# argument. The contract compares the selectors in this order, so the most common methods
+# come first. Only the registrar may call the methods below `PUBLIC_METHODS`, while the ones
+# from it on may be called by anyone. Both the PyTEAL contract and the client import this
+# module, so it must not depend on PyTEAL.
+ISSUE_DIPLOMAS_BATCH = b'\x00'
+ISSUE_DIPLOMA = b'\x01'
+ISSUE_DIPLOMA_BOX = b'\x02'
+REVOKE_DIPLOMA = b'\x03'
+REVOKE_DIPLOMAS_BATCH = b'\x04'
+REVOKE_DIPLOMA_BOX = b'\x05'
+REASSIGN_REGISTRAR = b'\x06'
+COMMIT_COHORT = b'\x07'
+REVOKE_COHORT = b'\x08'
+REINSTATE_DIPLOMA = b'\x09'
+
+PUBLIC_METHODS = b'\x80'
+INCREASE_BUDGET = b'\x80'
+VERIFY_DIPLOMA_PROOF = b'\x81'
+CLAIM_DIPLOMA = b'\x82'
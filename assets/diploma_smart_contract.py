@@ -1,9 +1,29 @@
 # This example is provided for informational purposes only and has not been audited for security.
 from pyteal import *
 
+import diploma_events as events
+import diploma_methods as methods
+
 var_registrar = Bytes("registrar")
 var_diploma = Bytes("diploma")
-var_degree_duration = Bytes("degree_duration")
+var_cohort = Bytes("cohort")
+var_claimed = Bytes("claimed")
+
+# The prefixes hashed into the leaves and the inner nodes of a cohort's
+# Merkle tree, so that no inner node can pass for a leaf
+merkle_leaf = b'\x00'
+merkle_node = b'\x01'
+
+# Returns the name of the box recording the revocation of the diploma of
+# `account` from the cohort of `root`, which is both of them concatenated
+def revocation_box(account, root):
+    return Concat(account, root)
+
+# Logs the event of `kind` concerning the 32 bytes of `subject`, followed by `fields`. Every
+# change of a diploma, the registrar or a cohort logs one event as laid out in `diploma_events`,
+# so that it can be followed from the blocks without reading any state
+def log_event(kind, subject, *fields):
+    return Log(Concat(Bytes(kind), subject, *fields))
 
 def diploma_program():
     """
@@ -17,73 +37,320 @@ def diploma_program():
     ])
 
     # Checks if the sender of the current transaction invoking this
-    # smart contract is the current registrar
+    # smart contract is the current registrar. Every method call is
+    # checked once by the control flow below, before it is dispatched
     is_registrar = Txn.sender() == App.globalGet(var_registrar)
 
     # Code block invoked during diploma issuance. Only the registrar
-    # may invoke this block with three arguments and one account supplied.
-    # The first argument was "issue_diploma" used by the control flow 
-    # below. The second argument is the diploma metadata which is
-    # set to the local storage of the supplied account (Int(1)). The
-    # third argument is the duration in years that the degree took.
-    diploma_metadata = Txn.application_args[1]
-    degree_duration = Txn.application_args[2]
+    # may invoke this block with two arguments and one account supplied.
+    # The first argument was the `ISSUE_DIPLOMA` selector used by the control flow 
+    # below. The second argument is the diploma, encoded by the client
+    # with its metadata and degree duration as one value, which is set
+    # to the local storage of the supplied account (Int(1)).
+    diploma = Txn.application_args[1]
     issue_diploma = Seq([
         # Sanity checks
-        Assert(is_registrar),
-        Assert(Txn.application_args.length() == Int(3)),
+        Assert(Txn.application_args.length() == Int(2)),
         Assert(Txn.accounts.length() == Int(1)),
         
-        App.localPut(Int(1), var_diploma, diploma_metadata),
-        App.localPut(Int(1), var_degree_duration, Btoi(degree_duration)),
+        App.localPut(Int(1), var_diploma, diploma),
+        log_event(events.ISSUED, Txn.accounts[1], diploma),
         Return(Int(1))
     ])
 
+    # Deletes the diploma in the local storage of the supplied account at
+    # `index`. If the diploma was claimed from a cohort, whose root `claim_diploma`
+    # keeps next to it, its revocation from that cohort is recorded too, as
+    # in `revoke_diploma`, so that it cannot be claimed back. That box must be
+    # referenced by the transaction.
+    @Subroutine(TealType.none)
+    def revoke_local_diploma(index):
+        claimed_root = App.localGetEx(index, Int(0), var_claimed)
+        return Seq([
+            claimed_root,
+            If(claimed_root.hasValue()).Then(Seq([
+                App.box_put(revocation_box(Txn.accounts[index], claimed_root.value()), Itob(Global.round())),
+                App.localDel(index, var_claimed),
+            ])),
+            App.localDel(index, var_diploma),
+        ])
+
     # Code block invoked during diploma revocation. Only the registrar
-    # may invoke this block with one argument and one account supplied.
-    # The first argument was "revoke_diploma" used by the control flow 
+    # may invoke this block with one or two arguments and one account supplied.
+    # The first argument was the `REVOKE_DIPLOMA` selector used by the control flow 
     # below. The local storage containing the diploma metadata of the 
-    # supplied account (Int(1)) is deleted.
+    # supplied account (Int(1)) is deleted. The optional second argument is
+    # the Merkle root of a cohort the diploma was committed in. The revocation
+    # is then recorded in a box named by the account and the root, holding
+    # its round, so that the diploma can neither be verified nor claimed from
+    # the cohort again. The account need not have claimed it yet. A claimed
+    # diploma is revoked from its cohort even without the root.
+    revoked_root = Txn.application_args[1]
     revoke_diploma = Seq([
         # Sanity checks
-        Assert(is_registrar),
+        Assert(Txn.application_args.length() <= Int(2)),
+        Assert(Txn.accounts.length() == Int(1)),
+
+        If(Txn.application_args.length() == Int(2)).Then(Seq([
+            Assert(Len(revoked_root) == Int(32)),
+            App.box_put(revocation_box(Txn.accounts[1], revoked_root), Itob(Global.round())),
+            If(App.optedIn(Int(1), Global.current_application_id()),
+               revoke_local_diploma(Int(1))),
+        ])).Else(
+            revoke_local_diploma(Int(1)),
+        ),
+        log_event(events.REVOKED, Txn.accounts[1]),
+        Return(Int(1))
+    ])
+
+    # Code block invoked to lift the revocation of a diploma from a cohort.
+    # Only the registrar may invoke this block with two arguments and one
+    # account supplied. The box recording the revocation of the diploma of
+    # the supplied account (Txn.accounts[1]) from the cohort of the root in
+    # the second argument is deleted, so that it verifies again.
+    reinstate_diploma = Seq([
+        # Sanity checks
+        Assert(Txn.application_args.length() == Int(2)),
+        Assert(Txn.accounts.length() == Int(1)),
+
+        Assert(App.box_delete(revocation_box(Txn.accounts[1], revoked_root))),
+        log_event(events.REINSTATED, Txn.accounts[1]),
+        Return(Int(1))
+    ])
+
+    # Code block invoked during batch diploma issuance. Only the registrar
+    # may invoke this block with one to four accounts supplied, and with a
+    # diploma argument for each account, in the order of the accounts. The
+    # first argument was the `ISSUE_DIPLOMAS_BATCH` selector. The diploma of
+    # the i-th supplied account (Int(i)) is set to its local storage from
+    # the argument i, as in `issue_diploma`.
+    num_accounts = Txn.accounts.length()
+    i = ScratchVar(TealType.uint64)
+    issue_diplomas_batch = Seq([
+        # Sanity checks
+        Assert(num_accounts >= Int(1)),
+        Assert(num_accounts <= Int(4)),
+        Assert(Txn.application_args.length() == num_accounts + Int(1)),
+
+        For(i.store(Int(1)), i.load() <= num_accounts, i.store(i.load() + Int(1))).Do(Seq([
+            App.localPut(i.load(), var_diploma, Txn.application_args[i.load()]),
+            log_event(events.ISSUED, Txn.accounts[i.load()], Txn.application_args[i.load()]),
+        ])),
+        Return(Int(1))
+    ])
+
+    # Code block invoked during batch diploma revocation. Only the registrar
+    # may invoke this block with one argument and one to four accounts
+    # supplied. The diploma in the local storage of every supplied account
+    # is deleted, and revoked from the cohort it was claimed from, as in
+    # `revoke_diploma`.
+    revoke_diplomas_batch = Seq([
+        # Sanity checks
         Assert(Txn.application_args.length() == Int(1)),
+        Assert(num_accounts >= Int(1)),
+        Assert(num_accounts <= Int(4)),
+
+        For(i.store(Int(1)), i.load() <= num_accounts, i.store(i.load() + Int(1))).Do(Seq([
+            revoke_local_diploma(i.load()),
+            log_event(events.REVOKED, Txn.accounts[i.load()]),
+        ])),
+        Return(Int(1))
+    ])
+
+    # Code block invoked during box diploma issuance. Only the registrar
+    # may invoke this block with two arguments and one account supplied.
+    # Unlike `issue_diploma`, the student need not opt in. The diploma is
+    # stored in a box named by the supplied account's address (Txn.accounts[1])
+    # holding the same value as the local storage would. The box must be
+    # referenced by the transaction and its minimum balance is paid by this
+    # application's account.
+    diploma_box = Txn.accounts[1]
+    issue_diploma_box = Seq([
+        # Sanity checks
+        Assert(Txn.application_args.length() == Int(2)),
         Assert(Txn.accounts.length() == Int(1)),
-        
-        App.localDel(Int(1), var_diploma),
-        App.localDel(Int(1), var_degree_duration),
+
+        # A box can only be rewritten with a value of the same size, so
+        # any previously issued diploma is deleted first
+        Pop(App.box_delete(diploma_box)),
+        App.box_put(diploma_box, diploma),
+        log_event(events.ISSUED_BOX, diploma_box, diploma),
+        Return(Int(1))
+    ])
+
+    # Code block invoked during box diploma revocation. Only the registrar
+    # may invoke this block with one or two arguments and one account supplied.
+    # The box holding the diploma of the supplied account (Txn.accounts[1])
+    # is deleted, which releases its minimum balance. A claim only ever
+    # writes local storage, so the optional second argument is the root of
+    # a cohort the diploma was also committed in, whose revocation is then
+    # recorded as in `revoke_diploma`.
+    revoke_diploma_box = Seq([
+        # Sanity checks
+        Assert(Txn.application_args.length() <= Int(2)),
+        Assert(Txn.accounts.length() == Int(1)),
+
+        If(Txn.application_args.length() == Int(2)).Then(Seq([
+            Assert(Len(revoked_root) == Int(32)),
+            App.box_put(revocation_box(Txn.accounts[1], revoked_root), Itob(Global.round())),
+        ])),
+        Assert(App.box_delete(diploma_box)),
+        log_event(events.REVOKED_BOX, diploma_box),
         Return(Int(1))
     ])
 
     # Code block invoked during registrar reassignment. Only the registrar
     # may invoke this block with one argument and one account supplied.
-    # The first argument was "reassign_registrar" used by the control
+    # The first argument was the `REASSIGN_REGISTRAR` selector used by the control
     # flow below. The global variable containing the current registrar
     # is set to the supplied account (Txn.accounts[1])
     new_registrar = Txn.accounts[1]
     reassign_registrar = Seq([
         # Sanity checks
-        Assert(is_registrar),
         Assert(Txn.accounts.length() == Int(1)),
         
         Assert(Txn.application_args.length() == Int(1)),
         App.globalPut(var_registrar, new_registrar),
+        log_event(events.REGISTRAR_REASSIGNED, new_registrar),
         Return(Int(1))
     ])
 
-    # Control flow logic of the smart contract
+    # Code block invoked during cohort commitment. Only the registrar
+    # may invoke this block with two arguments. The second argument is
+    # the 32 byte Merkle root of the diplomas of a whole cohort, which is
+    # stored as a box named by it holding the round of the commitment.
+    # The box must be referenced by the transaction and its minimum
+    # balance is paid by this application's account.
+    cohort_root = Txn.application_args[1]
+    commit_cohort = Seq([
+        # Sanity checks
+        Assert(Txn.application_args.length() == Int(2)),
+        Assert(Len(cohort_root) == Int(32)),
+
+        App.box_put(Concat(var_cohort, cohort_root), Itob(Global.round())),
+        log_event(events.COHORT_COMMITTED, cohort_root),
+        Return(Int(1))
+    ])
+
+    # Code block invoked during cohort revocation. Only the registrar
+    # may invoke this block with two arguments. The box of the Merkle
+    # root in the second argument is deleted, so that none of the
+    # diplomas of its cohort verify anymore.
+    revoke_cohort = Seq([
+        # Sanity checks
+        Assert(Txn.application_args.length() == Int(2)),
+
+        Assert(App.box_delete(Concat(var_cohort, cohort_root))),
+        log_event(events.COHORT_REVOKED, cohort_root),
+        Return(Int(1))
+    ])
+
+    # Checks that a diploma belongs to a committed cohort. The call has
+    # four arguments and one account supplied. The second argument is
+    # the diploma of the supplied account (Txn.accounts[1]), the third
+    # is the Merkle root of its cohort and the fourth the concatenated
+    # 32 byte sibling hashes of its proof. The leaf and every inner node
+    # are hashed with a distinct prefix, and the children of a node are
+    # hashed in sorted order, so the proof need not tell on which side
+    # each sibling is.
+    proof_root = Txn.application_args[2]
+    proof = Txn.application_args[3]
+    node = ScratchVar(TealType.bytes)
+    sibling = ScratchVar(TealType.bytes)
+    cohort = App.box_length(Concat(var_cohort, proof_root))
+    revocation = App.box_length(revocation_box(Txn.accounts[1], proof_root))
+
+    @Subroutine(TealType.none)
+    def verify_proof():
+        return Seq([
+            # Sanity checks
+            Assert(Txn.application_args.length() == Int(4)),
+            Assert(Txn.accounts.length() == Int(1)),
+            Assert(Len(proof) % Int(32) == Int(0)),
+
+            # The cohort must be committed and not revoked, nor the
+            # diploma of the supplied account revoked from it
+            cohort,
+            Assert(cohort.hasValue()),
+            revocation,
+            Assert(Not(revocation.hasValue())),
+
+            node.store(Sha256(Concat(Bytes(merkle_leaf), Txn.accounts[1], diploma))),
+            For(i.store(Int(0)), i.load() < Len(proof), i.store(i.load() + Int(32))).Do(Seq([
+                sibling.store(Extract(proof, i.load(), Int(32))),
+                node.store(If(BytesLt(node.load(), sibling.load()),
+                              Sha256(Concat(Bytes(merkle_node), node.load(), sibling.load())),
+                              Sha256(Concat(Bytes(merkle_node), sibling.load(), node.load())))),
+            ])),
+            Assert(node.load() == proof_root),
+        ])
+
+    # Code block invoked to verify a diploma on demand. Anyone may invoke
+    # this block, which succeeds only if the proof of the diploma verifies.
+    verify_diploma_proof = Seq([
+        verify_proof(),
+        Return(Int(1))
+    ])
+
+    # Code block invoked to claim a diploma of a committed cohort. Anyone
+    # may invoke this block, since the proof binds the diploma to the
+    # supplied account. The diploma is moved into the local storage of the
+    # supplied account (Int(1)) once its proof verifies, as in `issue_diploma`.
+    # The root of its cohort is kept next to it, so that every revocation of
+    # the diploma also revokes it from its cohort. A diploma revoked from its
+    # cohort no longer verifies, so it cannot be claimed again.
+    claim_diploma = Seq([
+        verify_proof(),
+        App.localPut(Int(1), var_diploma, diploma),
+        App.localPut(Int(1), var_claimed, proof_root),
+        log_event(events.ISSUED, Txn.accounts[1], diploma),
+        Return(Int(1))
+    ])
+
+    # Code block invoked only to pool its opcode budget with the other calls
+    # of its group, which lets a long proof be verified. Anyone may invoke it.
+    increase_budget = Return(Int(1))
+
+    # Dispatch of the method calls, named by the one byte selector in the
+    # first argument. The methods are tried in the order of how common they
+    # are. The ones below `PUBLIC_METHODS` may only be called by the
+    # registrar, which is checked once for all of them
+    selector = Txn.application_args[0]
+    registrar_call = Seq([
+        Assert(is_registrar),
+        Cond(
+            [selector == Bytes(methods.ISSUE_DIPLOMAS_BATCH), issue_diplomas_batch],
+            [selector == Bytes(methods.ISSUE_DIPLOMA), issue_diploma],
+            [selector == Bytes(methods.ISSUE_DIPLOMA_BOX), issue_diploma_box],
+            [selector == Bytes(methods.REVOKE_DIPLOMA), revoke_diploma],
+            [selector == Bytes(methods.REVOKE_DIPLOMAS_BATCH), revoke_diplomas_batch],
+            [selector == Bytes(methods.REVOKE_DIPLOMA_BOX), revoke_diploma_box],
+            [selector == Bytes(methods.REASSIGN_REGISTRAR), reassign_registrar],
+            [selector == Bytes(methods.COMMIT_COHORT), commit_cohort],
+            [selector == Bytes(methods.REVOKE_COHORT), revoke_cohort],
+            [selector == Bytes(methods.REINSTATE_DIPLOMA), reinstate_diploma]
+        )
+    ])
+    public_call = Cond(
+        [selector == Bytes(methods.INCREASE_BUDGET), increase_budget],
+        [selector == Bytes(methods.VERIFY_DIPLOMA_PROOF), verify_diploma_proof],
+        [selector == Bytes(methods.CLAIM_DIPLOMA), claim_diploma]
+    )
+    method_call = If(BytesLt(selector, Bytes(methods.PUBLIC_METHODS)), registrar_call, public_call)
+
+    # Control flow logic of the smart contract. It branches on the
+    # `OnComplete` first, so that the common NoOp calls are dispatched
+    # after a single check. The contract is created by a NoOp call too
     program = Cond(
-        [Txn.application_id() == Int(0), init_contract],
-        [Txn.on_completion() == OnComplete.DeleteApplication, Return(is_registrar)],
-        [Txn.on_completion() == OnComplete.UpdateApplication, Return(is_registrar)],
+        [Txn.on_completion() == OnComplete.NoOp,
+         If(Txn.application_id() == Int(0), init_contract, method_call)],
         [Txn.on_completion() == OnComplete.OptIn, Return(Int(1))],
         [Txn.on_completion() == OnComplete.CloseOut, Return(Int(1))],
-        [Txn.application_args[0] == Bytes("issue_diploma"), issue_diploma],
-        [Txn.application_args[0] == Bytes("revoke_diploma"), revoke_diploma],
-        [Txn.application_args[0] == Bytes("reassign_registrar"), reassign_registrar]
+        [Txn.on_completion() == OnComplete.UpdateApplication, Return(is_registrar)],
+        [Txn.on_completion() == OnComplete.DeleteApplication, Return(is_registrar)]
     )
 
     return program
 
 if __name__ == "__main__":
-    print(compileTeal(diploma_program(), Mode.Application, version=5))
+    print(compileTeal(diploma_program(), Mode.Application, version=8))
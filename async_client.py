@@ -0,0 +1,346 @@
+import asyncio
+import base64
+import copy
+import json
+import threading
+import time
+import weakref
+
+import algosdk.transaction
+from algosdk import account, encoding
+from algosdk.error import AlgodHTTPError
+
+from assets import diploma_methods as methods
+
+import common
+import confirmation
+import metrics
+import params_cache
+
+# The default maximum number of pooled connections to the node
+MAX_CONNECTIONS = 64
+
+# The node holds `status_after_block` requests open for up to a minute
+REQUEST_TIMEOUT = 90
+
+class _AsyncClientBase:
+    """The suggested params cache and confirmation follower shared by every async client.
+
+    Every operation running on a client shares one set of cached params and one
+    round follower, so hundreds of concurrent operations cost one
+    `status_after_block` wait and one block fetch per round.
+    """
+
+    def __init__(self, fee_policy=params_cache.DEFAULT_FEE_POLICY):
+        self.fee_policy = fee_policy
+
+        self._params = None
+        self._params_fetched_at = 0.0
+        self._pending = {}
+        self._reserved = 0
+        self._last_round = None
+        self._last_round_stale = True
+        self._pin_lock = asyncio.Lock()
+        self._follower = None
+
+    # Return a copy of the cached suggested params with the fee policy applied. The params are aged
+    # both by the wall clock and by the rounds the follower has seen, for nodes producing blocks faster
+    async def cached_params(self):
+        stale = time.monotonic() - self._params_fetched_at > params_cache.REFRESH_ROUNDS * params_cache.ROUND_TIME
+        if not stale and self._last_round is not None:
+            stale = self._last_round - self._params.first > params_cache.REFRESH_ROUNDS
+        if stale:
+            self._params = await self.suggested_params()
+            self._params_fetched_at = time.monotonic()
+
+        params = copy.copy(self._params)
+        self.fee_policy(params)
+        return params
+
+    # Send the `signed_txns` and wait for them to be confirmed. Returns the transaction info of the
+    # first transaction, which stands for the whole group since groups confirm atomically
+    async def send_and_confirm(self, signed_txns):
+        self._reserved += 1
+        try:
+            # Pin the round the follower starts from before sending, so that no block is missed.
+            # Only the first operation after the follower went idle needs to ask the node
+            async with self._pin_lock:
+                if self._last_round_stale:
+                    self._last_round = (await self.status()).get('last-round')
+                    self._last_round_stale = False
+
+            sent_round = self._last_round
+            with metrics.span("send"):
+                await self.send_transactions(signed_txns)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[signed_txns[0].get_txid()] = (future, signed_txns[0].transaction.last_valid_round)
+        finally:
+            self._reserved -= 1
+
+        if self._follower is None or self._follower.done():
+            self._follower = asyncio.create_task(self._follow_rounds())
+        with metrics.span("confirm"):
+            txinfo = await future
+        metrics.observe_rounds_waited(sent_round, txinfo)
+        return txinfo
+
+    # Background task that resolves the pending transactions from each new block
+    async def _follow_rounds(self):
+        try:
+            while self._pending:
+                status = await self.status_after_block(self._last_round)
+                for rnd in range(self._last_round + 1, status.get('last-round') + 1):
+                    block = confirmation.decode_block(await self.block_info(rnd, response_format='msgpack'))
+                    confirmation.resolve_block(self._pending, rnd, block)
+                    self._last_round = rnd
+        except Exception as e:
+            # Without a follower no pending transaction can be resolved, so fail them all
+            for future, _ in self._pending.values():
+                future.set_exception(e)
+            self._pending.clear()
+
+        # The scanned round goes stale while idle, unless an operation has already pinned it
+        if self._reserved == 0:
+            self._last_round_stale = True
+
+class AsyncAlgodClient(_AsyncClientBase):
+    """An asyncio algod client sending every request over a pool of keep-alive connections."""
+
+    def __init__(self, algod_token, algod_address, max_connections=MAX_CONNECTIONS, **kwargs):
+        super().__init__(**kwargs)
+
+        # Only the native client needs `aiohttp`
+        import aiohttp
+
+        self.algod_address = algod_address.rstrip('/')
+        self._session = aiohttp.ClientSession(
+            headers={'X-Algo-API-Token': algod_token},
+            connector=aiohttp.TCPConnector(limit=max_connections),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        )
+
+    async def _request(self, method, path, params=None, data=None, response_format='json'):
+        headers = {'Content-Type': 'application/x-binary'} if data is not None else None
+        started = time.perf_counter()
+        async with self._session.request(method, self.algod_address + '/v2' + path,
+                                         params=params, data=data, headers=headers) as resp:
+            body = await resp.read()
+            metrics.observe_node_request(method, path, time.perf_counter() - started, len(data) if data else 0,
+                                         len(body), resp.status >= 400)
+
+            if resp.status >= 400:
+                try:
+                    message = json.loads(body)['message']
+                except Exception:
+                    message = body.decode('utf-8', 'replace')
+                raise AlgodHTTPError(message, resp.status)
+
+            if response_format == 'json':
+                return json.loads(body)
+            return body
+
+    async def status(self):
+        return await self._request('GET', '/status')
+
+    async def status_after_block(self, block_num):
+        return await self._request('GET', '/status/wait-for-block-after/{}'.format(block_num))
+
+    async def suggested_params(self):
+        res = await self._request('GET', '/transactions/params')
+        return algosdk.transaction.SuggestedParams(
+            res['fee'], res['last-round'], res['last-round'] + 1000,
+            res['genesis-hash'], res['genesis-id'], False,
+            res['consensus-version'], res['min-fee'])
+
+    async def send_transactions(self, signed_txns):
+        data = b''.join(base64.b64decode(encoding.msgpack_encode(txn)) for txn in signed_txns)
+        return (await self._request('POST', '/transactions', data=data))['txId']
+
+    async def pending_transaction_info(self, txid):
+        return await self._request('GET', '/transactions/pending/{}'.format(txid))
+
+    async def block_info(self, block_num, response_format='json'):
+        return await self._request('GET', '/blocks/{}'.format(block_num),
+                                   params={'format': response_format}, response_format=response_format)
+
+    async def account_application_info(self, address, application_id):
+        return await self._request('GET', '/accounts/{}/applications/{}'.format(address, application_id))
+
+    async def application_info(self, application_id):
+        return await self._request('GET', '/applications/{}'.format(application_id))
+
+    async def application_box_by_name(self, application_id, box_name):
+        return await self._request('GET', '/applications/{}/box'.format(application_id),
+                                   params={'name': 'b64:' + base64.b64encode(box_name).decode()})
+
+    async def compile(self, source):
+        return await self._request('POST', '/teal/compile', data=source.encode('utf-8'))
+
+    async def close(self):
+        await self._session.close()
+
+class ThreadedAlgodClient(_AsyncClientBase):
+    """Exposes a synchronous `AlgodClient`, or any stand-in for one, through the async API.
+
+    Each request runs on a worker thread. The suggested params come from the shared
+    provider of the wrapped client, so the sync and async paths share one cache. A
+    refetch of the params runs on a worker thread too, so it never blocks the loop.
+    """
+
+    def __init__(self, client, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def _call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return _call
+
+    async def cached_params(self):
+        return await asyncio.to_thread(params_cache.suggested_params, self.client)
+
+# Helper function that signs `txn` and waits for it to be confirmed through `client`
+async def _sign_send_and_confirm(client, private_key, txn):
+    with metrics.span("sign"):
+        signed_txn = txn.sign(private_key)
+    return await client.send_and_confirm([signed_txn])
+
+# Create new application, returning its transaction info
+async def create_app(client, private_key,
+                     approval_program, clear_program,
+                     global_schema, local_schema):
+    sender = account.address_from_private_key(private_key)
+    on_complete = algosdk.transaction.OnComplete.NoOpOC.real
+    params = await client.cached_params()
+
+    txn = algosdk.transaction.ApplicationCreateTxn(
+        sender, params, on_complete,
+        approval_program, clear_program,
+        global_schema, local_schema)
+    return await _sign_send_and_confirm(client, private_key, txn)
+
+# Opt-in to application, returning its transaction info
+async def opt_in_app(client, private_key, index):
+    sender = account.address_from_private_key(private_key)
+    params = await client.cached_params()
+
+    txn = algosdk.transaction.ApplicationOptInTxn(sender, params, index)
+    return await _sign_send_and_confirm(client, private_key, txn)
+
+# Call application, returning its transaction info
+async def call_app(client, private_key, index, app_args, accounts, boxes=None):
+    sender = account.address_from_private_key(private_key)
+    params = await client.cached_params()
+
+    txn = algosdk.transaction.ApplicationNoOpTxn(sender, params, index, app_args, accounts, boxes=boxes)
+    return await _sign_send_and_confirm(client, private_key, txn)
+
+# Call application grouped with `budget_calls` calls that only pool their opcode budget with
+# it, returning the transaction info of the call
+async def call_app_with_budget(client, private_key, index, app_args, accounts, boxes=None, budget_calls=0):
+    sender = account.address_from_private_key(private_key)
+    params = await client.cached_params()
+
+    # The budget calls differ by their note only, so that each has a distinct txid
+    txns = [algosdk.transaction.ApplicationNoOpTxn(sender, params, index, app_args, accounts, boxes=boxes)]
+    txns += [algosdk.transaction.ApplicationNoOpTxn(sender, params, index, [methods.INCREASE_BUDGET],
+                                                    note=i.to_bytes(2, 'big'))
+             for i in range(budget_calls)]
+    if budget_calls:
+        algosdk.transaction.assign_group_id(txns)
+
+    with metrics.span("sign"):
+        signed_txns = [txn.sign(private_key) for txn in txns]
+    return await client.send_and_confirm(signed_txns)
+
+# Update existing application, returning its transaction info
+async def update_app(client, private_key, app_id, approval_program, clear_program):
+    sender = account.address_from_private_key(private_key)
+    params = await client.cached_params()
+
+    txn = algosdk.transaction.ApplicationUpdateTxn(sender, params, app_id,
+                                                   approval_program, clear_program)
+    return await _sign_send_and_confirm(client, private_key, txn)
+
+# Delete application, returning its transaction info
+async def delete_app(client, private_key, index):
+    sender = account.address_from_private_key(private_key)
+    params = await client.cached_params()
+
+    txn = algosdk.transaction.ApplicationDeleteTxn(sender, params, index)
+    return await _sign_send_and_confirm(client, private_key, txn)
+
+# Close out from application, returning its transaction info
+async def close_out_app(client, private_key, index):
+    sender = account.address_from_private_key(private_key)
+    params = await client.cached_params()
+
+    txn = algosdk.transaction.ApplicationCloseOutTxn(sender, params, index)
+    return await _sign_send_and_confirm(client, private_key, txn)
+
+# Clear application, returning its transaction info
+async def clear_app(client, private_key, index):
+    sender = account.address_from_private_key(private_key)
+    params = await client.cached_params()
+
+    txn = algosdk.transaction.ApplicationClearStateTxn(sender, params, index)
+    return await _sign_send_and_confirm(client, private_key, txn)
+
+# Pay `amount` microAlgos to `receiver`, returning its transaction info
+async def pay(client, private_key, receiver, amount):
+    sender = account.address_from_private_key(private_key)
+    params = await client.cached_params()
+
+    txn = algosdk.transaction.PaymentTxn(sender, params, receiver, amount)
+    return await _sign_send_and_confirm(client, private_key, txn)
+
+# Fetch the decoded local state of `addr` for `app_id` only, or `None` if it has not opted in
+async def get_local_state(client, addr, app_id):
+    try:
+        results = await client.account_application_info(addr, app_id)
+    except AlgodHTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+
+    if 'app-local-state' not in results:
+        return None
+    return common.decode_state(results['app-local-state'].get('key-value', []))
+
+# Fetch the decoded global state of `app_id` from the application itself
+async def get_global_state(client, app_id):
+    results = await client.application_info(app_id)
+    return common.decode_state(results['params'].get('global-state', []))
+
+# Fetch the decoded local states of every address in `addrs` for `app_id` with up to `limit`
+# requests in flight, returning a list of states in the order of `addrs`
+async def get_local_states(client, addrs, app_id, limit=common.INSPECT_WORKERS):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _get(addr):
+        async with semaphore:
+            return await get_local_state(client, addr, app_id)
+
+    return await asyncio.gather(*(_get(addr) for addr in addrs))
+
+# The idle threaded clients of `run_sync`, by the synchronous client they wrap
+_idle_clients = weakref.WeakKeyDictionary()
+_idle_clients_lock = threading.Lock()
+
+# Run an async operation on the synchronous `client` from synchronous code. The `ThreadedAlgodClient`
+# of one operation is reused by the next, while operations run concurrently from several threads
+# each get their own, since one can only serve a single event loop at a time
+def run_sync(client, operation, *args):
+    with _idle_clients_lock:
+        idle = _idle_clients.setdefault(client, [])
+        threaded = idle.pop() if idle else ThreadedAlgodClient(client)
+
+    # The lock pinning the followed round is bound to the event loop it was first awaited in
+    threaded._pin_lock = asyncio.Lock()
+    try:
+        return asyncio.run(operation(threaded, *args))
+    finally:
+        with _idle_clients_lock:
+            _idle_clients.setdefault(client, []).append(threaded)
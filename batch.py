@@ -0,0 +1,279 @@
+import base64
+import csv
+import json
+import itertools
+
+import algosdk.transaction
+from algosdk import account, encoding
+from algosdk.error import AlgodHTTPError
+
+from assets import diploma_events as events
+from assets import diploma_methods as methods
+
+import common
+import confirmation
+import diploma_codec
+import merkle
+import metrics
+import params_cache
+import signing
+
+# The maximum number of transactions the network accepts in one atomic group
+MAX_GROUP_SIZE = 16
+
+# The maximum number of accounts, and so diplomas, of one `issue_diplomas_batch` call
+ACCOUNTS_PER_CALL = 4
+
+# The maximum total size in bytes of the arguments of one application call
+MAX_ARGS_BYTES = 2048
+
+# The maximum total size in bytes of the logs of one application call
+MAX_LOG_BYTES = 1024
+
+# The default number of groups that are submitted before awaiting their confirmation
+GROUPS_PER_ROUND = 64
+
+# Helper generator that streams `(student, diploma)` rows from a diploma file, where each
+# `diploma` is encoded by `diploma_codec` once and carried as is into the calls issuing it.
+# Files ending in `.jsonl` hold one JSON object per line, anything else is read as
+# a CSV file with a `student,metadata,duration` header. Only one row is held in memory.
+def read_diploma_rows(path, resolve_student=None):
+    with open(path, 'r', newline='') as dfile:
+        if path.endswith('.jsonl'):
+            records = (json.loads(line) for line in dfile if line.strip())
+        else:
+            records = csv.DictReader(dfile)
+
+        for line_num, record in enumerate(records, start=1):
+            try:
+                student = record['student'].strip()
+                metadata = record['metadata']
+                duration = int(record['duration'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Malformed diploma row {} in {}: {}".format(line_num, path, record))
+
+            # Students may be referenced by their account name in the configuration file
+            if resolve_student is not None:
+                student = resolve_student(student)
+
+            if not encoding.is_valid_address(student):
+                raise ValueError("Invalid student address on row {} in {}: {}".format(line_num, path, student))
+
+            try:
+                diploma = diploma_codec.encode(metadata, duration)
+            except ValueError as e:
+                raise ValueError("Invalid diploma on row {} in {}: {}".format(line_num, path, e))
+
+            yield student, diploma
+
+# Read every row of the diploma file at `path` as `read_diploma_rows` does without keeping any,
+# so that a malformed row, or a diploma too long to store, is reported before anything is
+# sent. Returns the number of rows
+def validate_diploma_file(path, resolve_student=None):
+    return sum(1 for _ in read_diploma_rows(path, resolve_student))
+
+# Helper generator that lazily splits an `iterable` into lists of at most `size` items
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+# Helper function that returns the application arguments of an `issue_diploma` call of the
+# encoded `diploma`, or of an `issue_diploma_box` call with `boxes` set
+def issue_diploma_args(diploma, boxes=False):
+    selector = methods.ISSUE_DIPLOMA_BOX if boxes else methods.ISSUE_DIPLOMA
+    return [selector, diploma]
+
+# Helper function that returns the application arguments of an `issue_diplomas_batch` call
+# issuing one diploma per row in `rows`, in the order of its accounts
+def issue_diplomas_batch_args(rows):
+    return [methods.ISSUE_DIPLOMAS_BATCH] + [diploma for (_, diploma) in rows]
+
+# Helper generator that packs the rows streamed from `rows` into the rows of `issue_diplomas_batch`
+# calls, each holding up to `ACCOUNTS_PER_CALL` rows whose arguments fit in `MAX_ARGS_BYTES`
+# and whose logged `ISSUED` events fit in `MAX_LOG_BYTES`
+def pack_issue_rows(rows):
+    call_rows, call_bytes, call_log_bytes = [], len(methods.ISSUE_DIPLOMAS_BATCH), 0
+    for row in rows:
+        row_bytes = len(row[1])
+        row_log_bytes = events.HEADER_SIZE + row_bytes
+        if call_rows and (len(call_rows) == ACCOUNTS_PER_CALL or call_bytes + row_bytes > MAX_ARGS_BYTES
+                          or call_log_bytes + row_log_bytes > MAX_LOG_BYTES):
+            yield call_rows
+            call_rows, call_bytes, call_log_bytes = [], len(methods.ISSUE_DIPLOMAS_BATCH), 0
+
+        call_rows.append(row)
+        call_bytes += row_bytes
+        call_log_bytes += row_log_bytes
+
+    if call_rows:
+        yield call_rows
+
+# Helper generator of the unsigned calls issuing a diploma for every row in `rows`. Up to
+# `ACCOUNTS_PER_CALL` diplomas are issued per `issue_diplomas_batch` call. With `boxes` set,
+# each diploma is stored in a box by its own call, which references the box it writes
+def issue_calls(sender, params, app_id, rows, boxes=False):
+    if boxes:
+        for (student, diploma) in rows:
+            yield algosdk.transaction.ApplicationNoOpTxn(
+                sender, params, app_id, issue_diploma_args(diploma, boxes), [student],
+                boxes=[common.diploma_box(student)])
+        return
+
+    for call_rows in pack_issue_rows(rows):
+        yield algosdk.transaction.ApplicationNoOpTxn(
+            sender, params, app_id, issue_diplomas_batch_args(call_rows), [student for (student, _) in call_rows])
+
+# Helper generator of the unsigned `revoke_diplomas_batch` calls revoking the diploma of every
+# `(student, claimed_root)` row in `rows`, up to `ACCOUNTS_PER_CALL` per call. A diploma claimed
+# from a cohort is revoked from it too, so each call references the revocation box of every
+# `claimed_root` that is not `None`
+def revoke_calls(sender, params, app_id, rows):
+    for call_rows in chunked(rows, ACCOUNTS_PER_CALL):
+        yield algosdk.transaction.ApplicationNoOpTxn(
+            sender, params, app_id, [methods.REVOKE_DIPLOMAS_BATCH], [student for (student, _) in call_rows],
+            boxes=[merkle.revocation_box(student, root) for (student, root) in call_rows if root is not None])
+
+# Helper generator that pairs every student address streamed from `students` with the root of the
+# cohort its diploma in `app_id` was claimed from, or `None`, as the rows of `revoke_calls`
+def claimed_rows(client, app_id, students):
+    for student, state in common.get_local_states(client, students, app_id):
+        yield student, (state or {}).get('claimed')
+
+# Helper generator that packs the unsigned `calls` into atomic groups of up to `MAX_GROUP_SIZE`
+def group_calls(calls):
+    for txns in chunked(calls, MAX_GROUP_SIZE):
+        # A single transaction does not need a group ID
+        if len(txns) > 1:
+            algosdk.transaction.assign_group_id(txns)
+        yield txns
+
+# Helper function that returns the number of diplomas covered by a group of calls
+def count_diplomas(txns):
+    return sum(len(txn.accounts) for txn in txns)
+
+# Helper function that signs every group of transactions in `groups`, in the `signing_pool` if
+# there is one. Returns the list of signed msgpack blobs of each group, in order
+def sign_groups(groups, private_key, signing_pool=None):
+    with metrics.span("sign", groups=len(groups)):
+        if signing_pool is not None:
+            return list(signing_pool.sign(groups))
+        return [[signing.sign_encoded(txn, private_key) for txn in txns] for txns in groups]
+
+# Helper generator that builds the calls of `items_per_round` of the `items` at a time with
+# `build_calls`, packs them into atomic groups and signs the groups of each such window, in
+# the `signing_pool` if there is one. Yields each window as a list of `(txns, signed_blobs)`
+# pairs, where `get_params` returns the suggested params to build the window with
+def _signed_windows(get_params, private_key, items, build_calls, items_per_round, signing_pool):
+    sender = account.address_from_private_key(private_key)
+
+    for window in chunked(items, items_per_round):
+        params = get_params()
+        groups = list(group_calls(build_calls(sender, params, window)))
+
+        yield list(zip(groups, sign_groups(groups, private_key, signing_pool)))
+
+# Helper generator yielding the signed windows of groups issuing a diploma for every row
+# streamed from `rows`, as described by `_signed_windows`
+def signed_issue_windows(get_params, private_key, app_id, rows, groups_per_round=GROUPS_PER_ROUND,
+                         signing_pool=None, boxes=False):
+    rows_per_call = 1 if boxes else ACCOUNTS_PER_CALL
+    return _signed_windows(get_params, private_key, rows,
+                           lambda sender, params, window: issue_calls(sender, params, app_id, window, boxes),
+                           groups_per_round * MAX_GROUP_SIZE * rows_per_call, signing_pool)
+
+# Helper generator yielding the signed windows of groups revoking the diploma of every
+# `(student, claimed_root)` row streamed from `rows`, as described by `_signed_windows`
+def signed_revoke_windows(get_params, private_key, app_id, rows, groups_per_round=GROUPS_PER_ROUND,
+                          signing_pool=None):
+    return _signed_windows(get_params, private_key, rows,
+                           lambda sender, params, window: revoke_calls(sender, params, app_id, window),
+                           groups_per_round * MAX_GROUP_SIZE * ACCOUNTS_PER_CALL, signing_pool)
+
+# Helper function that submits every window of signed groups streamed from `windows`, keeping
+# at most one window in flight while the next one is being built. Returns the number of
+# diplomas covered by the confirmed and by the failed groups. If building a window raises,
+# the groups already sent are still awaited and the totals printed before the error is raised
+def _submit_windows(client, windows, groups_per_round, action):
+    tracker = confirmation.ConfirmationTracker(client)
+    counts = {'done': 0, 'failed': 0, 'sent': 0}
+
+    # Tally a group of `num_diplomas` diplomas sent in `sent_round` once its confirmation is resolved
+    def tally(num_diplomas, sent_round):
+        def _callback(future):
+            if future.exception() is None:
+                counts['done'] += num_diplomas
+                metrics.observe_rounds_waited(sent_round, future.result())
+            else:
+                print(future.exception())
+                counts['failed'] += num_diplomas
+        return _callback
+
+    try:
+        for window in windows:
+            # Send every group of this window. A group confirms atomically,
+            # so its first transaction is tracked for all of it
+            with metrics.span("send", groups=len(window)):
+                for txns, signed_blobs in window:
+                    counts['sent'] += count_diplomas(txns)
+                    try:
+                        client.send_raw_transaction(base64.b64encode(b''.join(signed_blobs)))
+                    except AlgodHTTPError as e:
+                        print("Group of {} diplomas rejected: {}".format(count_diplomas(txns), e))
+                        counts['failed'] += count_diplomas(txns)
+                        continue
+
+                    tracker.track(txns[0].get_txid(), txns[0].last_valid_round).add_done_callback(
+                        tally(count_diplomas(txns), tracker.last_round))
+
+            # Keep at most one window in flight while the next one is being built
+            with metrics.span("confirm"):
+                while len(tracker) > groups_per_round:
+                    tracker.poll()
+            print("Sent {} diplomas, {} {} so far".format(counts['sent'], counts['done'], action.lower()))
+    except Exception:
+        # Settle what already went out, so that the operator knows what is on chain
+        with metrics.span("confirm"):
+            tracker.wait()
+        print("Stopped after {} {} diplomas, {} failed".format(action, counts['done'], counts['failed']))
+        raise
+
+    with metrics.span("confirm"):
+        tracker.wait()
+    return counts['done'], counts['failed']
+
+# Issue a diploma for every row streamed from `rows`. The rows are packed into calls of up to
+# `ACCOUNTS_PER_CALL` diplomas, the calls into atomic groups of up to `MAX_GROUP_SIZE` and
+# windows of `groups_per_round` groups are signed and submitted while the previous window is
+# being confirmed. With `sign_workers` the groups are signed across that many processes. With
+# `boxes` each diploma is stored in a box by its own call, so the students need not opt in.
+# Returns the number of issued and failed diplomas.
+def issue_diplomas_batch(client, private_key, app_id, rows, groups_per_round=GROUPS_PER_ROUND, sign_workers=None,
+                         boxes=False):
+    print("Batch issuing diplomas from account: ", account.address_from_private_key(private_key))
+
+    signing_pool = signing.SigningPool([private_key], sign_workers) if sign_workers else None
+
+    try:
+        # Get the shared suggested parameters once for every window
+        windows = signed_issue_windows(lambda: params_cache.suggested_params(client),
+                                       private_key, app_id, rows, groups_per_round, signing_pool, boxes)
+        return _submit_windows(client, windows, groups_per_round, "Issued")
+    finally:
+        if signing_pool is not None:
+            signing_pool.close()
+
+# Revoke the diploma of every student address streamed from `students`, packed into calls
+# and groups as in `issue_diplomas_batch`. The local state of every student is read first, so
+# that a diploma claimed from a cohort is revoked from it too. Returns the number of revoked and
+# failed diplomas.
+def revoke_diplomas_batch(client, private_key, app_id, students, groups_per_round=GROUPS_PER_ROUND):
+    print("Batch revoking diplomas from account: ", account.address_from_private_key(private_key))
+
+    # Get the shared suggested parameters once for every window
+    windows = signed_revoke_windows(lambda: params_cache.suggested_params(client),
+                                    private_key, app_id, claimed_rows(client, app_id, students), groups_per_round)
+    return _submit_windows(client, windows, groups_per_round, "Revoked")
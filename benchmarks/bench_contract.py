@@ -0,0 +1,231 @@
+# Benchmark the opcode cost, program size and state writes of every branch of `diploma_program`.
+# Each call is simulated against the node with empty signatures, so only the calls that set up
+# the state of the next ones are actually sent. They are sent by the registrar, which is the
+# only funded account needed: it also stands in for every student. A throwaway app is deployed
+# and deleted again, and the results are compared against the baseline stored for the node. The
+# node may be the sandbox or `fake_algod.py`, which simulates groups too. Their assemblers differ,
+# so one baseline is kept per node, by its genesis ID, along with the build of its algod.
+#
+# Usage: python3 benchmarks/bench_contract.py [update]
+import importlib.metadata
+import json
+import os
+import sys
+
+import algosdk.transaction
+from algosdk import account, logic
+from algosdk.v2client.models import SimulateRequest, SimulateRequestTransactionGroup, SimulateTraceConfig
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from assets import diploma_methods as methods
+
+import async_client
+import batch
+import build_cache
+import common
+import diploma_codec
+import merkle
+import run_diploma
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contract_baseline.json")
+
+# The metrics compared against the baseline, where any increase is a regression
+METRICS = ["cost", "state-writes"]
+
+DIPLOMA_METADATA = "Diploma :: MIT :: BSc :: Computer Science and Engineering :: 2020"
+
+# The number of diplomas of the cohort whose proof is verified
+COHORT_SIZE = 50_000
+
+# Simulate the unsigned `txns` as one group, returning the opcode cost and the number of
+# state writes and deletes of the whole group
+def simulate(client, txns):
+    if len(txns) > 1:
+        algosdk.transaction.assign_group_id(txns)
+
+    request = SimulateRequest(
+        txn_groups=[SimulateRequestTransactionGroup(
+            txns=[algosdk.transaction.SignedTransaction(txn, None) for txn in txns])],
+        allow_empty_signatures=True,
+        exec_trace_config=SimulateTraceConfig(enable=True, state_change=True),
+    )
+    group = client.simulate_transactions(request)['txn-groups'][0]
+    if group.get('failure-message'):
+        raise RuntimeError(group['failure-message'])
+
+    units = []
+    for result in group['txn-results']:
+        trace = result.get('exec-trace', {})
+        units += trace.get('approval-program-trace', []) + trace.get('clear-state-program-trace', [])
+
+    return {
+        'cost': group.get('app-budget-consumed', 0),
+        'state-writes': sum(len(unit.get('state-changes', [])) for unit in units),
+    }
+
+# Measure every branch of the contract through `client` with the funded `private_key`. Returns the
+# bytecode size of each program and the simulated metrics of each branch, by name
+def measure_contract(client, private_key):
+    sender = account.address_from_private_key(private_key)
+    # The programs are assembled by the node measured, not taken from the build cache, which may hold
+    # the bytecode of another assembler
+    approval, clear = (common.compile_program(client, build_cache.teal_program(name).encode())
+                       for name in ("diploma_smart_contract", "clear_program"))
+
+    def params():
+        params = client.suggested_params()
+        params.flat_fee, params.fee = True, 1000
+        return params
+
+    NoOp = algosdk.transaction.OnComplete.NoOpOC.real
+    results = {'size': {'approval': len(approval), 'clear': len(clear)}, 'branches': {}}
+    branches = results['branches']
+
+    branches['create'] = simulate(client, [algosdk.transaction.ApplicationCreateTxn(
+        sender, params(), NoOp, approval, clear, run_diploma.global_schema, run_diploma.local_schema)])
+    app_id = async_client.run_sync(client, async_client.create_app, private_key, approval, clear,
+                                   run_diploma.global_schema, run_diploma.local_schema)['application-index']
+
+    # The calls below all refer to the registrar as their student
+    diploma = diploma_codec.encode(DIPLOMA_METADATA, 4)
+    rows = [(sender, diploma)] * batch.ACCOUNTS_PER_CALL
+    box = [common.diploma_box(sender)]
+
+    def call(app_args, accounts, boxes=None, budget_calls=0):
+        return [algosdk.transaction.ApplicationNoOpTxn(sender, params(), app_id, app_args, accounts, boxes=boxes)] + [
+            algosdk.transaction.ApplicationNoOpTxn(sender, params(), app_id, [methods.INCREASE_BUDGET], note=bytes([i]))
+            for i in range(budget_calls)]
+
+    opted_in = False
+    try:
+        branches['opt-in'] = simulate(client, [algosdk.transaction.ApplicationOptInTxn(sender, params(), app_id)])
+        async_client.run_sync(client, async_client.opt_in_app, private_key, app_id)
+        opted_in = True
+
+        branches['issue'] = simulate(client, call(batch.issue_diploma_args(diploma), [sender]))
+        branches['issue-batch'] = simulate(client, call(batch.issue_diplomas_batch_args(rows), [sender] * len(rows)))
+        branches['revoke'] = simulate(client, call([methods.REVOKE_DIPLOMA], [sender]))
+        branches['revoke-batch'] = simulate(client, call([methods.REVOKE_DIPLOMAS_BATCH], [sender] * len(rows)))
+
+        # The app account holds the minimum balance of the diploma box
+        async_client.run_sync(client, async_client.pay, private_key, logic.get_application_address(app_id),
+                              100_000 + common.diploma_box_min_balance(diploma))
+        box_args = batch.issue_diploma_args(diploma, boxes=True)
+        branches['issue-box'] = simulate(client, call(box_args, [sender], box))
+        async_client.run_sync(client, async_client.call_app, private_key, app_id, box_args, [sender], box)
+        branches['revoke-box'] = simulate(client, call([methods.REVOKE_DIPLOMA_BOX], [sender], box))
+        async_client.run_sync(client, async_client.call_app, private_key, app_id, [methods.REVOKE_DIPLOMA_BOX], [sender], box)
+
+        # A cohort whose every diploma is the registrar's, so that its proof is as deep as in a real one
+        tree = merkle.MerkleTree([merkle.leaf_hash(sender, diploma)] * COHORT_SIZE)
+        record = {'student': sender, 'diploma': diploma, 'root': tree.root, 'proof': tree.proof(0)}
+        cohort = [merkle.cohort_box(tree.root)]
+        proof_boxes = cohort + [merkle.revocation_box(sender, tree.root)]
+        async_client.run_sync(client, async_client.pay, private_key, logic.get_application_address(app_id),
+                              merkle.COHORT_MIN_BALANCE + merkle.REVOCATION_MIN_BALANCE)
+        branches['commit-cohort'] = simulate(client, call([methods.COMMIT_COHORT, tree.root], [], cohort))
+        async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                              [methods.COMMIT_COHORT, tree.root], [], cohort)
+        budget_calls = merkle.budget_calls(len(record['proof']))
+        branches['verify-proof'] = simulate(client, call(merkle.proof_args(record), [sender], proof_boxes,
+                                                         budget_calls))
+        branches['claim'] = simulate(client, call(merkle.proof_args(record, claim=True), [sender], proof_boxes,
+                                                  budget_calls))
+        branches['revoke-from-cohort'] = simulate(client, call([methods.REVOKE_DIPLOMA, tree.root], [sender],
+                                                               proof_boxes))
+        async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                              [methods.REVOKE_DIPLOMA, tree.root], [sender], proof_boxes)
+        branches['reinstate'] = simulate(client, call([methods.REINSTATE_DIPLOMA, tree.root], [sender], proof_boxes))
+        async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                              [methods.REINSTATE_DIPLOMA, tree.root], [sender], proof_boxes)
+        branches['revoke-cohort'] = simulate(client, call([methods.REVOKE_COHORT, tree.root], [], cohort))
+
+        branches['reassign'] = simulate(client, call([methods.REASSIGN_REGISTRAR], [sender]))
+        branches['update'] = simulate(client, [algosdk.transaction.ApplicationUpdateTxn(
+            sender, params(), app_id, approval, clear)])
+        branches['close-out'] = simulate(client, [algosdk.transaction.ApplicationCloseOutTxn(sender, params(), app_id)])
+        branches['clear'] = simulate(client, [algosdk.transaction.ApplicationClearStateTxn(sender, params(), app_id)])
+        branches['delete'] = simulate(client, [algosdk.transaction.ApplicationDeleteTxn(sender, params(), app_id)])
+    finally:
+        # Clean up the throwaway app. The funds of its account are left behind
+        if opted_in:
+            async_client.run_sync(client, async_client.close_out_app, private_key, app_id)
+        async_client.run_sync(client, async_client.delete_app, private_key, app_id)
+
+    return results
+
+# Compare the `results` against the `baseline`, printing a report. Returns whether any metric regressed
+def compare(results, baseline):
+    regressed = False
+
+    def row(name, metric, value, base):
+        nonlocal regressed
+        if base is None:
+            status = "new"
+        elif value > base:
+            status = "REGRESSION"
+            regressed = True
+        elif value < base:
+            status = "improved"
+        else:
+            status = ""
+        print("{:<18} {:<14} {:>8} {:>10} {}".format(name, metric, value, "-" if base is None else base, status))
+
+    print("{:<18} {:<14} {:>8} {:>10}".format("branch", "metric", "value", "baseline"))
+    for name, size in results['size'].items():
+        row(name, "bytes", size, baseline.get('size', {}).get(name))
+    for name, metrics in results['branches'].items():
+        for metric in METRICS:
+            row(name, metric, metrics[metric], baseline.get('branches', {}).get(name, {}).get(metric))
+
+    return regressed
+
+# Return the genesis ID of the node behind `client`, which names its baseline, and the build of
+# its algod, whose assembler decides the size and cost of the programs
+def node_identity(client):
+    versions = client.versions()
+    build = versions.get('build', {})
+    return versions['genesis_id'], "{}.{}.{}-{}".format(
+        build.get('major'), build.get('minor'), build.get('build_number'), build.get('channel'))
+
+def main():
+    if len(sys.argv) > 2 or (len(sys.argv) == 2 and sys.argv[1] != "update"):
+        print("Usage: python3 benchmarks/bench_contract.py [update]")
+        sys.exit(2)
+
+    session = run_diploma.Session()
+    node, algod_build = node_identity(session.client)
+    results = measure_contract(session.client, session.priv_keys[session.registrar])
+    results['versions'] = {'pyteal': importlib.metadata.version("pyteal"), 'teal': build_cache.TEAL_VERSION,
+                           'algod': algod_build}
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r") as bfile:
+            baselines = json.load(bfile)
+
+    # A baseline of another assembler is not comparable, so it only fails against the same one
+    baseline = baselines.get(node, {})
+    comparable = baseline.get('versions', {}).get('algod') == algod_build
+    if not baseline:
+        print("No baseline recorded for node {}".format(node))
+    elif baseline.get('versions') != results['versions']:
+        print("Baseline of node {} recorded with {}, now {}".format(node, baseline.get('versions'),
+                                                                    results['versions']))
+
+    regressed = compare(results, baseline)
+
+    if len(sys.argv) == 2:
+        baselines[node] = results
+        with open(BASELINE_FILE, "w") as bfile:
+            json.dump(baselines, bfile, indent=2, sort_keys=True)
+        print("Recorded the baseline of node {} in {}".format(node, BASELINE_FILE))
+    elif regressed and comparable:
+        sys.exit(1)
+    elif regressed:
+        print("Not failing, since node {} assembled the baseline with algod {}. Record it again with update".format(
+            node, baseline.get('versions', {}).get('algod')))
+
+if __name__ == '__main__':
+    main()
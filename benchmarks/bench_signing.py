@@ -0,0 +1,64 @@
+# Benchmark the throughput of signing `issue_diplomas_batch` groups on one core and across a pool of
+# worker processes. No node is needed since the transactions are only signed, never sent. The
+# "cold" row signs one batch with a new pool as a batch command does, counting the start up of
+# its workers, unless the batch is below `signing.MIN_POOL_TXNS` and is signed in process.
+#
+# Usage: python3 benchmarks/bench_signing.py [num-txns] [max-workers]
+import os
+import sys
+import time
+
+import algosdk.transaction
+from algosdk import account
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import batch
+import diploma_codec
+import signing
+
+GENESIS_HASH = "SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI="
+
+# Build `num_txns` unsigned `issue_diplomas_batch` calls packed into groups
+def build_groups(sender, num_txns):
+    params = algosdk.transaction.SuggestedParams(1000, 1, 1001, GENESIS_HASH, "bench", True)
+    student = account.generate_account()[1]
+    rows = ((student, diploma_codec.encode("Diploma {} :: MIT :: BSc :: 2020".format(i), 4))
+            for i in range(num_txns * batch.ACCOUNTS_PER_CALL))
+    return list(batch.group_calls(batch.issue_calls(sender, params, 1, rows)))
+
+def main():
+    num_txns = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    private_key, sender = account.generate_account()
+    groups = build_groups(sender, num_txns)
+
+    # Sign every transaction on the main thread, as the batch command does without workers
+    start = time.perf_counter()
+    for txns in groups:
+        [signing.sign_encoded(txn, private_key) for txn in txns]
+    single_rate = num_txns / (time.perf_counter() - start)
+    print("{:>8} {:>12.0f} txns/s {:>6.2f}x".format("main", single_rate, 1.0))
+
+    workers = 1
+    while workers <= max_workers:
+        with signing.SigningPool([private_key], workers, min_txns=0) as pool:
+            # Warm up the workers so that process start up is not measured
+            list(pool.sign(groups[:workers]))
+
+            start = time.perf_counter()
+            list(pool.sign(groups))
+            rate = num_txns / (time.perf_counter() - start)
+
+        print("{:>8} {:>12.0f} txns/s {:>6.2f}x".format("{} proc".format(workers), rate, rate / single_rate))
+        workers *= 2
+
+    start = time.perf_counter()
+    with signing.SigningPool([private_key], max_workers) as pool:
+        list(pool.sign(groups))
+    rate = num_txns / (time.perf_counter() - start)
+    print("{:>8} {:>12.0f} txns/s {:>6.2f}x".format("cold", rate, rate / single_rate))
+
+if __name__ == '__main__':
+    main()
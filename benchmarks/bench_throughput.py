@@ -0,0 +1,248 @@
+# Benchmark the end-to-end throughput and latency of issuing diplomas against the node. A throwaway
+# app is deployed by the registrar and the diplomas of freshly generated students are issued in
+# atomic groups of `batch-size` diplomas, with up to `concurrency` groups in flight at once. Every
+# combination of the comma separated concurrencies and batch sizes is run over the same students.
+# Each run reports its throughput, the submit-to-confirm latency percentiles of its groups and the
+# node calls and client CPU time per diploma. The results are appended as one JSON line to
+# `benchmarks/throughput_results.jsonl`, so that runs can be compared over time. With `box` the
+# diplomas are stored in boxes, one call per diploma, so the students need not opt in.
+#
+# Usage: python3 benchmarks/bench_throughput.py [num-diplomas] [concurrency,...] [batch-size,...] [box]
+import asyncio
+import datetime
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+import algosdk.transaction
+from algosdk import account, logic
+from algosdk.error import AlgodHTTPError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import async_client
+import batch
+import build_cache
+import common
+import confirmation
+import diploma_codec
+import run_diploma
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "throughput_results.jsonl")
+
+# The microAlgos each student is funded with: the minimum balance of an account opted in
+# to the app, plus the fees of its opt-in, close-out and the return of its funds
+STUDENT_FUNDS = 300_000
+
+# The percentiles of the submit-to-confirm latency reported by every run
+PERCENTILES = [50, 95, 99]
+
+class CountingAlgodClient(async_client.AsyncAlgodClient):
+    """An async algod client counting every request it sends to the node."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = 0
+
+    async def _request(self, *args, **kwargs):
+        self.requests += 1
+        return await super()._request(*args, **kwargs)
+
+# Helper function that returns the metadata of the diploma `index` issued by run `run`. Every
+# run issues distinct metadata so that none of its transactions repeats an earlier one
+def diploma_metadata(run, index):
+    return "Diploma {} run {} :: MIT :: BSc :: Computer Science and Engineering :: 2020".format(index, run)
+
+# Helper function that returns the `p`th percentile of the sorted `values` by nearest rank
+def percentile(values, p):
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+# Helper function that signs every transaction of `txns` with the key of its sender in
+# `private_keys`, grouping them first if there are many
+def sign_group(txns, private_keys):
+    if len(txns) > 1:
+        algosdk.transaction.assign_group_id(txns)
+    return [txn.sign(private_keys[txn.sender]) for txn in txns]
+
+# Send the unsigned transactions of `txns` in atomic groups, all concurrently
+async def send_groups(client, txns, private_keys):
+    await asyncio.gather(*(client.send_and_confirm(sign_group(group, private_keys))
+                           for group in batch.chunked(txns, batch.MAX_GROUP_SIZE)))
+
+# Deploy a throwaway app of the compiled `programs` and prepare the `students` for it, returning its
+# app ID. Without `boxes` the students are funded and opted in, otherwise the app account is funded
+# for their boxes
+async def set_up(client, private_key, programs, students, max_metadata, boxes):
+    sender = account.address_from_private_key(private_key)
+    approval, clear = programs
+    app_id = (await async_client.create_app(client, private_key, approval, clear, run_diploma.global_schema,
+                                            run_diploma.local_schema))['application-index']
+
+    params = await client.cached_params()
+    private_keys = dict(students, **{sender: private_key})
+    if boxes:
+        await async_client.pay(client, private_key, logic.get_application_address(app_id),
+                               100_000 + len(students) * common.diploma_box_min_balance(
+                                   diploma_codec.encode(max_metadata, 4)))
+    else:
+        await send_groups(client, [algosdk.transaction.PaymentTxn(sender, params, student, STUDENT_FUNDS)
+                                   for student, _ in students], private_keys)
+        await send_groups(client, [algosdk.transaction.ApplicationOptInTxn(student, params, app_id)
+                                   for student, _ in students], private_keys)
+
+    return app_id
+
+# Close out the `students` and return their funds to the registrar, then delete the throwaway
+# app. The funds of the app account are left behind
+async def tear_down(client, private_key, app_id, students, boxes):
+    sender = account.address_from_private_key(private_key)
+    if not boxes:
+        params = await client.cached_params()
+        private_keys = dict(students)
+        txns = []
+        for student, _ in students:
+            txns += [algosdk.transaction.ApplicationCloseOutTxn(student, params, app_id),
+                     algosdk.transaction.PaymentTxn(student, params, sender, 0, close_remainder_to=sender)]
+        await send_groups(client, txns, private_keys)
+
+    await async_client.delete_app(client, private_key, app_id)
+
+# Issue the diploma of every student in `students` through `client`, in groups of `batch_size`
+# diplomas with up to `concurrency` groups in flight. Returns the metrics of the run
+async def run_issuance(client, private_key, app_id, students, run, concurrency, batch_size, boxes):
+    sender = account.address_from_private_key(private_key)
+    rows = [(student, diploma_codec.encode(diploma_metadata(run, i), 4)) for i, student in enumerate(students)]
+    groups = batch.chunked(rows, batch_size)
+    latencies = []
+    counts = {'issued': 0, 'failed': 0}
+
+    # Every worker keeps one group in flight, taking the next one from the shared `groups`
+    async def worker():
+        for group_rows in groups:
+            params = await client.cached_params()
+            txns = list(batch.issue_calls(sender, params, app_id, group_rows, boxes))
+            signed_txns = sign_group(txns, {sender: private_key})
+
+            submitted = time.perf_counter()
+            try:
+                await client.send_and_confirm(signed_txns)
+            except (AlgodHTTPError, confirmation.TransactionExpiredError) as e:
+                print("Group of {} diplomas failed: {}".format(len(group_rows), e))
+                counts['failed'] += len(group_rows)
+                continue
+            latencies.append(time.perf_counter() - submitted)
+            counts['issued'] += len(group_rows)
+
+    requests = client.requests
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    cpu_time = time.process_time() - cpu_start
+
+    latencies.sort()
+    num_diplomas = len(rows)
+    metrics = {
+        'concurrency': concurrency,
+        'batch-size': batch_size,
+        'issued': counts['issued'],
+        'failed': counts['failed'],
+        'seconds': elapsed,
+        'diplomas-per-second': counts['issued'] / elapsed,
+        'node-calls-per-diploma': (client.requests - requests) / num_diplomas,
+        'cpu-ms-per-diploma': 1000 * cpu_time / num_diplomas,
+    }
+    for p in PERCENTILES:
+        metrics['latency-p{}'.format(p)] = percentile(latencies, p)
+    return metrics
+
+# Run the issuance of `num_diplomas` diplomas at every combination of `concurrencies` and
+# `batch_sizes` against a throwaway app of the compiled `programs`, returning the metrics of every run
+async def measure_throughput(private_key, programs, num_diplomas, concurrencies, batch_sizes, boxes):
+    client = CountingAlgodClient(run_diploma.algod_token, run_diploma.algod_address)
+    students = [account.generate_account()[::-1] for _ in range(num_diplomas)]
+    max_metadata = diploma_metadata(len(concurrencies) * len(batch_sizes), num_diplomas)
+
+    try:
+        print("Setting up {} students".format(num_diplomas))
+        app_id = await set_up(client, private_key, programs, students, max_metadata, boxes)
+        try:
+            results = []
+            for concurrency in concurrencies:
+                for batch_size in batch_sizes:
+                    metrics = await run_issuance(client, private_key, app_id, [student for student, _ in students],
+                                                 len(results), concurrency, batch_size, boxes)
+                    print_metrics(metrics)
+                    results.append(metrics)
+            return results
+        finally:
+            await tear_down(client, private_key, app_id, students, boxes)
+    finally:
+        await client.close()
+
+# Helper function that prints the metrics of a run as a row of the report
+def print_metrics(metrics):
+    latencies = ["-" if metrics[key] is None else "{:.2f}".format(metrics[key])
+                 for key in ('latency-p50', 'latency-p95', 'latency-p99')]
+    print("{:>11} {:>10} {:>10.1f} {:>8} {:>8} {:>8} {:>11.3f} {:>9.3f}".format(
+        metrics['concurrency'], metrics['batch-size'], metrics['diplomas-per-second'], *latencies,
+        metrics['node-calls-per-diploma'], metrics['cpu-ms-per-diploma']))
+
+# Helper function that returns the git revision being benchmarked, if any
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Helper function that parses a comma separated list of positive integers
+def parse_counts(arg):
+    counts = [int(count) for count in arg.split(",")]
+    if any(count < 1 for count in counts):
+        raise ValueError("Counts must be positive: {}".format(arg))
+    return counts
+
+def main():
+    args = sys.argv[1:]
+    boxes = bool(args) and args[-1] == "box"
+    if boxes:
+        args = args[:-1]
+    if len(args) > 3:
+        print("Usage: python3 benchmarks/bench_throughput.py [num-diplomas] [concurrency,...] [batch-size,...] [box]")
+        sys.exit(2)
+
+    num_diplomas = int(args[0]) if len(args) > 0 else 1024
+    concurrencies = parse_counts(args[1]) if len(args) > 1 else [1, 8, 64]
+    batch_sizes = parse_counts(args[2]) if len(args) > 2 else [1, 4, 64]
+
+    # A group holds up to `MAX_GROUP_SIZE` calls, of one diploma each with boxes
+    max_batch_size = batch.MAX_GROUP_SIZE * (1 if boxes else batch.ACCOUNTS_PER_CALL)
+    if max(batch_sizes) > max_batch_size:
+        raise ValueError("A group holds at most {} diplomas".format(max_batch_size))
+
+    session = run_diploma.Session()
+    programs = (build_cache.compiled_program(session.client, "diploma_smart_contract"),
+                build_cache.compiled_program(session.client, "clear_program"))
+    print("{:>11} {:>10} {:>10} {:>8} {:>8} {:>8} {:>11} {:>9}".format(
+        "concurrency", "batch-size", "diplomas/s", "p50 s", "p95 s", "p99 s", "calls/dipl", "cpu ms"))
+    runs = asyncio.run(measure_throughput(session.priv_keys[session.registrar], programs, num_diplomas,
+                                          concurrencies, batch_sizes, boxes))
+
+    with open(RESULTS_FILE, "a") as rfile:
+        rfile.write(json.dumps({
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'storage': 'box' if boxes else 'local',
+            'diplomas': num_diplomas,
+            'runs': runs,
+        }) + "\n")
+    print("Appended the results to {}".format(RESULTS_FILE))
+
+if __name__ == '__main__':
+    main()
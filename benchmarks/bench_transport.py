@@ -0,0 +1,85 @@
+# Benchmark the per-request latency to the node of the stock `AlgodClient`, which opens a new
+# connection for every request, against the `PooledAlgodClient` reusing kept-alive connections,
+# with and without compressed responses. Each client sends the requests every transaction makes,
+# `status` and `suggested_params`, one at a time and then from `threads` threads at once, as well
+# as the latest block. No account is needed since nothing is sent. Point `node_config.py` at a
+# remote node to see the saving of the handshakes, which is small against a local node.
+#
+# Usage: python3 benchmarks/bench_transport.py [num-requests] [threads]
+import math
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from algosdk.v2client import algod
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import node_config
+import transport
+
+# Helper function that returns the `p`th percentile of the sorted `values` by nearest rank
+def percentile(values, p):
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+# The requests timed by the benchmark, by name
+REQUESTS = {
+    'status': lambda client, last_round: client.status(),
+    'params': lambda client, last_round: client.suggested_params(),
+    'block': lambda client, last_round: client.block_info(last_round, response_format='msgpack'),
+}
+
+# Send `num_requests` of the request `name` one at a time, returning their sorted latencies in seconds
+def time_sequential(client, name, num_requests, last_round):
+    request = REQUESTS[name]
+    latencies = []
+    for _ in range(num_requests):
+        start = time.perf_counter()
+        request(client, last_round)
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+# Send `num_requests` status requests from `threads` threads at once, returning the requests per second
+def time_concurrent(client, num_requests, threads):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start = time.perf_counter()
+        list(executor.map(lambda _: client.status(), range(num_requests)))
+        return num_requests / (time.perf_counter() - start)
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    clients = [
+        ("new-conn", algod.AlgodClient(node_config.algod_token, node_config.algod_address)),
+        ("pooled", transport.PooledAlgodClient(node_config.algod_token, node_config.algod_address,
+                                               max_connections=threads)),
+        ("pooled-gzip", transport.PooledAlgodClient(node_config.algod_token, node_config.algod_address,
+                                                    max_connections=threads, compress=True)),
+    ]
+    last_round = clients[0][1].status()['last-round']
+
+    print("{:>12} {:>7} {:>9} {:>9} {:>9} {:>8}".format("client", "request", "mean ms", "p50 ms", "p99 ms",
+                                                         "saving"))
+    baseline = {}
+    for client_name, client in clients:
+        # Warm up, so that the pool holds its connections
+        time_sequential(client, 'status', threads, last_round)
+
+        for name in REQUESTS:
+            latencies = time_sequential(client, name, num_requests, last_round)
+            mean = statistics.mean(latencies)
+            baseline.setdefault(name, mean)
+            print("{:>12} {:>7} {:>9.3f} {:>9.3f} {:>9.3f} {:>7.0f}%".format(
+                client_name, name, 1000 * mean, 1000 * percentile(latencies, 50),
+                1000 * percentile(latencies, 99), 100 * (1 - mean / baseline[name])))
+
+    print()
+    print("{:>12} {:>14}".format("client", "status req/s"))
+    for client_name, client in clients:
+        print("{:>12} {:>14.0f}".format(client_name, time_concurrent(client, num_requests, threads)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import base64
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import sys
+
+from algosdk import logic
+
+import metrics
+
+ASSETS_DIR = "./assets"
+ARTIFACTS_DIR = "./artifacts"
+CACHE_DIR = "./.build_cache"
+
+# The TEAL version all of the programs are compiled with. Boxes need at least version 8
+TEAL_VERSION = 8
+
+# The programs of this DApp, by name, mapped to the function in `ASSETS_DIR` that builds them
+PROGRAMS = {
+    "diploma_smart_contract": "diploma_program",
+    "clear_program": "clear_program",
+}
+
+# The assembled programs already loaded by this process, by cache key
+_compiled = {}
+
+# Helper function that computes the cache key of a program. The key covers every PyTEAL source
+# file in `ASSETS_DIR` since a program may import the others, along with the PyTEAL and TEAL
+# versions. The PyTEAL version is read from the package metadata, without importing PyTEAL
+def cache_key(name, teal_version=TEAL_VERSION):
+    digest = hashlib.sha256()
+    digest.update("{}:{}:{}".format(name, importlib.metadata.version("pyteal"), teal_version).encode())
+
+    for source_name in sorted(os.listdir(ASSETS_DIR)):
+        if source_name.endswith(".py"):
+            with open(os.path.join(ASSETS_DIR, source_name), "rb") as sfile:
+                digest.update(source_name.encode())
+                digest.update(hashlib.sha256(sfile.read()).digest())
+
+    return digest.hexdigest()
+
+def _entry_path(name, key):
+    return os.path.join(CACHE_DIR, "{}-{}.json".format(name, key))
+
+# Load the cache entry of a program, returning an empty entry on a cache miss
+def load_entry(name, key):
+    try:
+        with open(_entry_path(name, key), "r") as efile:
+            return json.load(efile)
+    except FileNotFoundError:
+        return {}
+
+# Store the cache entry of a program, replacing any previous entry atomically
+def store_entry(name, key, entry):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = _entry_path(name, key) + ".tmp"
+    with open(tmp_path, "w") as efile:
+        json.dump(entry, efile)
+    os.replace(tmp_path, _entry_path(name, key))
+
+# Generate the TEAL source of a program with PyTEAL. This is the only place PyTEAL is imported
+def generate_teal(name, teal_version=TEAL_VERSION):
+    from pyteal import compileTeal, Mode
+
+    # The PyTEAL sources import one another by module name
+    if ASSETS_DIR not in sys.path:
+        sys.path.insert(0, ASSETS_DIR)
+
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ASSETS_DIR, name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    program = getattr(module, PROGRAMS[name])()
+    return compileTeal(program, Mode.Application, version=teal_version)
+
+# Return the TEAL source of a program, generating it only when its sources changed
+def teal_program(name, teal_version=TEAL_VERSION):
+    key = cache_key(name, teal_version)
+    entry = load_entry(name, key)
+
+    if "teal" not in entry:
+        entry = {"teal": generate_teal(name, teal_version)}
+        store_entry(name, key, entry)
+
+    return entry["teal"]
+
+# Return the assembled bytecode of a program, only sending it to the node's `/compile`
+# endpoint when its sources changed
+def compiled_program(client, name, teal_version=TEAL_VERSION):
+    key = cache_key(name, teal_version)
+    if key in _compiled:
+        return _compiled[key]
+
+    entry = load_entry(name, key)
+    if "bytecode" not in entry:
+        teal = entry.get("teal") or generate_teal(name, teal_version)
+        with metrics.span("compile"):
+            compile_response = client.compile(teal)
+        entry = {
+            "teal": teal,
+            "teal-sha256": hashlib.sha256(teal.encode()).hexdigest(),
+            "bytecode": compile_response["result"],
+            "hash": compile_response["hash"],
+        }
+        store_entry(name, key, entry)
+
+    _compiled[key] = base64.b64decode(entry["bytecode"])
+    return _compiled[key]
+
+# Check offline that the cached bytecode of a program matches its current sources. The TEAL is
+# regenerated and compared against the TEAL the bytecode was assembled from, and the stored
+# program hash is recomputed from the bytecode. Returns a list of problems, empty if verified
+def verify_program(name, teal_version=TEAL_VERSION):
+    key = cache_key(name, teal_version)
+    entry = load_entry(name, key)
+
+    if "bytecode" not in entry:
+        return ["{}: no assembled bytecode is cached for the current sources".format(name)]
+
+    problems = []
+    teal = generate_teal(name, teal_version)
+    if hashlib.sha256(teal.encode()).hexdigest() != entry["teal-sha256"]:
+        problems.append("{}: the bytecode was not assembled from the current sources".format(name))
+    if logic.address(base64.b64decode(entry["bytecode"])) != entry["hash"]:
+        problems.append("{}: the bytecode does not match its program hash".format(name))
+
+    return problems
+
+def main():
+    help_msg = """Available commands:
+        build: Write the TEAL of every program to the artifacts directory
+        verify: Check that the cached bytecode matches the PyTEAL sources"""
+
+    if len(sys.argv) != 2:
+        print(help_msg)
+        return
+
+    if sys.argv[1] == "build":
+        for name in PROGRAMS:
+            with open(os.path.join(ARTIFACTS_DIR, name + ".teal"), "w") as tfile:
+                tfile.write(teal_program(name))
+
+    elif sys.argv[1] == "verify":
+        problems = [problem for name in PROGRAMS for problem in verify_program(name)]
+        for problem in problems:
+            print(problem)
+
+        if problems:
+            sys.exit(1)
+        print("All cached programs match their sources")
+
+    else:
+        print(help_msg)
+
+if __name__ == '__main__':
+    main()
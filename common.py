@@ -1,10 +1,25 @@
 import base64
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
-from algosdk import mnemonic
+from algosdk import account, encoding, mnemonic
+from algosdk.error import AlgodHTTPError
+
+import diploma_codec
+import metrics
+
+# The default number of concurrent requests when reading the state of many accounts
+INSPECT_WORKERS = 32
+
+# The application account holds the minimum balance of each of its boxes, which is
+# a flat amount plus an amount per byte of the box name and value, in microAlgos
+BOX_FLAT_MIN_BALANCE = 2500
+BOX_BYTE_MIN_BALANCE = 400
 
 # Helper function to compile program source
 def compile_program(client, source_code):
-    compile_response = client.compile(source_code.decode('utf-8'))
+    with metrics.span("compile"):
+        compile_response = client.compile(source_code.decode('utf-8'))
     return base64.b64decode(compile_response['result'])
 
 # Helper function that converts a mnemonic passphrase into a private signing key
@@ -14,59 +29,126 @@ def get_private_key_from_mnemonic(mn):
 
 # Helper function that converts a mnemonic passphrase into a public key
 def get_public_key_from_mnemonic(mn):
-    public_key = mnemonic.to_public_key(mn)
+    public_key = account.address_from_private_key(mnemonic.to_private_key(mn))
     return public_key
 
-# Helper function that waits for a given txid to be confirmed by the network
-def wait_for_confirmation(client, txid):
-    last_round = client.status().get('last-round')
-    txinfo = client.pending_transaction_info(txid)
-    while not (txinfo.get('confirmed-round') and txinfo.get('confirmed-round') > 0):
-        print("Waiting for confirmation...")
-        last_round += 1
-        client.status_after_block(last_round)
-        txinfo = client.pending_transaction_info(txid)
-    print("Transaction {} confirmed in round {}.".format(txid, txinfo.get('confirmed-round')))
-    return txinfo
+# Helper function that decodes the key-values of an application state into a dict. Keys are
+# decoded to strings and values to `bytes` or `int` according to their type
+def decode_state(key_values):
+    state = {}
+    for kv in key_values:
+        key = base64.b64decode(kv['key'])
+        try:
+            key = key.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+
+        value = kv['value']
+        if value['type'] == 1:
+            state[key] = base64.b64decode(value.get('bytes', ''))
+        else:
+            state[key] = value.get('uint', 0)
+
+    return state
+
+# Fetch the decoded local state of `addr` for `app_id` only, or `None` if it has not opted in
+def get_local_state(client, addr, app_id):
+    try:
+        results = client.account_application_info(addr, app_id)
+    except AlgodHTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+
+    if 'app-local-state' not in results:
+        return None
+    return decode_state(results['app-local-state'].get('key-value', []))
+
+# Fetch the decoded global state of `app_id` from the application itself
+def get_global_state(client, app_id):
+    results = client.application_info(app_id)
+    return decode_state(results['params'].get('global-state', []))
+
+# Helper function that returns the box reference of the diploma box of `addr` in the called app
+def diploma_box(addr):
+    return (0, encoding.decode_address(addr))
+
+# Helper function that returns the minimum balance held by the application for the box of an
+# encoded `diploma`
+def diploma_box_min_balance(diploma):
+    box_size = 32 + len(diploma)
+    return BOX_FLAT_MIN_BALANCE + BOX_BYTE_MIN_BALANCE * box_size
+
+# Helper function that decodes a diploma box into the same keys as a diploma in local state.
+# The box holds the encoded diploma, as the local state does
+def decode_diploma_box(value):
+    return {'diploma': value}
+
+# Fetch the decoded diploma box of `addr` for `app_id`, or `None` if no diploma is stored
+def get_box_diploma(client, addr, app_id):
+    _, name = diploma_box(addr)
+    try:
+        results = client.application_box_by_name(app_id, name)
+    except AlgodHTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+
+    return decode_diploma_box(base64.b64decode(results['value']))
+
+# Fetch the decoded local states of every address in `addrs` for `app_id` with up to `workers`
+# requests in flight. Yields `(addr, state)` pairs in the order of `addrs`, which may be a
+# stream of any length since only a bounded window of addresses is held at a time
+def get_local_states(client, addrs, app_id, workers=INSPECT_WORKERS):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        window = collections.deque()
+        for addr in addrs:
+            window.append((addr, executor.submit(get_local_state, client, addr, app_id)))
+            if len(window) >= 2 * workers:
+                addr, future = window.popleft()
+                yield addr, future.result()
+
+        while window:
+            addr, future = window.popleft()
+            yield addr, future.result()
 
 # Read user local state
 def read_local_state(client, addr, app_id):
-    results = client.account_info(addr)
-    local_state = results['apps-local-state'][0]
-    for index in local_state:
-        if local_state[index] == app_id:
-            print(f"local_state of account {addr} for app_id {app_id}:")
+    local_state = get_local_state(client, addr, app_id)
+    if local_state is None:
+        print(f"account {addr} has not opted in to app_id {app_id}")
+        return
 
-            # Check if there is a local state to even display
-            if 'key-value' not in local_state:
-                print("\t", "No local state")
-                return
+    print(f"local_state of account {addr} for app_id {app_id}:")
 
-            for kv in local_state['key-value']:
-                key = base64.b64decode(kv['key'])
-                value = kv['value']
-                if 'bytes' in value:
-                    value['bytes'] = base64.b64decode(value['bytes'])
+    # Check if there is a local state to even display
+    if not local_state:
+        print("\t", "No local state")
+        return
 
-                print("\t", key, value)
+    for key, value in local_state.items():
+        print("\t", key, diploma_codec.describe(value) if key == 'diploma' else value)
+
+# Read user diploma box
+def read_box_diploma(client, addr, app_id):
+    box_diploma = get_box_diploma(client, addr, app_id)
+    if box_diploma is None:
+        print(f"account {addr} has no diploma box in app_id {app_id}")
+        return
+
+    print(f"diploma box of account {addr} for app_id {app_id}:")
+    for key, value in box_diploma.items():
+        print("\t", key, diploma_codec.describe(value))
 
 # Read app global state
-def read_global_state(client, addr, app_id):   
-    results = client.account_info(addr)
-    apps_created = results['created-apps']
-    for app in apps_created:
-        if app['id'] == app_id:
-            print(f"global_state for app_id {app_id}:")
-
-            # Check if there is a global state to even display
-            if 'global-state' not in app['params']:
-                print("\t", "No global state")
-                return
-
-            for kv in app['params']['global-state']:
-                key = base64.b64decode(kv['key'])
-                value = kv['value']
-                if 'bytes' in value:
-                    value['bytes'] = base64.b64decode(value['bytes'])
-
-                print("\t", key, value)
+def read_global_state(client, app_id):
+    global_state = get_global_state(client, app_id)
+    print(f"global_state for app_id {app_id}:")
+
+    # Check if there is a global state to even display
+    if not global_state:
+        print("\t", "No global state")
+        return
+
+    for key, value in global_state.items():
+        print("\t", key, value)
@@ -0,0 +1,201 @@
+import base64
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import msgpack
+from algosdk import constants, encoding
+
+import metrics
+import params_cache
+
+# The default number of blocks fetched concurrently while catching up
+FETCH_WORKERS = 8
+
+class TransactionExpiredError(Exception):
+    """Raised through a tracked future when its transaction can no longer be confirmed."""
+
+# Helper function that computes the txid of a transaction as it is stored in a block. Blocks
+# strip the genesis ID and hash from every transaction, so they are restored before hashing
+def block_txid(block, stxn):
+    txn = dict(stxn['txn'])
+    if stxn.get('hgi'):
+        txn['gen'] = block['gen']
+    txn['gh'] = block['gh']
+
+    # Blocks are canonically encoded, so only the restored top-level keys need sorting
+    encoded = msgpack.packb(dict(sorted(txn.items())), use_bin_type=True, unicode_errors='surrogateescape')
+    digest = encoding.checksum(constants.txid_prefix + encoded)
+    return base64.b32encode(digest).decode().strip('=')
+
+# Helper function that converts a block state delta into the format of `pending_transaction_info`
+def _format_state_delta(delta):
+    formatted = []
+    for key, value in delta.items():
+        entry = {'action': value.get('at')}
+        if 'bs' in value:
+            entry['bytes'] = base64.b64encode(value['bs']).decode()
+        if 'ui' in value:
+            entry['uint'] = value['ui']
+        formatted.append({'key': base64.b64encode(key).decode(), 'value': entry})
+    return formatted
+
+# Helper function that builds a `pending_transaction_info` style response from a block entry
+def block_transaction_info(block, stxn):
+    txn = stxn['txn']
+    txinfo = {
+        'confirmed-round': block['rnd'],
+        'txn': {'txn': {'apid': txn.get('apid', 0)}},
+    }
+
+    if stxn.get('apid'):
+        txinfo['application-index'] = stxn['apid']
+
+    eval_delta = stxn.get('dt', {})
+    if eval_delta.get('gd'):
+        txinfo['global-state-delta'] = _format_state_delta(eval_delta['gd'])
+    if eval_delta.get('ld'):
+        # Local deltas reference accounts by index, where 0 is the sender
+        accounts = [txn['snd']] + list(txn.get('apat', []))
+        txinfo['local-state-delta'] = [
+            {'address': encoding.encode_address(accounts[index]), 'delta': _format_state_delta(delta)}
+            for index, delta in eval_delta['ld'].items()
+        ]
+    if eval_delta.get('lg'):
+        txinfo['logs'] = [base64.b64encode(log).decode() for log in eval_delta['lg']]
+
+    return txinfo
+
+# Helper function that returns the bytes of a string of a block. Algod encodes the Go strings of
+# the apply data, such as state keys and values and logs, as msgpack strings even when they hold
+# binary data, which are decoded with their invalid bytes escaped
+def _raw_bytes(value):
+    return value.encode('utf-8', 'surrogateescape') if isinstance(value, str) else value
+
+# Helper function that decodes the strings of a state delta of a block into bytes
+def _decode_state_delta(delta):
+    return {_raw_bytes(key): dict(value, bs=_raw_bytes(value['bs'])) if 'bs' in value else value
+            for key, value in delta.items()}
+
+# Decode a block fetched in the msgpack format. The state deltas and logs of its apply data are
+# decoded into bytes, while the transactions keep their strings, so that they encode back the same
+def decode_block(raw_block):
+    block = msgpack.unpackb(raw_block, raw=False, strict_map_key=False, unicode_errors='surrogateescape')['block']
+    for stxn in block.get('txns', []):
+        eval_delta = stxn.get('dt')
+        if not eval_delta:
+            continue
+        if 'gd' in eval_delta:
+            eval_delta['gd'] = _decode_state_delta(eval_delta['gd'])
+        if 'ld' in eval_delta:
+            eval_delta['ld'] = {index: _decode_state_delta(delta) for index, delta in eval_delta['ld'].items()}
+        if 'lg' in eval_delta:
+            eval_delta['lg'] = [_raw_bytes(log) for log in eval_delta['lg']]
+    return block
+
+# Fetch and decode the block of round `rnd`
+def fetch_block(client, rnd):
+    return decode_block(client.block_info(rnd, response_format='msgpack'))
+
+# Helper generator that yields `(round, block)` for every decoded block from `start_round` up to
+# the latest round, in order. Up to `workers` blocks are fetched concurrently, but only a bounded
+# window of them is fetched ahead of the consumer. With `follow` set, keep yielding each new
+# block as it is produced
+def iter_blocks(client, start_round, follow=False, workers=FETCH_WORKERS):
+    next_round = start_round
+    last_round = client.status().get('last-round')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for window_start in range(next_round, last_round + 1, 4 * workers):
+                rounds = range(window_start, min(window_start + 4 * workers, last_round + 1))
+                yield from zip(rounds, executor.map(lambda rnd: fetch_block(client, rnd), rounds))
+
+            next_round = last_round + 1
+            if not follow:
+                return
+            last_round = client.status_after_block(last_round).get('last-round')
+
+class ConfirmationTracker:
+    """Confirms a set of in-flight transactions from the contents of each new block.
+
+    Each round costs one `status_after_block` wait and one block fetch no matter how
+    many transactions are being tracked. Create the tracker before sending the
+    transactions it will track so that no block is missed.
+    """
+
+    def __init__(self, client, start_round=None):
+        self.client = client
+        self._pending = {}
+
+        # The last round whose block has already been scanned
+        if start_round is None:
+            start_round = client.status().get('last-round')
+        self.last_round = start_round
+
+    def __len__(self):
+        return len(self._pending)
+
+    # Track a sent `txid`, returning a future resolved with its transaction info. A future whose
+    # transaction is not confirmed by its `last_valid` round fails with `TransactionExpiredError`
+    def track(self, txid, last_valid=None):
+        future = Future()
+        self._pending[txid] = (future, last_valid)
+        return future
+
+    # Stop tracking `txid`, whose future is then never resolved
+    def untrack(self, txid):
+        self._pending.pop(txid, None)
+
+    # Track a sent signed transaction using its own validity window
+    def track_signed(self, signed_txn):
+        return self.track(signed_txn.get_txid(), signed_txn.transaction.last_valid_round)
+
+    # Wait for the next round(s) to be produced and resolve every tracked transaction they confirm
+    def poll(self):
+        status = self.client.status_after_block(self.last_round)
+        latest_round = status.get('last-round')
+        params_cache.observe_round(self.client, latest_round)
+        for rnd in range(self.last_round + 1, latest_round + 1):
+            self._scan_block(rnd)
+        self.last_round = latest_round
+
+    # Poll rounds until every tracked transaction is resolved
+    def wait(self):
+        while self._pending:
+            print("Waiting for confirmation of {} transactions...".format(len(self._pending)))
+            self.poll()
+
+    def _scan_block(self, rnd):
+        resolve_block(self._pending, rnd, fetch_block(self.client, rnd))
+
+# Resolve the future of every transaction of `pending`, which maps each txid to its `(future,
+# last_valid)`, that the decoded `block` of round `rnd` confirms, and fail those whose validity
+# window has passed. Resolved transactions are removed from `pending`. Both concurrent and asyncio
+# futures are resolved the same way
+def resolve_block(pending, rnd, block):
+    for stxn in block.get('txns', []):
+        txid = block_txid(block, stxn)
+        if txid in pending:
+            future, _ = pending.pop(txid)
+            future.set_result(block_transaction_info(block, stxn))
+
+    # Fail every transaction whose validity window has passed
+    for txid, (future, last_valid) in list(pending.items()):
+        if last_valid is not None and last_valid <= rnd:
+            del pending[txid]
+            future.set_exception(TransactionExpiredError(
+                "Transaction {} was not confirmed by its last valid round {}".format(txid, last_valid)))
+
+# Send the `signed_txns` and wait for them to be confirmed. Returns the transaction info of the
+# first transaction, which stands for the whole group since groups confirm atomically
+def send_and_confirm(client, signed_txns):
+    tracker = ConfirmationTracker(client)
+    sent_round = tracker.last_round
+    with metrics.span("send"):
+        client.send_transactions(signed_txns)
+    future = tracker.track_signed(signed_txns[0])
+    with metrics.span("confirm"):
+        tracker.wait()
+
+    txinfo = future.result()
+    metrics.observe_rounds_waited(sent_round, txinfo)
+    print("Transaction {} confirmed in round {}.".format(signed_txns[0].get_txid(), txinfo.get('confirmed-round')))
+    return txinfo
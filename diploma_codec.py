@@ -0,0 +1,137 @@
+import functools
+import os
+import struct
+
+import yaml
+
+# The file holding the dictionaries of the institutions, degrees and majors that diplomas refer to by ID
+REGISTRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "diploma_registry.yml")
+
+# The version of the layout written by `encode`, which is the first byte of every diploma
+VERSION = 1
+
+# The fixed part of a version 1 diploma: the version, the institution, degree and major IDs, and
+# the year and degree duration packed into 16 bits. The UTF-8 name of the holder follows it
+LAYOUT = struct.Struct('>BHBHH')
+
+# The most bytes the key and the value of a state entry may take together, and the key a
+# diploma is stored under in the local state of its holder, which bound the size of a diploma
+MAX_KEY_VALUE_BYTES = 128
+STATE_KEY = b"diploma"
+MAX_SIZE = MAX_KEY_VALUE_BYTES - len(STATE_KEY)
+
+# The year and the degree duration are packed as the years since `BASE_YEAR` in the upper 12
+# bits and the duration in years in the lower 4 bits
+BASE_YEAR = 1900
+MAX_YEAR = BASE_YEAR + 0xfff
+MAX_DURATION = 0xf
+
+# The separator of the fields in the text form of the diploma metadata
+SEPARATOR = " :: "
+
+# The fields coded by the dictionaries of the registry, and the largest ID each layout field holds
+DICTIONARY_FIELDS = {'institution': 0xffff, 'degree': 0xff, 'major': 0xffff}
+
+class Registry:
+    """The dictionaries mapping the institutions, degrees and majors of diplomas to their IDs.
+
+    The diplomas already issued refer to the IDs, so an ID is never reused or
+    renumbered and new entries are only appended with the next free ID. The ID 0
+    is reserved for a diploma without a major.
+    """
+
+    def __init__(self, dictionaries):
+        self.names = {}
+        self.ids = {}
+        for field, max_id in DICTIONARY_FIELDS.items():
+            entries = dictionaries.get(field + 's') or {}
+            self.names[field] = {int(entry_id): str(name) for entry_id, name in entries.items()}
+            self.ids[field] = {name: entry_id for entry_id, name in self.names[field].items()}
+
+            if len(self.ids[field]) != len(self.names[field]):
+                raise ValueError("The {}s of the diploma registry must have distinct names".format(field))
+            if any(not 0 < entry_id <= max_id for entry_id in self.names[field]):
+                raise ValueError("The IDs of the {}s of the diploma registry must be from 1 to {}".format(field, max_id))
+
+    def id_of(self, field, name):
+        try:
+            return self.ids[field][name]
+        except KeyError:
+            raise ValueError("Unknown {} {!r}, which must first be added to the diploma registry".format(field, name))
+
+    def name_of(self, field, entry_id):
+        try:
+            return self.names[field][entry_id]
+        except KeyError:
+            raise ValueError("Unknown {} ID {} in the diploma registry".format(field, entry_id))
+
+# Load the registry from the YAML file at `path`, only reading each file once
+@functools.lru_cache(maxsize=None)
+def load_registry(path=REGISTRY_FILE):
+    with open(path, 'r') as rfile:
+        return Registry(yaml.safe_load(rfile) or {})
+
+# Encode a diploma into the compact binary layout stored on the chain. The `metadata` is the text
+# form `name :: institution :: degree :: major :: year`, where the major may be left out, and
+# the `duration` is the number of years the degree took. The diploma must fit in `MAX_SIZE` bytes
+def encode(metadata, duration, registry=None):
+    registry = registry or load_registry()
+
+    fields = [field.strip() for field in metadata.split(SEPARATOR)]
+    if len(fields) == 4:
+        (name, institution, degree, year), major = fields, None
+    elif len(fields) == 5:
+        name, institution, degree, major, year = fields
+    else:
+        raise ValueError("Diploma metadata must read 'name :: institution :: degree :: major :: year': {}".format(
+            metadata))
+
+    try:
+        year = int(year)
+    except ValueError:
+        raise ValueError("Invalid year in the diploma metadata: {}".format(metadata))
+    if not BASE_YEAR <= year <= MAX_YEAR:
+        raise ValueError("The year of a diploma must be from {} to {}: {}".format(BASE_YEAR, MAX_YEAR, metadata))
+    if not 0 <= duration <= MAX_DURATION:
+        raise ValueError("The degree duration must be from 0 to {} years: {}".format(MAX_DURATION, duration))
+
+    encoded_name = name.encode('utf-8')
+    if LAYOUT.size + len(encoded_name) > MAX_SIZE:
+        raise ValueError("The name of a diploma holder must take at most {} bytes in UTF-8, not {}: {}".format(
+            MAX_SIZE - LAYOUT.size, len(encoded_name), metadata))
+
+    return LAYOUT.pack(
+        VERSION, registry.id_of('institution', institution), registry.id_of('degree', degree),
+        registry.id_of('major', major) if major else 0, (year - BASE_YEAR) << 4 | duration) + encoded_name
+
+# Decode a diploma of the compact binary layout into its fields, by their names in `encode`
+def decode(value, registry=None):
+    registry = registry or load_registry()
+
+    if len(value) < LAYOUT.size or value[0] != VERSION:
+        raise ValueError("Not a version {} diploma: {}".format(VERSION, value.hex()))
+    _, institution, degree, major, year_duration = LAYOUT.unpack_from(value)
+
+    return {
+        'name': value[LAYOUT.size:].decode('utf-8', 'replace'),
+        'institution': registry.name_of('institution', institution),
+        'degree': registry.name_of('degree', degree),
+        'major': registry.name_of('major', major) if major else None,
+        'year': BASE_YEAR + (year_duration >> 4),
+        'duration': year_duration & MAX_DURATION,
+    }
+
+# Format a decoded `diploma` back into the text form of the metadata accepted by `encode`
+def format_metadata(diploma):
+    fields = [diploma['name'], diploma['institution'], diploma['degree']]
+    if diploma['major'] is not None:
+        fields.append(diploma['major'])
+    return SEPARATOR.join(fields + [str(diploma['year'])])
+
+# Describe the stored diploma `value` for display, or show its raw bytes if it cannot be decoded
+def describe(value, registry=None):
+    try:
+        diploma = decode(value, registry)
+    except ValueError:
+        return repr(value)
+    return "{} ({} years)".format(format_metadata(diploma), diploma['duration'])
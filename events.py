@@ -0,0 +1,102 @@
+import collections
+import os
+
+from algosdk import encoding
+
+from assets import diploma_events as events
+
+import confirmation
+
+# The number of rounds without any event after which the checkpoint is still saved, so that
+# a restart does not replay a long stretch of empty rounds
+CHECKPOINT_INTERVAL = 256
+
+# The names of the kinds of events, and whether each concerns an account rather than a cohort
+KINDS = {
+    events.ISSUED: ("issued", True),
+    events.REVOKED: ("revoked", True),
+    events.ISSUED_BOX: ("issued-box", True),
+    events.REVOKED_BOX: ("revoked-box", True),
+    events.REGISTRAR_REASSIGNED: ("registrar-reassigned", True),
+    events.COHORT_COMMITTED: ("cohort-committed", False),
+    events.COHORT_REVOKED: ("cohort-revoked", False),
+    events.REINSTATED: ("reinstated", True),
+}
+
+# An event of the diploma smart contract, logged at position `index` by the transaction `txid`.
+# The `address` is set for the events concerning an account, the `root` for the ones concerning
+# a cohort, and the `diploma` for the issuances only, as stored and decoded by `diploma_codec`
+Event = collections.namedtuple('Event', ['round', 'txid', 'index', 'kind', 'address', 'root', 'diploma'])
+
+# Decode the raw `log` of an event into the fields of an `Event` after its position, or return
+# `None` if it is not an event of the diploma smart contract
+def decode_event(log):
+    kind = log[:1]
+    if kind not in KINDS or len(log) < events.HEADER_SIZE:
+        return None
+
+    name, concerns_account = KINDS[kind]
+    subject = log[1:events.HEADER_SIZE]
+    address = encoding.encode_address(subject) if concerns_account else None
+    root = None if concerns_account else subject
+
+    diploma = log[events.HEADER_SIZE:] if kind in (events.ISSUED, events.ISSUED_BOX) else None
+    return name, address, root, diploma
+
+# Helper generator of the events logged by the calls to `app_id` in the decoded `block` of
+# round `rnd`, in the order they were logged
+def block_events(rnd, block, app_id):
+    for stxn in block.get('txns', []):
+        txn = stxn['txn']
+        logs = stxn.get('dt', {}).get('lg')
+        if not logs or txn.get('type') != 'appl' or (txn.get('apid') or stxn.get('apid')) != app_id:
+            continue
+
+        # The txid is only computed for the calls that logged anything
+        txid = confirmation.block_txid(block, stxn)
+        for index, log in enumerate(logs):
+            fields = decode_event(log)
+            if fields is not None:
+                yield Event(rnd, txid, index, *fields)
+
+# Helper function that reads the last round fully consumed before a restart, if any
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r') as cfile:
+        return int(cfile.read())
+
+# Helper function that writes the last round fully consumed atomically
+def _save_checkpoint(checkpoint_path, rnd):
+    with open(checkpoint_path + '.tmp', 'w') as cfile:
+        cfile.write(str(rnd))
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+# Generator that yields every event of `app_id` from the checkpoint, or from `start_round` on the
+# first run, round by round. The blocks are only fetched as fast as the events are consumed, with
+# a bounded window of them fetched ahead. A round is checkpointed once the consumer asks for the
+# event after its last one, so every event is yielded at least once across restarts, and the
+# round, txid and position of an event tell a replayed one apart. With `follow` set, keep
+# yielding the events of each new block as it is produced
+def follow_events(client, app_id, start_round=None, checkpoint_path=None, follow=True,
+                  workers=confirmation.FETCH_WORKERS):
+    last_round = load_checkpoint(checkpoint_path) if checkpoint_path else None
+    next_round = start_round if last_round is None else last_round + 1
+    if next_round is None:
+        raise ValueError("The first run of the event follower needs a start round")
+
+    saved_round = consumed_round = next_round - 1
+    for rnd, block in confirmation.iter_blocks(client, next_round, follow, workers):
+        num_events = 0
+        for event in block_events(rnd, block, app_id):
+            num_events += 1
+            yield event
+
+        # Every event of the round has been consumed once the generator resumes here
+        consumed_round = rnd
+        if checkpoint_path and (num_events or consumed_round - saved_round >= CHECKPOINT_INTERVAL):
+            _save_checkpoint(checkpoint_path, consumed_round)
+            saved_round = consumed_round
+
+    if checkpoint_path and consumed_round > saved_round:
+        _save_checkpoint(checkpoint_path, consumed_round)
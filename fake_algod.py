@@ -0,0 +1,1128 @@
+import base64
+import copy
+import functools
+import hashlib
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import msgpack
+import algosdk.transaction
+from algosdk import account, encoding, logic
+from algosdk.error import AlgodHTTPError, IndexerHTTPError, KMDHTTPError
+from algosdk.kmd import KMDClient
+from algosdk.v2client import algod, indexer
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+import common
+import teal
+
+# The identity of the fake network, which every transaction sent to it must name
+GENESIS_ID = "fake-v1"
+GENESIS_HASH = hashlib.sha256(b"algo-diploma fake network").digest()
+CONSENSUS_VERSION = "fake"
+
+# The build of algod the fake node reports, numbered by the version of its assembler
+BUILD = {'major': 0, 'minor': 0, 'build_number': teal.ASSEMBLER_VERSION, 'commit_hash': "", 'branch': "fake",
+         'channel': "fake"}
+
+# The microAlgos held by the account funded at genesis
+GENESIS_FUNDS = 10 ** 16
+
+# The ports the fake node is served on over HTTP, the same as the sandbox
+ALGOD_PORT = 4001
+KMD_PORT = 4002
+INDEXER_PORT = 8980
+
+# The wallet through which KMD exports the keys of the accounts funded at genesis
+KMD_WALLET_NAME = "unencrypted-default-wallet"
+
+# The longest that `status_after_block` waits for a new block, in seconds
+WAIT_TIMEOUT = 60
+
+# The protocol parameters enforced by the fake node
+MIN_TXN_FEE = 1000
+MAX_TXN_LIFE = 1000
+MAX_GROUP_SIZE = 16
+MIN_BALANCE = 100_000
+APP_MIN_BALANCE = 100_000
+SCHEMA_UINT_MIN_BALANCE = 28_500
+SCHEMA_BYTES_MIN_BALANCE = 50_000
+APP_CALL_BUDGET = 700
+MAX_APP_ARGS = 16
+MAX_APP_ARGS_BYTES = 2048
+MAX_APP_ACCOUNTS = 4
+MAX_APP_REFERENCES = 8
+MAX_KEY_BYTES = 64
+MAX_KEY_VALUE_BYTES = 128
+MAX_BOX_SIZE = 32768
+MAX_LOGS = 32
+MAX_LOG_BYTES = 1024
+
+# The kinds of the entries of a state delta, as stored in blocks
+SET_BYTES, SET_UINT, DELETE = 1, 2, 3
+
+# The application call types, by their `OnCompletion` value
+NOOP, OPT_IN, CLOSE_OUT, CLEAR_STATE, UPDATE_APPLICATION, DELETE_APPLICATION = range(6)
+
+# A placeholder for a missing key in the undo journal
+_MISSING = object()
+
+class TransactionError(Exception):
+    """Raised when a transaction is rejected, with the reason that algod would give."""
+
+# Helper functions that convert between addresses and their public keys, which programs do over
+# and over for the same few accounts
+_decode_address = functools.lru_cache(maxsize=65536)(encoding.decode_address)
+_app_address = functools.lru_cache(maxsize=65536)(logic.get_application_address)
+
+# Helper function that encodes a TEAL value in the `key-value` format of the REST API
+def _encode_value(value):
+    if isinstance(value, int):
+        return {'type': 2, 'bytes': '', 'uint': value}
+    return {'type': 1, 'bytes': base64.b64encode(value).decode(), 'uint': 0}
+
+# Helper function that encodes a state in the `key-value` format of the REST API
+def _encode_state(state):
+    return [{'key': base64.b64encode(key).decode(), 'value': _encode_value(value)}
+            for key, value in state.items()]
+
+# Helper function that encodes a state schema in the format of the REST API
+def _encode_schema(schema):
+    return {'num-uint': schema[0], 'num-byte-slice': schema[1]}
+
+# Helper function that returns the minimum balance held for a state schema
+def _schema_min_balance(schema):
+    return SCHEMA_UINT_MIN_BALANCE * schema[0] + SCHEMA_BYTES_MIN_BALANCE * schema[1]
+
+class _AppCallContext:
+    """The view of the ledger given to the programs run by one application call.
+
+    Every state change goes through the ledger's undo journal, so that a failed
+    group leaves no trace. The changes and logs are also recorded in the form
+    algod stores them in a block, and each write in the form algod traces it in
+    a simulation.
+    """
+
+    def __init__(self, node, group, group_index, app_id, box_refs):
+        self.node = node
+        self.group = group
+        self.group_index = group_index
+        self.app_id = app_id
+        self.box_refs = box_refs
+
+        txn = group[group_index][1]
+        self.txn = txn
+        self.accounts = [txn.sender] + list(txn.accounts or [])
+        self.apps = [app_id] + list(txn.foreign_apps or [])
+        self.logs = []
+        self.global_delta = {}
+        self.local_delta = {}
+        self.state_changes = []
+        self._txn_arrays = {}
+
+    def txn_field(self, group_index, field, index):
+        if group_index >= len(self.group):
+            raise teal.TealError("txn index {} beyond the group".format(group_index))
+        txid, txn = self.group[group_index]
+
+        if field in teal.TXN_ARRAY_FIELDS:
+            values = self._txn_array(group_index, txn, field)
+            if index is None or index >= len(values):
+                raise teal.TealError("invalid {} index {}".format(field, index))
+            return values[index]
+
+        if field == 'Sender':
+            return _decode_address(txn.sender)
+        if field in ('Fee', 'FirstValid', 'LastValid'):
+            return {'Fee': txn.fee, 'FirstValid': txn.first_valid_round, 'LastValid': txn.last_valid_round}[field]
+        if field == 'Note':
+            return txn.note or b''
+        if field == 'Lease':
+            return txn.lease or bytes(32)
+        if field == 'GroupID':
+            return txn.group or bytes(32)
+        if field == 'Type':
+            return txn.type.encode()
+        if field == 'TypeEnum':
+            return teal.NAMED_INTS[txn.type]
+        if field == 'GroupIndex':
+            return group_index
+        if field == 'TxID':
+            return base64.b32decode(txid + '====')
+        if field == 'RekeyTo':
+            return bytes(32)
+        if field in ('Receiver', 'CloseRemainderTo'):
+            addr = txn.receiver if field == 'Receiver' else txn.close_remainder_to
+            return _decode_address(addr) if addr else bytes(32)
+        if field == 'Amount':
+            return getattr(txn, 'amt', 0)
+        if field == 'ApplicationID':
+            return getattr(txn, 'index', 0)
+        if field == 'OnCompletion':
+            return getattr(txn, 'on_complete', 0)
+        if field in ('NumAppArgs', 'NumAccounts', 'NumApplications', 'NumAssets'):
+            return len(getattr(txn, {'NumAppArgs': 'app_args', 'NumAccounts': 'accounts',
+                                     'NumApplications': 'foreign_apps', 'NumAssets': 'foreign_assets'}[field],
+                               None) or [])
+        if field in ('ApprovalProgram', 'ClearStateProgram'):
+            return (txn.approval_program if field == 'ApprovalProgram' else txn.clear_program) or b''
+        if field in ('GlobalNumUint', 'GlobalNumByteSlice', 'LocalNumUint', 'LocalNumByteSlice'):
+            schema = txn.global_schema if field.startswith('Global') else txn.local_schema
+            if schema is None:
+                return 0
+            return schema.num_uints if field.endswith('Uint') else schema.num_byte_slices
+        if field == 'NumLogs':
+            return len(self.logs) if group_index == self.group_index else 0
+        raise teal.TealError("unsupported txn field {}".format(field))
+
+    # Helper function that returns the array `field` of the transaction `group_index`, decoding it
+    # only once per call since programs read the same arrays over and over
+    def _txn_array(self, group_index, txn, field):
+        if field == 'Logs':
+            return self.logs if group_index == self.group_index else []
+
+        key = (group_index, field)
+        if key not in self._txn_arrays:
+            if field == 'ApplicationArgs':
+                values = list(getattr(txn, 'app_args', None) or [])
+            elif field == 'Accounts':
+                addrs = [txn.sender] + list(getattr(txn, 'accounts', None) or [])
+                values = [_decode_address(addr) for addr in addrs]
+            elif field == 'Applications':
+                values = [getattr(txn, 'index', 0)] + list(getattr(txn, 'foreign_apps', None) or [])
+            else:
+                values = list(getattr(txn, 'foreign_assets', None) or [])
+            self._txn_arrays[key] = values
+        return self._txn_arrays[key]
+
+    def global_field(self, field):
+        if field == 'MinTxnFee':
+            return MIN_TXN_FEE
+        if field == 'MinBalance':
+            return MIN_BALANCE
+        if field == 'MaxTxnLife':
+            return MAX_TXN_LIFE
+        if field in ('ZeroAddress', 'CallerApplicationAddress'):
+            return bytes(32)
+        if field == 'GroupSize':
+            return len(self.group)
+        if field == 'LogicSigVersion':
+            return teal.MAX_VERSION
+        if field == 'Round':
+            return self.node.last_round + 1
+        if field == 'LatestTimestamp':
+            return self.node.blocks[-1]['ts']
+        if field == 'CurrentApplicationID':
+            return self.app_id
+        if field == 'CreatorAddress':
+            return _decode_address(self.node.apps[self.app_id]['creator'])
+        if field == 'CurrentApplicationAddress':
+            return _decode_address(_app_address(self.app_id))
+        if field == 'GroupID':
+            return self.txn.group or bytes(32)
+        if field == 'CallerApplicationID':
+            return 0
+        raise teal.TealError("unsupported global field {}".format(field))
+
+    # Return the address of the account referenced by its index in the accounts array, or by
+    # its address, which must be available to the call
+    def resolve_account(self, value):
+        if isinstance(value, int):
+            if value >= len(self.accounts):
+                raise teal.TealError("invalid Account reference {}".format(value))
+            return self.accounts[value]
+
+        if len(value) != 32:
+            raise teal.TealError("invalid Account reference")
+        addr = encoding.encode_address(value)
+        available = set(self.accounts) | {_app_address(app_id) for app_id in self.apps}
+        if addr not in available:
+            raise teal.TealError("invalid Account reference {}".format(addr))
+        return addr
+
+    def resolve_app(self, value):
+        if not isinstance(value, int):
+            raise teal.TealError("app reference wanted type uint64 got []byte")
+        if value < len(self.apps):
+            return self.apps[value]
+        if value not in self.apps:
+            raise teal.TealError("invalid App reference {}".format(value))
+        return value
+
+    def _trace(self, state_type, key, value, addr=None):
+        change = {'app-state-type': state_type, 'operation': 'd' if value is None else 'w',
+                  'key': base64.b64encode(key).decode()}
+        if value is not None:
+            change['new-value'] = _encode_value(value)
+        if addr is not None:
+            change['account'] = addr
+        self.state_changes.append(change)
+
+    def _record(self, delta, key, value):
+        if value is None:
+            delta[key] = {'at': DELETE}
+        elif isinstance(value, int):
+            delta[key] = {'at': SET_UINT, 'ui': value}
+        else:
+            delta[key] = {'at': SET_BYTES, 'bs': value}
+
+    @staticmethod
+    def _check_key_value(key, value):
+        if len(key) > MAX_KEY_BYTES:
+            raise teal.TealError("key too long: length was {}, maximum is {}".format(len(key), MAX_KEY_BYTES))
+        if isinstance(value, bytes) and len(key) + len(value) > MAX_KEY_VALUE_BYTES:
+            raise teal.TealError("key/value total too long: length was {}, maximum is {}".format(
+                len(key) + len(value), MAX_KEY_VALUE_BYTES))
+
+    def app_global_get(self, app_id, key):
+        app = self.node.apps.get(app_id)
+        return None if app is None else app['global'].get(key)
+
+    def app_global_put(self, key, value):
+        self._check_key_value(key, value)
+        self.node._set(self.node.apps[self.app_id]['global'], key, value)
+        self._record(self.global_delta, key, value)
+        self._trace('g', key, value)
+
+    def app_global_del(self, key):
+        if key in self.node.apps[self.app_id]['global']:
+            self.node._del(self.node.apps[self.app_id]['global'], key)
+        self._record(self.global_delta, key, None)
+        self._trace('g', key, None)
+
+    def _local_state(self, addr, app_id):
+        local = self.node.accounts.get(addr, {}).get('local', {}).get(app_id)
+        if local is None:
+            raise teal.TealError("account {} is not opted in to app {}".format(addr, app_id))
+        return local['state']
+
+    def app_local_get(self, addr, app_id, key):
+        local = self.node.accounts.get(addr, {}).get('local', {}).get(app_id)
+        return None if local is None else local['state'].get(key)
+
+    def app_local_put(self, addr, key, value):
+        self._check_key_value(key, value)
+        self.node._set(self._local_state(addr, self.app_id), key, value)
+        self._record(self.local_delta.setdefault(self.accounts.index(addr), {}), key, value)
+        self._trace('l', key, value, addr)
+
+    def app_local_del(self, addr, key):
+        state = self._local_state(addr, self.app_id)
+        if key in state:
+            self.node._del(state, key)
+        self._record(self.local_delta.setdefault(self.accounts.index(addr), {}), key, None)
+        self._trace('l', key, None, addr)
+
+    def opted_in(self, addr, app_id):
+        return app_id in self.node.accounts.get(addr, {}).get('local', {})
+
+    def balance(self, addr):
+        return self.node.accounts.get(addr, {}).get('amount', 0)
+
+    def min_balance(self, addr):
+        return self.node.min_balance(addr)
+
+    def log(self, value):
+        self.logs.append(value)
+        if len(self.logs) > MAX_LOGS:
+            raise teal.TealError("too many log calls in program. up to {} is allowed".format(MAX_LOGS))
+        if sum(len(log) for log in self.logs) > MAX_LOG_BYTES:
+            raise teal.TealError("program logs too large. {} bytes is allowed".format(MAX_LOG_BYTES))
+
+    def _boxes(self, name):
+        if (self.app_id, name) not in self.box_refs:
+            raise teal.TealError("invalid Box reference {}".format(name.hex()))
+        return self.node.boxes.setdefault(self.app_id, {})
+
+    def box_get(self, name):
+        return self._boxes(name).get(name)
+
+    def box_create(self, name, size):
+        boxes = self._boxes(name)
+        if size > MAX_BOX_SIZE:
+            raise teal.TealError("box size too large: {}, maximum is {}".format(size, MAX_BOX_SIZE))
+        if name in boxes:
+            if len(boxes[name]) != size:
+                raise teal.TealError("box size mismatch {} {}".format(len(boxes[name]), size))
+            return False
+        self.node._set(boxes, name, bytes(size))
+        self._trace('b', name, bytes(size))
+        return True
+
+    def box_put(self, name, value):
+        boxes = self._boxes(name)
+        if not name or len(value) > MAX_BOX_SIZE:
+            raise teal.TealError("invalid box name or size")
+        if name in boxes and len(boxes[name]) != len(value):
+            raise teal.TealError("box_put wrong size {} != {}".format(len(boxes[name]), len(value)))
+        self.node._set(boxes, name, value)
+        self._trace('b', name, value)
+
+    def box_del(self, name):
+        boxes = self._boxes(name)
+        if name not in boxes:
+            return False
+        self.node._del(boxes, name)
+        self._trace('b', name, None)
+        return True
+
+    # The apply data of the call in the form algod stores it in a block
+    def eval_delta(self):
+        delta = {}
+        if self.global_delta:
+            delta['gd'] = self.global_delta
+        if self.local_delta:
+            delta['ld'] = self.local_delta
+        if self.logs:
+            delta['lg'] = self.logs
+        return delta
+
+class FakeAlgod:
+    """An in-memory Algorand network that produces a block for every group it accepts.
+
+    It keeps the accounts, applications, their state and boxes, and runs the
+    approval and clear programs of every application call with a TEAL interpreter,
+    so the diploma contract behaves as on a real node, only without waiting for
+    block production. It serves the algod, indexer and KMD REST APIs, either
+    in-process through `FakeAlgodClient` and `FakeIndexerClient` or over HTTP
+    through `serve`. It checks the signatures, fees, validity windows, leases, groups,
+    minimum balances and the program limits, and simulates groups without applying
+    them. Programs are assembled with constant blocks as goal does, so their sizes
+    and opcode costs compare with those of algod for the opcodes it supports, but a
+    baseline is still only compared against the same assembler. It supports neither
+    multisig nor logic signatures, rekeying, assets or inner transactions.
+    """
+
+    def __init__(self):
+        self.accounts = {}
+        self.apps = {}
+        self.boxes = {}
+        self.blocks = [{'rnd': 0, 'gen': GENESIS_ID, 'gh': GENESIS_HASH, 'ts': int(time.time()), 'txns': []}]
+        self.confirmed = {}
+        self.leases = {}
+        self.next_app_id = 1000
+        self.genesis_keys = {}
+        self._journal = None
+        self._lock = threading.RLock()
+        self._new_block = threading.Condition(self._lock)
+
+        # The account funded at genesis, whose key KMD exports
+        self.genesis_account = self.fund_genesis(*account.generate_account())
+
+    @property
+    def last_round(self):
+        return len(self.blocks) - 1
+
+    # Fund the account of `private_key` with `amount` at genesis, returning its address
+    def fund_genesis(self, private_key, address, amount=GENESIS_FUNDS):
+        with self._lock:
+            self.genesis_keys[address] = private_key
+            self.accounts.setdefault(address, self._new_account())['amount'] += amount
+        return address
+
+    # Fund the `address` out of thin air, as if it had been funded at genesis
+    def fund(self, address, amount):
+        with self._lock:
+            self.accounts.setdefault(address, self._new_account())['amount'] += amount
+
+    @staticmethod
+    def _new_account():
+        return {'amount': 0, 'local': {}, 'created': {}}
+
+    # Helper functions that change the ledger, recording how to undo the change in the journal
+    def _set(self, mapping, key, value):
+        if self._journal is not None:
+            self._journal.append((mapping, key, mapping.get(key, _MISSING)))
+        mapping[key] = value
+
+    def _del(self, mapping, key):
+        if self._journal is not None:
+            self._journal.append((mapping, key, mapping[key]))
+        del mapping[key]
+
+    def _rollback(self, mark=0):
+        while len(self._journal) > mark:
+            mapping, key, value = self._journal.pop()
+            if value is _MISSING:
+                mapping.pop(key, None)
+            else:
+                mapping[key] = value
+
+    def _account(self, addr):
+        if addr not in self.accounts:
+            self._set(self.accounts, addr, self._new_account())
+        return self.accounts[addr]
+
+    # Return the minimum balance of `addr`, including that held for its apps and, for an app
+    # account, its boxes
+    def min_balance(self, addr):
+        data = self.accounts.get(addr)
+        if data is None:
+            return 0
+        balance = MIN_BALANCE
+        balance += sum(APP_MIN_BALANCE + _schema_min_balance(local['schema']) for local in data['local'].values())
+        balance += sum(APP_MIN_BALANCE + _schema_min_balance(self.apps[app_id]['global_schema'])
+                       for app_id in data['created'] if app_id in self.apps)
+        for app_id, boxes in self.boxes.items():
+            if _app_address(app_id) == addr:
+                balance += sum(common.BOX_FLAT_MIN_BALANCE + common.BOX_BYTE_MIN_BALANCE * (len(name) + len(value))
+                               for name, value in boxes.items())
+        return balance
+
+    def _transfer(self, sender, receiver, amount):
+        data = self._account(sender)
+        if data['amount'] < amount:
+            raise TransactionError("overspend (account {}, balance {}, tried to spend {})".format(
+                sender, data['amount'], amount))
+        self._set(data, 'amount', data['amount'] - amount)
+        receiver_data = self._account(receiver)
+        self._set(receiver_data, 'amount', receiver_data['amount'] + amount)
+
+    def _check_min_balances(self, addrs):
+        for addr in addrs:
+            data = self.accounts.get(addr)
+            if data is None:
+                continue
+            min_balance = self.min_balance(addr)
+            if data['amount'] < min_balance:
+                raise TransactionError("account {} balance {} below min {}".format(addr, data['amount'], min_balance))
+
+    # Decode the signed transactions `stxns`, as unpacked from msgpack, checking their signatures
+    # and that they are well-formed. With `allow_empty_signatures`, as in a simulation, unsigned
+    # transactions are accepted too. Returns a list of `(txid, txn, stxn)`
+    def _decode_group(self, stxns, allow_empty_signatures=False):
+        group = []
+        for stxn in stxns:
+            if 'txn' not in stxn or ('sig' not in stxn and not (allow_empty_signatures and len(stxn) == 1)):
+                raise TransactionError("only single signature transactions are supported by the fake node")
+            txn = algosdk.transaction.Transaction.undictify(dict(stxn['txn']))
+            # The canonical encoding of the transaction is the one it was sent in, so it is signed
+            # and hashed as is rather than encoded again
+            message = b'TX' + msgpack.packb(stxn['txn'], use_bin_type=True)
+            txid = base64.b32encode(encoding.checksum(message)).decode().strip('=')
+            # Without rekeying, every transaction must be signed by its sender
+            if 'sgnr' in stxn and encoding.encode_address(stxn['sgnr']) != txn.sender:
+                raise TransactionError("transaction {}: should have been authorized by {} but was actually "
+                                       "authorized by {}".format(txid, txn.sender, encoding.encode_address(stxn['sgnr'])))
+            try:
+                if 'sig' in stxn:
+                    VerifyKey(_decode_address(txn.sender)).verify(message, stxn['sig'])
+            except (BadSignatureError, ValueError):
+                raise TransactionError("transaction {}: At least one signature didn't pass verification".format(txid))
+            group.append((txid, txn, stxn))
+
+        if not 1 <= len(group) <= MAX_GROUP_SIZE:
+            raise TransactionError("group size {} is not between 1 and {}".format(len(group), MAX_GROUP_SIZE))
+        return group
+
+    @staticmethod
+    def _unpack(raw):
+        unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+        unpacker.feed(raw)
+        try:
+            return list(unpacker)
+        except Exception as e:
+            raise TransactionError("malformed transactions: {}".format(e))
+
+    def _check_txn(self, txid, txn, next_round):
+        if txid in self.confirmed:
+            raise TransactionError("transaction already in ledger: {}".format(txid))
+        if base64.b64decode(txn.genesis_hash) != GENESIS_HASH or (txn.genesis_id and txn.genesis_id != GENESIS_ID):
+            raise TransactionError("transaction {}: genesis hash or ID mismatch".format(txid))
+        if not txn.first_valid_round <= next_round <= txn.last_valid_round:
+            raise TransactionError("transaction {}: txn dead: round {} outside of {}--{}".format(
+                txid, next_round, txn.first_valid_round, txn.last_valid_round))
+        if txn.lease and self.leases.get((txn.sender, txn.lease), 0) >= next_round:
+            raise TransactionError("transaction {} using an overlapping lease (sender, lease):({}, {})".format(
+                txid, txn.sender, base64.b64encode(txn.lease).decode()))
+        if txn.last_valid_round - txn.first_valid_round > MAX_TXN_LIFE:
+            raise TransactionError("transaction {}: validity window longer than {}".format(txid, MAX_TXN_LIFE))
+        if getattr(txn, 'rekey_to', None):
+            raise TransactionError("transaction {}: rekeying is not supported by the fake node".format(txid))
+        if txn.type not in ('pay', 'appl'):
+            raise TransactionError("transaction {}: type {} is not supported by the fake node".format(txid, txn.type))
+
+    # Accept the signed transactions of `raw` as one atomic group, producing a block with them.
+    # Returns the txid of the first transaction, or raises `TransactionError` if any is rejected
+    def submit(self, raw):
+        group = self._decode_group(self._unpack(raw))
+
+        with self._lock:
+            next_round = self.last_round + 1
+            self._journal = []
+            try:
+                entries = [self._block_entry(stxn, apply_data)
+                           for (_, _, stxn), (apply_data, _, _) in zip(group, self._evaluate(group, next_round))]
+            except BaseException:
+                self._rollback()
+                raise
+            finally:
+                self._journal = None
+
+            self.blocks.append({'rnd': next_round, 'gen': GENESIS_ID, 'gh': GENESIS_HASH,
+                                'ts': int(time.time()), 'txns': entries})
+            for index, (txid, txn, _) in enumerate(group):
+                self.confirmed[txid] = (next_round, index)
+                # A lease is held by its sender until the last valid round of the transaction
+                if txn.lease:
+                    self.leases[(txn.sender, txn.lease)] = txn.last_valid_round
+            self._new_block.notify_all()
+
+        return group[0][0]
+
+    # Check and apply the decoded `group` as if in round `next_round`, recording every change in
+    # the undo journal. Returns the apply data, the call context, or None for a payment, and the
+    # opcode budget consumed of each transaction
+    def _evaluate(self, group, next_round):
+        for txid, txn, _ in group:
+            self._check_txn(txid, txn, next_round)
+
+        txns = [txn for _, txn, _ in group]
+        if len(txns) > 1 or txns[0].group:
+            group_id = algosdk.transaction.calculate_group_id(self._ungrouped(txns))
+            if any(txn.group != group_id for txn in txns):
+                raise TransactionError("transaction {}: incomplete group".format(group[0][0]))
+        if sum(txn.fee for txn in txns) < MIN_TXN_FEE * len(txns):
+            raise TransactionError("transaction {}: fee too small".format(group[0][0]))
+
+        num_app_calls = sum(txn.type == 'appl' for txn in txns)
+        budget = teal.Budget(APP_CALL_BUDGET * num_app_calls)
+        box_refs = {(txn.index if ref.app_index == 0 else ref.app_index, ref.name)
+                    for txn in txns if txn.type == 'appl' for ref in (txn.boxes or [])}
+
+        results = []
+        id_group = [(txid, txn) for txid, txn, _ in group]
+        for group_index, (txid, _, _) in enumerate(group):
+            remaining = budget.remaining
+            try:
+                apply_data, ctx = self._apply(id_group, group_index, budget, box_refs)
+            except TransactionError as e:
+                raise TransactionError("transaction {}: {}".format(txid, e))
+            results.append((apply_data, ctx, remaining - budget.remaining))
+        return results
+
+    # Simulate the groups of the msgpack encoded simulate request `raw` one after the other,
+    # without changing the ledger. Returns the response of algod's simulate endpoint, whose
+    # execution trace only holds the state changes of each program and not its opcodes
+    def simulate(self, raw):
+        requests = self._unpack(raw)
+        if len(requests) != 1 or not isinstance(requests[0], dict):
+            raise TransactionError("malformed simulate request")
+        request = requests[0]
+        allow_empty_signatures = request.get('allow-empty-signatures', False)
+        trace = request.get('exec-trace-config', {}).get('enable', False)
+
+        results = []
+        with self._lock:
+            next_round = self.last_round + 1
+            self._journal = []
+            try:
+                for txn_group in request.get('txn-groups', []):
+                    mark = len(self._journal)
+                    try:
+                        group = self._decode_group(txn_group.get('txns', []), allow_empty_signatures)
+                        evaluated = self._evaluate(group, next_round)
+                    except TransactionError as e:
+                        self._rollback(mark)
+                        results.append({'failure-message': str(e), 'txn-results': []})
+                        continue
+                    results.append(self._simulate_result(group, evaluated, trace))
+            finally:
+                self._rollback()
+                self._journal = None
+
+        return {'version': 2, 'last-round': self.last_round, 'txn-groups': results}
+
+    # Helper function that builds the simulation result of a `group` from its `evaluated` results
+    @staticmethod
+    def _simulate_result(group, evaluated, trace):
+        txn_results = []
+        for (_, txn, _), (apply_data, ctx, consumed) in zip(group, evaluated):
+            result = {'txn-result': {'pool-error': ''}, 'app-budget-consumed': consumed}
+            if 'apid' in apply_data:
+                result['txn-result']['application-index'] = apply_data['apid']
+            if ctx is not None and ctx.logs:
+                result['txn-result']['logs'] = [base64.b64encode(log).decode() for log in ctx.logs]
+            if trace and ctx is not None:
+                kind = 'clear-state-program-trace' if txn.on_complete == CLEAR_STATE else 'approval-program-trace'
+                result['exec-trace'] = {kind: [{'pc': 0, 'state-changes': ctx.state_changes}]}
+            txn_results.append(result)
+        return {'txn-results': txn_results, 'app-budget-consumed': sum(consumed for _, _, consumed in evaluated)}
+
+    # Helper function that returns copies of `txns` without their group ID, from which it is computed
+    @staticmethod
+    def _ungrouped(txns):
+        ungrouped = []
+        for txn in txns:
+            txn = copy.copy(txn)
+            txn.group = None
+            ungrouped.append(txn)
+        return ungrouped
+
+    # Helper function that builds the entry of a transaction in a block, which strips the
+    # genesis ID and hash every transaction of the block shares
+    @staticmethod
+    def _block_entry(stxn, apply_data):
+        entry = dict(stxn)
+        txn = dict(stxn['txn'])
+        txn.pop('gh', None)
+        if txn.pop('gen', None) is not None:
+            entry['hgi'] = True
+        entry['txn'] = txn
+        entry.update(apply_data)
+        return entry
+
+    def _apply(self, group, group_index, budget, box_refs):
+        _, txn = group[group_index]
+        sender = self._account(txn.sender)
+        if sender['amount'] < txn.fee:
+            raise TransactionError("overspend (account {}, balance {}, tried to spend {})".format(
+                txn.sender, sender['amount'], txn.fee))
+        self._set(sender, 'amount', sender['amount'] - txn.fee)
+
+        if txn.type == 'pay':
+            return self._apply_payment(txn), None
+        return self._apply_app_call(group, group_index, budget, box_refs)
+
+    def _apply_payment(self, txn):
+        self._transfer(txn.sender, txn.receiver, txn.amt)
+        if txn.close_remainder_to:
+            data = self.accounts[txn.sender]
+            if data['local'] or data['created']:
+                raise TransactionError("cannot close account {} with opted in or created apps".format(txn.sender))
+            self._transfer(txn.sender, txn.close_remainder_to, data['amount'])
+            self._del(self.accounts, txn.sender)
+
+        self._check_min_balances([txn.sender, txn.receiver])
+        return {}
+
+    def _apply_app_call(self, group, group_index, budget, box_refs):
+        _, txn = group[group_index]
+        app_args = txn.app_args or []
+        if len(app_args) > MAX_APP_ARGS or sum(len(arg) for arg in app_args) > MAX_APP_ARGS_BYTES:
+            raise TransactionError("too many application args or application args too long")
+        num_references = len(txn.accounts or []) + len(txn.foreign_apps or []) + len(txn.foreign_assets or [])
+        if len(txn.accounts or []) > MAX_APP_ACCOUNTS or num_references + len(txn.boxes or []) > MAX_APP_REFERENCES:
+            raise TransactionError("too many foreign references")
+
+        apply_data = {}
+        app_id = txn.index
+        if app_id == 0:
+            app_id = self._create_app(txn)
+            apply_data['apid'] = app_id
+            box_refs = box_refs | {(app_id, name) for (ref_app, name) in box_refs if ref_app == 0}
+        elif app_id not in self.apps:
+            if txn.on_complete != CLEAR_STATE:
+                raise TransactionError("application {} does not exist".format(app_id))
+
+        on_complete = txn.on_complete
+        local = self.accounts[txn.sender]['local']
+        if on_complete == OPT_IN:
+            if app_id in local:
+                raise TransactionError("account {} has already opted in to app {}".format(txn.sender, app_id))
+            schema = self.apps[app_id]['local_schema']
+            self._set(local, app_id, {'state': {}, 'schema': schema})
+        elif on_complete in (CLOSE_OUT, CLEAR_STATE) and app_id not in local:
+            raise TransactionError("account {} is not currently opted in to app {}".format(txn.sender, app_id))
+
+        ctx = _AppCallContext(self, group, group_index, app_id, box_refs)
+        if on_complete == CLEAR_STATE:
+            # A failing clear program only undoes its own changes, the account is cleared regardless
+            if app_id in self.apps:
+                mark = len(self._journal)
+                try:
+                    if not teal.run(self.apps[app_id]['clear_program'], ctx, budget):
+                        self._rollback(mark)
+                except teal.TealError:
+                    self._rollback(mark)
+                    ctx = _AppCallContext(self, group, group_index, app_id, box_refs)
+        else:
+            try:
+                approved = teal.run(self.apps[app_id]['approval_program'], ctx, budget)
+            except teal.TealError as e:
+                raise TransactionError("logic eval error: {}. Details: app={}".format(e, app_id))
+            if not approved:
+                raise TransactionError("transaction rejected by ApprovalProgram")
+
+        if on_complete in (CLOSE_OUT, CLEAR_STATE):
+            self._del(local, app_id)
+        elif on_complete == UPDATE_APPLICATION:
+            self._set_programs(self.apps[app_id], txn)
+        elif on_complete == DELETE_APPLICATION:
+            self._del(self.accounts[self.apps[app_id]['creator']]['created'], app_id)
+            self._del(self.apps, app_id)
+
+        self._check_schemas(ctx)
+        self._check_min_balances(set(ctx.accounts) | {_app_address(app_id)})
+        eval_delta = ctx.eval_delta()
+        if eval_delta:
+            apply_data['dt'] = eval_delta
+        return apply_data, ctx
+
+    def _set_programs(self, app, txn):
+        try:
+            approval = teal.Program(txn.approval_program)
+            clear = teal.Program(txn.clear_program)
+        except (teal.TealError, TypeError) as e:
+            raise TransactionError("invalid program: {}".format(e))
+        self._set(app, 'approval', txn.approval_program)
+        self._set(app, 'clear', txn.clear_program)
+        self._set(app, 'approval_program', approval)
+        self._set(app, 'clear_program', clear)
+
+    def _create_app(self, txn):
+        app_id = self.next_app_id
+        self.next_app_id += 1
+
+        global_schema = txn.global_schema or algosdk.transaction.StateSchema(0, 0)
+        local_schema = txn.local_schema or algosdk.transaction.StateSchema(0, 0)
+        app = {
+            'creator': txn.sender,
+            'global': {},
+            'global_schema': (global_schema.num_uints or 0, global_schema.num_byte_slices or 0),
+            'local_schema': (local_schema.num_uints or 0, local_schema.num_byte_slices or 0),
+        }
+        self._set_programs(app, txn)
+        self._set(self.apps, app_id, app)
+        self._set(self.accounts[txn.sender]['created'], app_id, True)
+        return app_id
+
+    def _check_schemas(self, ctx):
+        states = []
+        if ctx.app_id in self.apps:
+            app = self.apps[ctx.app_id]
+            states.append(('global', app['global'], app['global_schema']))
+        for addr in ctx.accounts:
+            local = self.accounts.get(addr, {}).get('local', {}).get(ctx.app_id)
+            if local is not None:
+                states.append(('local', local['state'], local['schema']))
+
+        for kind, state, (num_uints, num_bytes) in states:
+            uints = sum(isinstance(value, int) for value in state.values())
+            if uints > num_uints:
+                raise TransactionError("store integer count {} exceeds schema integer count {}".format(uints, num_uints))
+            if len(state) - uints > num_bytes:
+                raise TransactionError("store bytes count {} exceeds schema bytes count {}".format(
+                    len(state) - uints, num_bytes))
+
+    # Block until a round after `rnd` is produced, or the wait times out
+    def wait_for_block_after(self, rnd, timeout=WAIT_TIMEOUT):
+        with self._new_block:
+            self._new_block.wait_for(lambda: self.last_round > rnd, timeout)
+
+    def _status(self):
+        return {
+            'last-round': self.last_round,
+            'last-version': CONSENSUS_VERSION,
+            'next-version': CONSENSUS_VERSION,
+            'next-version-round': self.last_round + 1,
+            'next-version-supported': True,
+            'time-since-last-round': 0,
+            'catchup-time': 0,
+            'stopped-at-unsupported-round': False,
+        }
+
+    def _app_params(self, app_id):
+        app = self.apps[app_id]
+        return {
+            'creator': app['creator'],
+            'approval-program': base64.b64encode(app['approval']).decode(),
+            'clear-state-program': base64.b64encode(app['clear']).decode(),
+            'global-state': _encode_state(app['global']),
+            'global-state-schema': _encode_schema(app['global_schema']),
+            'local-state-schema': _encode_schema(app['local_schema']),
+            'extra-program-pages': 0,
+        }
+
+    def _local_state(self, app_id, local):
+        return {'id': app_id, 'schema': _encode_schema(local['schema']), 'key-value': _encode_state(local['state'])}
+
+    def _account_info(self, addr):
+        data = self.accounts.get(addr, self._new_account())
+        return {
+            'address': addr,
+            'amount': data['amount'],
+            'amount-without-pending-rewards': data['amount'],
+            'min-balance': self.min_balance(addr),
+            'pending-rewards': 0,
+            'rewards': 0,
+            'round': self.last_round,
+            'status': 'Online' if addr in self.genesis_keys else 'Offline',
+            'apps-local-state': [self._local_state(app_id, local) for app_id, local in data['local'].items()],
+            'total-apps-opted-in': len(data['local']),
+            'created-apps': [{'id': app_id, 'params': self._app_params(app_id)}
+                             for app_id in data['created'] if app_id in self.apps],
+            'total-created-apps': len(data['created']),
+        }
+
+    def _pending_transaction_info(self, txid):
+        if txid not in self.confirmed:
+            raise AlgodHTTPError("txn does not exist", 404)
+        rnd, index = self.confirmed[txid]
+        block = self.blocks[rnd]
+        stxn = block['txns'][index]
+
+        # Imported here since `confirmation` depends on nothing of the fake node
+        import confirmation
+        info = confirmation.block_transaction_info(block, stxn)
+        info['pool-error'] = ''
+        return info
+
+    # Serve an algod REST API request for `path`, relative to `/v2`. Returns the decoded JSON
+    # response, or the raw bytes of a msgpack one, raising `AlgodHTTPError` on failure
+    def algod_request(self, method, path, params=None, data=None):
+        params = params or {}
+        parts = path.strip('/').split('/')
+
+        with self._lock:
+            if path == '/status':
+                return self._status()
+            if parts[:2] == ['status', 'wait-for-block-after'] and len(parts) == 3:
+                self.wait_for_block_after(int(parts[2]))
+                return self._status()
+            if path == '/transactions/params':
+                return {'consensus-version': CONSENSUS_VERSION, 'fee': 0, 'min-fee': MIN_TXN_FEE,
+                        'genesis-hash': base64.b64encode(GENESIS_HASH).decode(), 'genesis-id': GENESIS_ID,
+                        'last-round': self.last_round}
+            if path == '/transactions' and method == 'POST':
+                try:
+                    return {'txId': self.submit(data)}
+                except TransactionError as e:
+                    raise AlgodHTTPError("TransactionPool.Remember: {}".format(e), 400)
+            if path == '/transactions/simulate' and method == 'POST':
+                try:
+                    return self.simulate(data)
+                except TransactionError as e:
+                    raise AlgodHTTPError(str(e), 400)
+            if parts[:2] == ['transactions', 'pending'] and len(parts) == 3:
+                return self._pending_transaction_info(parts[2])
+            if parts[0] == 'blocks' and len(parts) == 2:
+                rnd = int(parts[1])
+                if rnd > self.last_round:
+                    raise AlgodHTTPError("failed to retrieve information from the ledger", 404)
+                if params.get('format') != 'msgpack':
+                    raise AlgodHTTPError("the fake node only serves blocks in the msgpack format", 400)
+                return msgpack.packb({'block': self.blocks[rnd], 'cert': {}}, use_bin_type=True)
+            if parts[0] == 'accounts' and len(parts) == 2:
+                return self._account_info(parts[1])
+            if parts[0] == 'accounts' and parts[2:3] == ['applications'] and len(parts) == 4:
+                addr, app_id = parts[1], int(parts[3])
+                data = self.accounts.get(addr, self._new_account())
+                info = {'round': self.last_round}
+                if app_id in data['local']:
+                    info['app-local-state'] = self._local_state(app_id, data['local'][app_id])
+                if app_id in data['created'] and app_id in self.apps:
+                    info['created-app'] = self._app_params(app_id)
+                if len(info) == 1:
+                    raise AlgodHTTPError("account application info not found", 404)
+                return info
+            if parts[0] == 'applications' and len(parts) >= 2:
+                app_id = int(parts[1])
+                if len(parts) == 2:
+                    if app_id not in self.apps:
+                        raise AlgodHTTPError("application does not exist", 404)
+                    return {'id': app_id, 'params': self._app_params(app_id)}
+                boxes = self.boxes.get(app_id, {})
+                if parts[2] == 'boxes':
+                    return {'boxes': [{'name': base64.b64encode(name).decode()} for name in boxes]}
+                if parts[2] == 'box':
+                    encoding_name, _, value = params.get('name', '').partition(':')
+                    name = base64.b64decode(value) if encoding_name == 'b64' else value.encode()
+                    if name not in boxes:
+                        raise AlgodHTTPError("box not found", 404)
+                    return {'round': self.last_round, 'name': base64.b64encode(name).decode(),
+                            'value': base64.b64encode(boxes[name]).decode()}
+            if path == '/teal/compile' and method == 'POST':
+                try:
+                    bytecode = teal.assemble(data.decode('utf-8'))
+                except teal.TealError as e:
+                    raise AlgodHTTPError(str(e), 400)
+                return {'hash': logic.address(bytecode), 'result': base64.b64encode(bytecode).decode()}
+            if path in ('/health', '/ready'):
+                return {}
+            if path == '/versions':
+                return {'genesis_id': GENESIS_ID, 'genesis_hash_b64': base64.b64encode(GENESIS_HASH).decode(),
+                        'versions': ['v2'], 'build': dict(BUILD)}
+
+        raise AlgodHTTPError("{} {} is not served by the fake node".format(method, path), 404)
+
+    # Serve an indexer REST API request for `path`, relative to `/v2`. The indexer is always
+    # caught up with the fake node
+    def indexer_request(self, method, path, params=None):
+        parts = path.strip('/').split('/')
+
+        with self._lock:
+            if path == '/health':
+                return {'round': self.last_round, 'db-available': True, 'is-migrating': False, 'message': ''}
+            if path == '/accounts':
+                return {'current-round': self.last_round, 'accounts': [
+                    dict(self._account_info(addr), **{'created-at-round': 0}) for addr in self.accounts]}
+            if parts[0] == 'accounts' and len(parts) == 2:
+                if parts[1] not in self.accounts:
+                    raise IndexerHTTPError("no accounts found for address: {}".format(parts[1]))
+                return {'current-round': self.last_round, 'account': self._account_info(parts[1])}
+            if parts[0] == 'applications' and len(parts) == 2:
+                app_id = int(parts[1])
+                if app_id not in self.apps:
+                    raise IndexerHTTPError("no application found for application-id: {}".format(app_id))
+                return {'current-round': self.last_round,
+                        'application': {'id': app_id, 'params': self._app_params(app_id)}}
+            if parts[0] == 'transactions' and len(parts) == 2:
+                if parts[1] not in self.confirmed:
+                    raise IndexerHTTPError("no transaction found for transaction id: {}".format(parts[1]))
+                rnd, _ = self.confirmed[parts[1]]
+                return {'current-round': self.last_round, 'transaction': {'id': parts[1], 'confirmed-round': rnd}}
+
+        raise IndexerHTTPError("{} {} is not served by the fake node".format(method, path))
+
+    # Serve a KMD REST API request for `path`, relative to `/v1`. The only wallet holds the keys
+    # of the accounts funded at genesis
+    def kmd_request(self, method, path, data=None):
+        if path == '/wallets':
+            return {'wallets': [{'id': KMD_WALLET_NAME, 'name': KMD_WALLET_NAME}]}
+        if path == '/wallet/init':
+            return {'wallet_handle_token': KMD_WALLET_NAME}
+        if path == '/wallet/release':
+            return {}
+        if path == '/key/export':
+            with self._lock:
+                if data.get('address') not in self.genesis_keys:
+                    raise KMDHTTPError("key does not exist in this wallet")
+                return {'private_key': self.genesis_keys[data['address']]}
+        raise KMDHTTPError("{} {} is not served by the fake node".format(method, path))
+
+class FakeAlgodClient(algod.AlgodClient):
+    """An `AlgodClient` whose every request is served in-process by a `FakeAlgod`."""
+
+    def __init__(self, node):
+        super().__init__("", "http://fake-algod")
+        self.node = node
+
+    def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format='json',
+                      timeout=30):
+        return self.node.algod_request(method, requrl, params, data)
+
+class FakeIndexerClient(indexer.IndexerClient):
+    """An `IndexerClient` whose every request is served in-process by a `FakeAlgod`."""
+
+    def __init__(self, node):
+        super().__init__("", "http://fake-indexer")
+        self.node = node
+
+    def indexer_request(self, method, requrl, params=None, data=None, headers=None, timeout=30):
+        return self.node.indexer_request(method, requrl, params)
+
+class FakeKMDClient(KMDClient):
+    """A `KMDClient` whose every request is served in-process by a `FakeAlgod`."""
+
+    def __init__(self, node):
+        super().__init__("", "http://fake-kmd")
+        self.node = node
+
+    def kmd_request(self, method, requrl, params=None, data=None, timeout=30):
+        return self.node.kmd_request(method, requrl, data)
+
+# Helper function that returns the handler of the HTTP requests to the `service` of `node`
+def _handler(node, service):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep connections alive between requests, as algod does. The response is buffered and
+        # sent in one write, since a kept-alive connection otherwise waits for a delayed ACK
+        protocol_version = 'HTTP/1.1'
+        wbufsize = -1
+
+        def _respond(self, status, body, content_type='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _serve(self, method):
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            path = url.path
+            for prefix in ('/v1', '/v2'):
+                if path.startswith(prefix + '/'):
+                    path = path[len(prefix):]
+
+            try:
+                if service == 'algod':
+                    result = node.algod_request(method, path, params, data)
+                elif service == 'indexer':
+                    result = node.indexer_request(method, path, params)
+                else:
+                    result = node.kmd_request(method, path, json.loads(data) if data else {})
+            except (AlgodHTTPError, IndexerHTTPError, KMDHTTPError) as e:
+                code = getattr(e, 'code', None) or (404 if 'not found' in str(e) or 'no ' in str(e) else 400)
+                self._respond(code, json.dumps({'message': str(e)}).encode())
+                return
+            except (ValueError, KeyError) as e:
+                self._respond(400, json.dumps({'message': "malformed request: {}".format(e)}).encode())
+                return
+
+            if isinstance(result, bytes):
+                self._respond(200, result, 'application/msgpack')
+            else:
+                self._respond(200, json.dumps(result).encode())
+
+        def do_GET(self):
+            self._serve('GET')
+
+        def do_POST(self):
+            self._serve('POST')
+
+        def do_DELETE(self):
+            self._serve('DELETE')
+
+        # Keep the console quiet, as the node serves a request per transaction
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+# Serve the algod, KMD and indexer REST APIs of `node` over HTTP on the sandbox's ports, in
+# background threads. Returns the servers, which are stopped with their `shutdown` method
+def serve(node, host='localhost', algod_port=ALGOD_PORT, kmd_port=KMD_PORT, indexer_port=INDEXER_PORT):
+    servers = []
+    for service, port in (('algod', algod_port), ('kmd', kmd_port), ('indexer', indexer_port)):
+        server = ThreadingHTTPServer((host, port), _handler(node, service))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+def main():
+    # Fund every account of the configuration file, so that `run_diploma.py` works out of the box
+    import run_diploma
+
+    node = FakeAlgod()
+    funded = []
+    if len(sys.argv) < 2 or sys.argv[1] != "--empty":
+        try:
+            _, accounts, _ = run_diploma.parse_config()
+        except (OSError, ValueError) as e:
+            print("Not funding the configured accounts: {}".format(e))
+            accounts = {}
+        for name, mn in accounts.items():
+            private_key = common.get_private_key_from_mnemonic(mn)
+            funded.append((name, node.fund_genesis(private_key, account.address_from_private_key(private_key))))
+
+    serve(node)
+    print("Fake algod on port {}, KMD on port {} and indexer on port {}".format(ALGOD_PORT, KMD_PORT, INDEXER_PORT))
+    print("Genesis account: {}".format(node.genesis_account))
+    for name, address in funded:
+        print("Funded {}: {}".format(name, address))
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
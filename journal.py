@@ -0,0 +1,403 @@
+import base64
+import copy
+import hashlib
+import http.client
+import os
+import sqlite3
+import threading
+import time
+
+import algosdk.transaction
+from algosdk import account
+from algosdk.error import AlgodHTTPError
+
+import batch
+import confirmation
+import metrics
+import params_cache
+import signing
+
+# The kinds of bulk job a journal records
+ISSUE, ISSUE_BOX, REVOKE = "issue", "issue-box", "revoke"
+
+# The states of a group of a job, and so of each of its rows. A group is `built` once its rows are
+# packed into calls, `signed` once a submission of it is recorded, which happens before it is sent,
+# `submitted` once the node accepted it and finally `confirmed` or `failed`
+BUILT, SIGNED, SUBMITTED, CONFIRMED, FAILED = "built", "signed", "submitted", "confirmed", "failed"
+
+# The most submissions of a group before it is failed
+MAX_ATTEMPTS = 5
+
+# The seconds before a group whose submission failed transiently is retried, doubling with
+# every attempt up to `MAX_RETRY_DELAY`
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 8
+
+class Journal:
+    """A write-ahead SQLite journal of a bulk job, recording the state of every row.
+
+    The rows are packed into atomic groups once, when the job starts, and every submission
+    of a group is recorded before it is sent. All submissions of a group carry the same
+    lease and last valid round, so at most one of them can ever be confirmed and a group
+    may be re-signed and resent whenever its outcome is unknown.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS groups (grp INTEGER PRIMARY KEY, state TEXT NOT NULL, "
+                               "num_rows INTEGER NOT NULL, last_valid INTEGER, attempts INTEGER NOT NULL DEFAULT 0, "
+                               "retry_at REAL NOT NULL DEFAULT 0, confirmed_round INTEGER, error TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS rows (grp INTEGER NOT NULL, call INTEGER NOT NULL, "
+                               "student TEXT NOT NULL, diploma BLOB)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS rows_grp ON rows (grp)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS submissions (txid TEXT PRIMARY KEY, "
+                               "grp INTEGER NOT NULL, first_valid INTEGER NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS submissions_grp ON submissions (grp)")
+
+        meta = dict(self._query("SELECT key, value FROM meta"))
+        self.kind = meta.get('kind')
+        self.app_id = int(meta['APP_ID']) if 'APP_ID' in meta else None
+        self.sender = meta.get('sender')
+        self._job_id = bytes.fromhex(meta['job']) if 'job' in meta else None
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # Start the job of `kind` calling `app_id` from `sender` with the calls of every group in
+    # `groups`, each call a list of `(student, diploma)` rows. A journal that already
+    # holds a job is left as is, and `groups` is not read. Returns whether the job was started
+    def start(self, kind, app_id, sender, groups):
+        if self.kind is not None:
+            if (self.kind, self.app_id, self.sender) != (kind, app_id, sender):
+                raise ValueError("The journal holds the {} job of app-id {} from {}".format(
+                    self.kind, self.app_id, self.sender))
+            return False
+
+        job_id = os.urandom(16)
+        with self._lock, self._conn:
+            for grp, calls in enumerate(groups):
+                self._conn.execute("INSERT INTO groups (grp, state, num_rows) VALUES (?, ?, ?)",
+                                   (grp, BUILT, sum(len(call_rows) for call_rows in calls)))
+                self._conn.executemany("INSERT INTO rows VALUES (?, ?, ?, ?)",
+                                       [(grp, call, student, diploma)
+                                        for call, call_rows in enumerate(calls)
+                                        for (student, diploma) in call_rows])
+
+            # The job only exists once all of its rows are recorded
+            self._conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ('kind', kind), ('APP_ID', str(app_id)), ('sender', sender), ('job', job_id.hex())])
+
+        self.kind, self.app_id, self.sender, self._job_id = kind, app_id, sender, job_id
+        return True
+
+    # The lease of every submission of the group `grp`, unique to this job
+    def lease(self, grp):
+        return hashlib.sha256(self._job_id + grp.to_bytes(8, 'big')).digest()
+
+    # Return the calls of the group `grp`, each a list of `(student, diploma)` rows
+    def group_calls(self, grp):
+        calls = {}
+        for (call, student, diploma) in self._query(
+                "SELECT call, student, diploma FROM rows WHERE grp = ? ORDER BY rowid", (grp,)):
+            calls.setdefault(call, []).append((student, diploma))
+        return [calls[call] for call in sorted(calls)]
+
+    # Return the number of rows of the group `grp`
+    def group_size(self, grp):
+        return self._query("SELECT num_rows FROM groups WHERE grp = ?", (grp,))[0][0]
+
+    # Return the number of recorded submissions of the group `grp`
+    def group_attempts(self, grp):
+        return self._query("SELECT attempts FROM groups WHERE grp = ?", (grp,))[0][0]
+
+    # Return up to `limit` `(grp, last_valid)` of the groups due to be sent by `now`, in order. A
+    # group whose last valid round is before `first_round` awaits the outcome of its submissions
+    def ready_groups(self, limit, now, first_round):
+        return self._query("SELECT grp, last_valid FROM groups WHERE state = ? AND retry_at <= ? "
+                           "AND (last_valid IS NULL OR last_valid >= ?) ORDER BY grp LIMIT ?",
+                           (BUILT, now, first_round, limit))
+
+    # Return the earliest time a group awaits to be retried at, or `None` if none does, leaving
+    # out those awaiting the outcome of their submissions as `ready_groups` does
+    def next_retry(self, first_round):
+        return self._query("SELECT MIN(retry_at) FROM groups WHERE state = ? "
+                           "AND (last_valid IS NULL OR last_valid >= ?)", (BUILT, first_round))[0][0]
+
+    # Return the `(txid, grp, first_valid, last_valid)` of every recorded submission whose group is unresolved
+    def submissions(self):
+        return self._query("SELECT s.txid, s.grp, s.first_valid, g.last_valid FROM submissions s "
+                           "JOIN groups g USING (grp) WHERE g.state NOT IN (?, ?)", (CONFIRMED, FAILED))
+
+    # Queue every signed or submitted group still valid in `rnd` to be resent
+    def requeue_submitted(self, rnd):
+        with self._lock, self._conn:
+            return self._conn.execute("UPDATE groups SET state = ?, retry_at = 0 WHERE state IN (?, ?) "
+                                      "AND last_valid >= ?", (BUILT, SIGNED, SUBMITTED, rnd)).rowcount
+
+    # Record the submissions `(grp, txid, first_valid, last_valid)` of `signed`, before they are sent
+    def record_signed(self, signed):
+        with self._lock, self._conn:
+            for grp, txid, first_valid, last_valid in signed:
+                self._conn.execute("UPDATE groups SET state = ?, last_valid = ?, attempts = attempts + 1 "
+                                   "WHERE grp = ?", (SIGNED, last_valid, grp))
+                self._conn.execute("INSERT OR IGNORE INTO submissions VALUES (?, ?, ?)", (txid, grp, first_valid))
+
+    # Record that the node accepted the submissions of the groups `grps`
+    def record_submitted(self, grps):
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE groups SET state = ? WHERE grp = ? AND state = ?",
+                                   [(SUBMITTED, grp, SIGNED) for grp in grps])
+
+    # Record that a submission of each group of the `(grp, rnd)` in `confirmed` was confirmed in
+    # round `rnd`, which is `None` when the node only reported it as confirmed
+    def record_confirmed(self, confirmed):
+        with self._lock, self._conn:
+            for grp, rnd in confirmed:
+                self._conn.execute("UPDATE groups SET state = ?, confirmed_round = ?, error = NULL WHERE grp = ?",
+                                   (CONFIRMED, rnd, grp))
+                self._conn.execute("DELETE FROM submissions WHERE grp = ?", (grp,))
+
+    # Record that the submission of the group `grp` failed with `error`, retrying it after `delay`
+    # seconds unless it was already submitted `MAX_ATTEMPTS` times
+    def record_retry(self, grp, error, delay=0):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE groups SET state = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                               "retry_at = ?, error = ? WHERE grp = ? AND state NOT IN (?, ?)",
+                               (MAX_ATTEMPTS, BUILT, FAILED, time.time() + delay, error, grp, CONFIRMED, FAILED))
+
+    # Record that the node rejected the group `grp` with `error`, which retrying would not change
+    def record_failed(self, grp, error):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE groups SET state = ?, error = ? WHERE grp = ? AND state != ?",
+                               (FAILED, error, grp, CONFIRMED))
+
+    # Record that no submission of the group `grp` was confirmed by its last valid round, so that
+    # it is retried with a new validity window
+    def record_expired(self, grp, error):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM submissions WHERE grp = ?", (grp,))
+            self._conn.execute("UPDATE groups SET last_valid = NULL WHERE grp = ?", (grp,))
+        self.record_retry(grp, error)
+
+    # Return the number of rows in each state
+    def counts(self):
+        counts = dict.fromkeys((BUILT, SIGNED, SUBMITTED, CONFIRMED, FAILED), 0)
+        counts.update(self._query("SELECT state, SUM(num_rows) FROM groups GROUP BY state"))
+        return counts
+
+    # Return the `(student, error)` of every row of a failed group
+    def failed_rows(self):
+        return self._query("SELECT r.student, g.error FROM rows r JOIN groups g USING (grp) "
+                           "WHERE g.state = ? ORDER BY r.rowid", (FAILED,))
+
+    def close(self):
+        self._conn.close()
+
+# Helper generator that packs the rows streamed from `rows` into the calls of the groups of a
+# job of `kind`, as `issue_diplomas_batch` and `revoke_diplomas_batch` do. The rows of a
+# `REVOKE` job are the `(student, claimed_root)` rows of `batch.revoke_calls`
+def pack_groups(kind, rows):
+    if kind == ISSUE:
+        calls = batch.pack_issue_rows(rows)
+    elif kind == ISSUE_BOX:
+        calls = ([row] for row in rows)
+    else:
+        calls = batch.chunked(rows, batch.ACCOUNTS_PER_CALL)
+    return batch.chunked(calls, batch.MAX_GROUP_SIZE)
+
+# Helper function that builds the unsigned group of the calls of `grp` with the `params`, leasing
+# its first transaction. The lease binds the whole group, since it confirms atomically
+def build_group(job, sender, params, grp):
+    txns = []
+    for call_rows in job.group_calls(grp):
+        if job.kind == REVOKE:
+            txns += batch.revoke_calls(sender, params, job.app_id, call_rows)
+        else:
+            txns += batch.issue_calls(sender, params, job.app_id, call_rows, job.kind == ISSUE_BOX)
+
+    txns[0].lease = job.lease(grp)
+    if len(txns) > 1:
+        algosdk.transaction.assign_group_id(txns)
+    return txns
+
+# Helper function that returns whether sending a group failed for a reason that may pass,
+# such as the node being unreachable, overloaded or failing internally
+def is_transient(error):
+    if isinstance(error, AlgodHTTPError):
+        return error.code is None or error.code >= 500 or error.code == 429 or 'txn dead' in str(error)
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+# Run the job recorded in `job`, signing with `private_key`, until every group is confirmed or
+# failed. Windows of up to `groups_per_round` groups are signed and sent while the previous
+# window is being confirmed, as in `batch.issue_diplomas_batch`. A restarted job only tracks
+# the submissions recorded in the journal: those still valid are resent under their lease,
+# and the blocks since the others were signed are scanned for their outcome. Groups that fail
+# transiently are retried with an exponential backoff. Returns the number of rows that were
+# confirmed and that failed.
+def run_job(client, job, private_key, action, groups_per_round=batch.GROUPS_PER_ROUND, signing_pool=None):
+    sender = account.address_from_private_key(private_key)
+    if sender != job.sender:
+        raise ValueError("The journal holds a job of {}, not of {}".format(job.sender, sender))
+
+    last_round = client.status().get('last-round')
+    submissions = job.submissions()
+    resent = job.requeue_submitted(last_round + 1)
+    if submissions:
+        print("Resuming {} groups, resending {} of them".format(len({grp for _, grp, _, _ in submissions}), resent))
+
+    # Only the blocks that may confirm a submission whose validity window has passed are scanned
+    lapsed_first_valid = [first_valid for (_, _, first_valid, last_valid) in submissions if last_valid <= last_round]
+    tracker = confirmation.ConfirmationTracker(
+        client, min(lapsed_first_valid) - 1 if lapsed_first_valid else last_round)
+
+    # The txids of the unresolved submissions of every group, and the groups resolved by the tracker
+    outstanding = {}
+    confirmed, expired = [], []
+
+    def _resolved(grp, txid, sent_round):
+        def _callback(future):
+            txids = outstanding.get(grp)
+            if txids is None:
+                return
+            txids.discard(txid)
+            if future.exception() is None:
+                metrics.observe_rounds_waited(sent_round, future.result())
+                confirmed.append((grp, future.result()['confirmed-round']))
+            elif not txids:
+                expired.append((grp, str(future.exception())))
+            else:
+                return
+
+            # Another submission of the group can no longer be confirmed
+            for other_txid in outstanding.pop(grp):
+                tracker.untrack(other_txid)
+        return _callback
+
+    def _track(grp, txid, last_valid, sent_round=None):
+        outstanding.setdefault(grp, set()).add(txid)
+        tracker.track(txid, last_valid).add_done_callback(_resolved(grp, txid, sent_round))
+
+    # Stop tracking every submission of a group the node resolved when it was sent
+    def _untrack_group(grp):
+        for txid in outstanding.pop(grp, ()):
+            tracker.untrack(txid)
+
+    def _poll():
+        with metrics.span("confirm"):
+            tracker.poll()
+        job.record_confirmed(confirmed)
+        for grp, error in expired:
+            job.record_expired(grp, error)
+        confirmed.clear()
+        expired.clear()
+
+    for txid, grp, _, last_valid in submissions:
+        _track(grp, txid, last_valid)
+
+    while True:
+        params = params_cache.suggested_params(client)
+        ready = job.ready_groups(groups_per_round, time.time(), params.first)
+
+        if not ready:
+            # Retry the groups that failed transiently before waiting for more rounds
+            next_retry = job.next_retry(params.first)
+            if next_retry is not None:
+                time.sleep(max(0, next_retry - time.time()))
+            elif outstanding:
+                _poll()
+            else:
+                break
+            continue
+
+        # Build every group of this window within the validity window of its earlier submissions, if any
+        groups = []
+        for grp, last_valid in ready:
+            group_params = copy.copy(params)
+            if last_valid is not None:
+                group_params.last = last_valid
+            groups.append((grp, build_group(job, sender, group_params, grp)))
+
+        signed_groups = batch.sign_groups([txns for _, txns in groups], private_key, signing_pool)
+        job.record_signed([(grp, txns[0].get_txid(), txns[0].first_valid_round, txns[0].last_valid_round)
+                           for grp, txns in groups])
+
+        # Track every submission before sending it, since the node may receive a send that fails
+        accepted = []
+        with metrics.span("send", groups=len(groups)):
+            for (grp, txns), signed_blobs in zip(groups, signed_groups):
+                txid = txns[0].get_txid()
+                _track(grp, txid, txns[0].last_valid_round, tracker.last_round)
+                try:
+                    client.send_raw_transaction(base64.b64encode(b''.join(signed_blobs)))
+                except (AlgodHTTPError, OSError, http.client.HTTPException) as e:
+                    if 'already in pool' in str(e):
+                        # The same submission was received earlier and is still pending
+                        accepted.append(grp)
+                    elif 'overlapping lease' in str(e) or 'already in ledger' in str(e):
+                        # An earlier submission of this group was already confirmed
+                        _untrack_group(grp)
+                        confirmed.append((grp, None))
+                    elif is_transient(e):
+                        attempts = job.group_attempts(grp)
+                        print("Group {} failed, retrying: {}".format(grp, e))
+                        job.record_retry(grp, str(e), min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (attempts - 1)))
+                    else:
+                        print("Group of {} rows rejected: {}".format(job.group_size(grp), e))
+                        _untrack_group(grp)
+                        job.record_failed(grp, str(e))
+                    continue
+                accepted.append(grp)
+
+        job.record_submitted(accepted)
+        job.record_confirmed(confirmed)
+        confirmed.clear()
+
+        # Keep at most one window in flight while the next one is being built
+        while len(tracker) > groups_per_round:
+            _poll()
+        print("{} {} rows so far".format(action, job.counts()[CONFIRMED]))
+
+    counts = job.counts()
+    return counts[CONFIRMED], counts[FAILED]
+
+# Helper function that starts the job of `kind` in the journal at `path` from the rows streamed
+# from `rows`, unless the journal already holds it, and runs it as described by `run_job`
+def _run_journaled(client, path, kind, private_key, app_id, rows, action, groups_per_round, sign_workers):
+    job = Journal(path)
+    try:
+        if job.start(kind, app_id, account.address_from_private_key(private_key), pack_groups(kind, rows)):
+            print("Recorded {} rows into {}".format(sum(job.counts().values()), path))
+        else:
+            print("Resuming the job of {}".format(path))
+
+        signing_pool = signing.SigningPool([private_key], sign_workers) if sign_workers else None
+        try:
+            return run_job(client, job, private_key, action, groups_per_round, signing_pool)
+        finally:
+            if signing_pool is not None:
+                signing_pool.close()
+    finally:
+        job.close()
+
+# Issue a diploma for every row streamed from `rows` as `batch.issue_diplomas_batch` does, recording
+# the job in the journal at `path`. Rerunning it with the same journal resumes the job without
+# reading `rows` again. Returns the number of issued and failed diplomas.
+def issue_diplomas(client, path, private_key, app_id, rows, groups_per_round=batch.GROUPS_PER_ROUND,
+                   sign_workers=None, boxes=False):
+    print("Batch issuing diplomas from account: ", account.address_from_private_key(private_key))
+    return _run_journaled(client, path, ISSUE_BOX if boxes else ISSUE, private_key, app_id, rows, "Issued",
+                          groups_per_round, sign_workers)
+
+# Revoke the diploma of every student address streamed from `students` as
+# `batch.revoke_diplomas_batch` does, recording the job in the journal at `path` as in
+# `issue_diplomas`. The root a diploma was claimed from is recorded along with its student, so
+# a resumed job revokes it from the same cohort. Returns the number of revoked and failed diplomas.
+def revoke_diplomas(client, path, private_key, app_id, students, groups_per_round=batch.GROUPS_PER_ROUND):
+    print("Batch revoking diplomas from account: ", account.address_from_private_key(private_key))
+    return _run_journaled(client, path, REVOKE, private_key, app_id, batch.claimed_rows(client, app_id, students),
+                          "Revoked", groups_per_round, None)
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+import common
+
+class LazyKeys(Mapping):
+    """A read-only mapping from account names to keys that derives each key on first access.
+
+    Decoding a mnemonic is expensive, so only the accounts a command actually uses
+    are decoded and each one is decoded at most once.
+    """
+
+    def __init__(self, names, derive):
+        self._names = names
+        self._derive = derive
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._keys:
+                self._keys[name] = self._derive(name)
+            return self._keys[name]
+
+    def __iter__(self):
+        return iter(self._names())
+
+    def __len__(self):
+        return sum(1 for _ in self._names())
+
+# Build the lazy public and private key mappings of the `accounts` parsed from the configuration file
+def config_keys(accounts):
+    pub_keys = LazyKeys(accounts.keys, lambda name: common.get_public_key_from_mnemonic(accounts[name]))
+    priv_keys = LazyKeys(accounts.keys, lambda name: common.get_private_key_from_mnemonic(accounts[name]))
+    return pub_keys, priv_keys
+
+class Keystore:
+    """An indexed SQLite keystore of the accounts of this DApp.
+
+    Account addresses are derived once when the accounts are imported, so looking
+    up an address is a single indexed read. Private keys are decoded on demand. The
+    digest of the configuration file they were imported from tells when it changed,
+    but it is only recomputed once the size or modification time of the file changed.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        meta = dict(self._query("SELECT key, value FROM meta"))
+        self.registrar = meta['registrar']
+        self.app_id = int(meta['APP_ID'])
+        self.config_digest = meta.get('config')
+        self.config_stat = meta.get('config-stat')
+
+        self.pub_keys = LazyKeys(self._names, lambda name: self._lookup("address", name))
+        self.priv_keys = LazyKeys(self._names, lambda name: common.get_private_key_from_mnemonic(self._lookup("mnemonic", name)))
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _names(self):
+        return [name for (name,) in self._query("SELECT name FROM accounts")]
+
+    def _lookup(self, column, name):
+        rows = self._query("SELECT {} FROM accounts WHERE name = ?".format(column), (name,))
+        if not rows:
+            raise KeyError(name)
+        return rows[0][0]
+
+    # Return whether the configuration file at `path` changed since it was imported. Its digest is
+    # only taken when its size or modification time changed, and those are recorded again when
+    # its contents did not
+    def config_changed(self, path):
+        stat = config_stat(path)
+        if stat == self.config_stat:
+            return False
+        if config_digest(path) != self.config_digest:
+            return True
+
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('config-stat', ?)", (stat,))
+        self.config_stat = stat
+        return False
+
+    def close(self):
+        self._conn.close()
+
+# Return the digest of the contents of the configuration file at `path`
+def config_digest(path):
+    with open(path, 'rb') as cfile:
+        return hashlib.sha256(cfile.read()).hexdigest()
+
+# Return the size and modification time of the configuration file at `path`, which change along
+# with its contents without reading them
+def config_stat(path):
+    stat = os.stat(path)
+    return "{}:{}".format(stat.st_mtime_ns, stat.st_size)
+
+# Import the `registrar`, `accounts` and `app_id` parsed from the configuration file with the
+# `digest` and `stat` into a keystore at `path`, replacing every account imported before.
+# Returns the number of accounts
+def import_accounts(path, registrar, accounts, app_id, digest=None, stat=None):
+    # The keystore holds the account mnemonics, so only the owner may read it
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+    os.close(fd)
+
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, address TEXT NOT NULL, mnemonic TEXT NOT NULL)")
+
+        conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                         [('registrar', registrar), ('APP_ID', str(app_id))])
+        if digest is not None:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('config', ?)", (digest,))
+        if stat is not None:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('config-stat', ?)", (stat,))
+
+        # An account no longer listed in the configuration file is dropped
+        conn.execute("DELETE FROM accounts")
+        conn.executemany("INSERT INTO accounts VALUES (?, ?, ?)",
+                         ((name, common.get_public_key_from_mnemonic(mn), mn) for (name, mn) in accounts.items()))
+    conn.close()
+
+    return len(accounts)
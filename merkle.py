@@ -0,0 +1,173 @@
+import base64
+import hashlib
+import json
+import math
+
+from algosdk import encoding
+from algosdk.error import AlgodHTTPError
+
+from assets import diploma_methods as methods
+
+import common
+
+# The prefixes hashed into the leaves and the inner nodes of a cohort's Merkle tree, as
+# in `diploma_program`, so that no inner node can pass for a leaf
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+# The opcode budget of every application call, which is pooled across the calls of a group
+CALL_BUDGET = 700
+
+# An upper bound of the opcode cost of verifying a proof, apart from its levels, and of each
+# of its levels. The cost of a budget call itself is taken out of the budget it adds
+PROOF_BASE_COST = 250
+PROOF_LEVEL_COST = 70
+BUDGET_CALL_COST = 20
+
+# Helper function that hashes the `diploma` of `addr`, as encoded by `diploma_codec`, into a leaf
+# of its cohort's tree
+def leaf_hash(addr, diploma):
+    return hashlib.sha256(LEAF_PREFIX + encoding.decode_address(addr) + diploma).digest()
+
+# Helper function that hashes two children into their parent, in sorted order
+def node_hash(left, right):
+    if right < left:
+        left, right = right, left
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+class MerkleTree:
+    """The Merkle tree of the diplomas of a cohort, built from the hashes of its leaves.
+
+    A node left without a sibling at the end of a level is carried up to the next
+    level unchanged, so the proofs of its leaves skip that level.
+    """
+
+    def __init__(self, leaves):
+        self.levels = [list(leaves)]
+        if not self.levels[0]:
+            raise ValueError("A cohort needs at least one diploma")
+
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            self.levels.append([node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                                for i in range(0, len(level), 2)])
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    @property
+    def root(self):
+        return self.levels[-1][0]
+
+    # Return the sibling hashes from the leaf at `index` up to the root
+    def proof(self, index):
+        proof = []
+        for level in self.levels[:-1]:
+            if index ^ 1 < len(level):
+                proof.append(level[index ^ 1])
+            index //= 2
+        return proof
+
+# Check that the `proof` of the leaf `leaf` leads up to `root`
+def verify_proof(leaf, proof, root):
+    node = leaf
+    for sibling in proof:
+        node = node_hash(node, sibling)
+    return node == root
+
+# Build the tree of the cohort of every `(student, diploma)` row in `rows`. Only the
+# leaf hashes of a streamed file are held, so the rows are streamed again to write the proofs
+def build_cohort(rows):
+    return MerkleTree(leaf_hash(*row) for row in rows)
+
+# Write the proof of every row in `rows`, in the order the `tree` was built from, to the file at
+# `path`. Each line is a JSON object that can be handed to its student on its own
+def write_proofs(path, tree, rows):
+    root = tree.root.hex()
+    with open(path, 'w') as pfile:
+        for index, (student, diploma) in enumerate(rows):
+            pfile.write(json.dumps({
+                'student': student,
+                'diploma': diploma.hex(),
+                'root': root,
+                'proof': [sibling.hex() for sibling in tree.proof(index)],
+            }) + "\n")
+
+# Helper generator that streams the proofs of the file at `path` written by `write_proofs`
+def read_proofs(path):
+    with open(path, 'r') as pfile:
+        for line_num, line in enumerate(pfile, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                yield {
+                    'student': record['student'],
+                    'diploma': bytes.fromhex(record['diploma']),
+                    'root': bytes.fromhex(record['root']),
+                    'proof': [bytes.fromhex(sibling) for sibling in record['proof']],
+                }
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Malformed proof on line {} in {}".format(line_num, path))
+
+# Return the proof of `student` in the file at `path`, or `None` if it holds none
+def find_proof(path, student):
+    return next((record for record in read_proofs(path) if record['student'] == student), None)
+
+# Check the `record` of a proof read by `read_proofs` without any node access
+def verify_record(record):
+    leaf = leaf_hash(record['student'], record['diploma'])
+    return verify_proof(leaf, record['proof'], record['root'])
+
+# Helper function that returns the box reference of the box committing a cohort's `root`
+def cohort_box(root):
+    return (0, b'cohort' + root)
+
+# Helper function that returns the box reference of the box recording the revocation of the
+# diploma of `student` from the cohort of `root`
+def revocation_box(student, root):
+    return (0, encoding.decode_address(student) + root)
+
+# The minimum balance held by the application for the box of a cohort, which holds the round
+# of its commitment
+COHORT_MIN_BALANCE = common.BOX_FLAT_MIN_BALANCE + common.BOX_BYTE_MIN_BALANCE * (len(b'cohort') + 32 + 8)
+
+# The minimum balance held by the application for the box recording the revocation of one
+# diploma from its cohort, which holds the round of the revocation
+REVOCATION_MIN_BALANCE = common.BOX_FLAT_MIN_BALANCE + common.BOX_BYTE_MIN_BALANCE * (32 + 32 + 8)
+
+# Fetch the round in which the cohort of `root` was committed to `app_id`, or `None` if it is
+# not committed or was revoked
+def get_cohort_round(client, app_id, root):
+    _, name = cohort_box(root)
+    return _get_box_round(client, app_id, name)
+
+# Fetch the round in which the diploma of `student` was revoked from the cohort of `root` of
+# `app_id`, or `None` if it was not
+def get_revocation_round(client, app_id, student, root):
+    _, name = revocation_box(student, root)
+    return _get_box_round(client, app_id, name)
+
+# Helper function that fetches the round held by the box `name` of `app_id`, or `None` if
+# there is no such box
+def _get_box_round(client, app_id, name):
+    try:
+        results = client.application_box_by_name(app_id, name)
+    except AlgodHTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+
+    return int.from_bytes(base64.b64decode(results['value']), 'big')
+
+# Helper function that encodes the application arguments of a `verify_diploma_proof` call, or
+# of a `claim_diploma` call with `claim` set, for the `record` of a proof
+def proof_args(record, claim=False):
+    selector = methods.CLAIM_DIPLOMA if claim else methods.VERIFY_DIPLOMA_PROOF
+    return [selector, record['diploma'], record['root'], b''.join(record['proof'])]
+
+# Helper function that returns the number of budget calls grouped with the verification of a
+# proof of `depth` levels, so that the group has enough opcode budget for it
+def budget_calls(depth):
+    cost = PROOF_BASE_COST + PROOF_LEVEL_COST * depth
+    return max(0, math.ceil((cost - CALL_BUDGET) / (CALL_BUDGET - BUDGET_CALL_COST)))
@@ -0,0 +1,248 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+
+# The prefix of every exported metric name
+PREFIX = "algo_diploma"
+
+# The upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# The upper bounds of the histogram buckets of the rounds a transaction waited to be confirmed
+ROUND_BUCKETS = [0, 1, 2, 3, 4, 5, 8, 10, 20, 50, 100]
+
+# The most spans kept by a trace, beyond which spans are only counted
+MAX_TRACE_SPANS = 100_000
+
+# The descriptions of the exported metrics, by name
+DESCRIPTIONS = {
+    'node_request_seconds': "Latency of the requests to the node, by method and endpoint",
+    'node_request_errors_total': "Requests to the node that failed, by method and endpoint",
+    'node_sent_bytes_total': "Bytes sent to the node, by endpoint",
+    'node_received_bytes_total': "Bytes received from the node, by endpoint",
+    'phase_seconds': "Time spent in each phase of an operation",
+    'rounds_waited': "Rounds each transaction waited from its submission to its confirmation",
+    'dropped_spans_total': "Spans not kept because the trace was full",
+}
+
+class Histogram:
+    """A cumulative histogram with fixed bucket bounds, as exported to Prometheus."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # The cumulative count of every bucket, by its upper bound, ending with `+Inf`
+    def buckets(self):
+        cumulative, total = [], 0
+        for bound, count in zip(self.bounds + ['+Inf'], self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+class Registry:
+    """The counters, histograms and optional trace spans recorded by this process.
+
+    Every metric is keyed by its name and its sorted label pairs. Recording is
+    guarded by one lock, since the node is called from many threads at once.
+    """
+
+    def __init__(self, tracing=False):
+        self.tracing = tracing
+        self.counters = {}
+        self.histograms = {}
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, bounds=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(bounds)
+            self.histograms[key].observe(value)
+
+    def add_span(self, span):
+        with self._lock:
+            if len(self.spans) < MAX_TRACE_SPANS:
+                self.spans.append(span)
+                return
+        self.count('dropped_spans_total')
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            described = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                _describe(lines, described, name, 'counter')
+                lines.append("{}{} {}".format(_metric_name(name), _format_labels(labels), value))
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                _describe(lines, described, name, 'histogram')
+                for bound, count in histogram.buckets():
+                    lines.append("{}_bucket{} {}".format(_metric_name(name), _format_labels(labels + (('le', bound),)),
+                                                         count))
+                lines.append("{}_sum{} {}".format(_metric_name(name), _format_labels(labels), histogram.sum))
+                lines.append("{}_count{} {}".format(_metric_name(name), _format_labels(labels), histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [{'name': name, 'labels': dict(labels), 'count': histogram.count,
+                                'sum': histogram.sum, 'buckets': histogram.buckets()}
+                               for (name, labels), histogram in sorted(self.histograms.items())],
+                'spans': list(self.spans),
+            }
+
+# Helper function that returns the exported name of the metric `name`
+def _metric_name(name):
+    return "{}_{}".format(PREFIX, name)
+
+# Helper function that adds the help and type lines of the metric `name` before its first sample
+def _describe(lines, described, name, kind):
+    if name in described:
+        return
+    described.add(name)
+    lines.append("# HELP {} {}".format(_metric_name(name), DESCRIPTIONS.get(name, name)))
+    lines.append("# TYPE {} {}".format(_metric_name(name), kind))
+
+# Helper function that formats label pairs in the Prometheus text format
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels) + "}"
+
+# The registry of this process, or `None` while instrumentation is off. Every recording function
+# checks it first, so that instrumentation costs next to nothing unless it is switched on
+_registry = None
+
+# The name of the innermost open span, which becomes the parent of the spans opened inside it
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+# Switch on the recording of metrics, and of a span for every phase with `tracing`
+def enable(tracing=False):
+    global _registry
+    _registry = Registry(tracing)
+
+def disable():
+    global _registry
+    _registry = None
+
+def is_enabled():
+    return _registry is not None
+
+def count(name, amount=1, **labels):
+    if _registry is not None:
+        _registry.count(name, amount, **labels)
+
+def observe(name, value, bounds=LATENCY_BUCKETS, **labels):
+    if _registry is not None:
+        _registry.observe(name, value, bounds, **labels)
+
+# Record that a transaction sent in round `sent_round` was confirmed according to `txinfo`
+def observe_rounds_waited(sent_round, txinfo):
+    if _registry is not None and sent_round is not None and txinfo.get('confirmed-round'):
+        _registry.observe('rounds_waited', txinfo['confirmed-round'] - sent_round, ROUND_BUCKETS)
+
+# Return a context manager timing the phase `name` of an operation into the `phase_seconds`
+# histogram, and keeping it as a span of the trace when tracing
+def span(name, **attributes):
+    if _registry is None:
+        return _NULL_SPAN
+    return _span(name, attributes)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+@contextlib.contextmanager
+def _span(name, attributes):
+    registry = _registry
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    start = time.time()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        _current_span.reset(token)
+        registry.observe('phase_seconds', seconds, phase=name)
+        if registry.tracing:
+            registry.add_span({'name': name, 'parent': parent,
+                               'start': start, 'seconds': seconds, 'error': error, 'attributes': attributes})
+
+# Helper function that turns a request path into an endpoint of bounded cardinality, replacing
+# rounds, IDs, addresses and txids with placeholders
+_ID_SEGMENT = re.compile(r'^[0-9]+$')
+_KEY_SEGMENT = re.compile(r'^[A-Z2-7]{52,58}$')
+
+def endpoint(path):
+    segments = []
+    for segment in path.split('?')[0].split('/'):
+        if _ID_SEGMENT.match(segment):
+            segment = '{id}'
+        elif _KEY_SEGMENT.match(segment):
+            segment = '{key}'
+        segments.append(segment)
+    return '/'.join(segments)
+
+# Record a request to the node that took `seconds`, sending `sent` bytes and receiving `received`
+def observe_node_request(method, path, seconds, sent=0, received=0, failed=False):
+    registry = _registry
+    if registry is None:
+        return
+
+    labels = {'method': method, 'endpoint': endpoint(path)}
+    registry.observe('node_request_seconds', seconds, **labels)
+    if failed:
+        registry.count('node_request_errors_total', **labels)
+    if sent:
+        registry.count('node_sent_bytes_total', sent, endpoint=labels['endpoint'])
+    if received:
+        registry.count('node_received_bytes_total', received, endpoint=labels['endpoint'])
+
+# Write the recorded metrics to `path`, as JSON if it ends in `.json` and otherwise in the
+# Prometheus text format for the textfile collector. The file is replaced atomically, so that
+# a collector never reads it half written
+def export(path):
+    if _registry is None:
+        return
+
+    if path.endswith('.json'):
+        content = json.dumps(_registry.to_json(), indent=1)
+    else:
+        content = _registry.to_prometheus()
+
+    tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_path, 'w') as mfile:
+            mfile.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Leave the previous export in place, without a partial file next to it
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
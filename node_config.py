@@ -0,0 +1,11 @@
+# The node every program of this project connects to. It is kept apart from `run_diploma.py`
+# so that the programs needing only a node, such as `verify.py`, need not import the whole CLI.
+import transport
+
+algod_address = "http://localhost:4001"
+algod_token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
+
+# The most concurrent requests, each over its own kept-alive connection, sent to the node and
+# whether its responses are requested compressed
+algod_max_connections = transport.MAX_CONNECTIONS
+algod_compress = False
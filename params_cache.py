@@ -0,0 +1,150 @@
+import copy
+import json
+import threading
+import time
+import weakref
+
+import algosdk.transaction
+
+# The approximate time in seconds between two rounds, used to age params without asking the node
+ROUND_TIME = 3.3
+
+# The default number of rounds that fetched params are reused for
+REFRESH_ROUNDS = 20
+
+# Fee policy that pays a flat `fee` in microAlgos per transaction
+def flat_fee(fee=1000):
+    def _apply(params):
+        params.flat_fee = True
+        params.fee = fee
+    return _apply
+
+# Fee policy that pays the node's minimum fee scaled by `multiplier`, optionally capped at `max_fee`.
+# Useful to outbid other transactions when the network is congested
+def min_fee(multiplier=1, max_fee=None):
+    def _apply(params):
+        fee = (params.min_fee or 1000) * multiplier
+        params.flat_fee = True
+        params.fee = fee if max_fee is None else min(fee, max_fee)
+    return _apply
+
+# The fee policy used when none is supplied, matching the fee previously hard-coded by every builder
+DEFAULT_FEE_POLICY = flat_fee(1000)
+
+class SuggestedParamsProvider:
+    """Shares one set of suggested params between every transaction builder.
+
+    The params are fetched once and reused until `refresh_rounds` rounds have passed, so
+    building a transaction needs no network I/O. With `background` set, a daemon thread
+    follows the rounds with `status_after_block` and refreshes the params ahead of time.
+    Otherwise the params are aged both by the wall clock and by the latest round reported
+    through `observe_round`, for nodes producing blocks faster, and refetched lazily once
+    they go stale.
+    """
+
+    def __init__(self, client, fee_policy=DEFAULT_FEE_POLICY, refresh_rounds=REFRESH_ROUNDS, background=False):
+        self.client = client
+        self.fee_policy = fee_policy
+        self.refresh_rounds = refresh_rounds
+
+        self._lock = threading.Lock()
+        self._params = None
+        self._fetched_at = 0.0
+        self._last_round = None
+        self._refresh()
+
+        if background:
+            thread = threading.Thread(target=self._follow_rounds, daemon=True)
+            thread.start()
+
+    # Return a private copy of the cached params with the fee policy applied
+    def get(self):
+        with self._lock:
+            stale = time.monotonic() - self._fetched_at > self.refresh_rounds * ROUND_TIME
+            if not stale and self._last_round is not None:
+                stale = self._last_round - self._params.first > self.refresh_rounds
+        if stale:
+            self._refresh()
+
+        with self._lock:
+            params = copy.copy(self._params)
+        self.fee_policy(params)
+        return params
+
+    # Drop the cached params so that the next `get` refetches them, e.g. after a rejected transaction
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = 0.0
+
+    # Record that the node has reached round `rnd`, which ages the cached params
+    def observe_round(self, rnd):
+        with self._lock:
+            if self._last_round is None or rnd > self._last_round:
+                self._last_round = rnd
+
+    def _refresh(self):
+        params = self.client.suggested_params()
+        with self._lock:
+            self._params = params
+            self._fetched_at = time.monotonic()
+
+    # Background loop that refetches the params every `refresh_rounds` rounds
+    def _follow_rounds(self):
+        while True:
+            with self._lock:
+                target_round = self._params.first + self.refresh_rounds
+
+            try:
+                # The node may time out the wait before the `target_round` is reached
+                status = self.client.status_after_block(target_round - 1)
+                self.observe_round(status.get('last-round'))
+                if status.get('last-round') >= target_round:
+                    self._refresh()
+            except Exception:
+                # Keep serving the cached params and retry on the next round
+                time.sleep(ROUND_TIME)
+
+# The providers shared by all builders, one per client
+_providers = weakref.WeakKeyDictionary()
+_providers_lock = threading.Lock()
+
+# Return the provider shared by every builder using `client`, creating it with `options` on first use
+def get_provider(client, **options):
+    with _providers_lock:
+        provider = _providers.get(client)
+        if provider is None:
+            provider = SuggestedParamsProvider(client, **options)
+            _providers[client] = provider
+        return provider
+
+# Report round `rnd` of `client` to its shared provider, if it has one, so that its params age
+def observe_round(client, rnd):
+    with _providers_lock:
+        provider = _providers.get(client)
+    if provider is not None:
+        provider.observe_round(rnd)
+
+# Helper function that returns suggested params for `client` from its shared provider
+def suggested_params(client):
+    return get_provider(client).get()
+
+# Write the raw suggested `params` to the JSON file at `path`, so that transactions can be built
+# on a host without node access
+def save_params(path, params):
+    with open(path, 'w') as pfile:
+        json.dump({
+            'fee': params.fee, 'first': params.first, 'last': params.last,
+            'gh': params.gh, 'gen': params.gen, 'consensus_version': params.consensus_version,
+            'min_fee': params.min_fee,
+        }, pfile)
+
+# Read the suggested params written by `save_params` from `path` with the `fee_policy` applied
+def load_params(path, fee_policy=DEFAULT_FEE_POLICY):
+    with open(path, 'r') as pfile:
+        fields = json.load(pfile)
+
+    params = algosdk.transaction.SuggestedParams(
+        fields['fee'], fields['first'], fields['last'], fields['gh'], fields['gen'],
+        consensus_version=fields['consensus_version'], min_fee=fields['min_fee'])
+    fee_policy(params)
+    return params
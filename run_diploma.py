@@ -1,20 +1,38 @@
+import base64
+import os
 import sys
 import yaml
 
 import algosdk.transaction
-from algosdk import account
-from algosdk.v2client import algod
+from algosdk import account, logic
+
+from assets import diploma_methods as methods
 
 import common
+import diploma_codec
+import async_client
+import params_cache
+import batch
+import build_cache
+import server
+import keystore
+import txnfile
+import journal
+import sync
+import merkle
+import events
+import metrics
+import transport
+from node_config import algod_address, algod_token, algod_max_connections, algod_compress
 
 CONFIG_FILE = "config.yml"
-
-algod_address = "http://localhost:4001"
-algod_token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
+KEYSTORE_FILE = "keystore.db"
+MIRROR_FILE = "mirror.db"
+EVENTS_CHECKPOINT_FILE = "events.checkpoint"
 
 # Declare application state storage (immutable)
 local_ints = 0
-local_bytes = 1
+local_bytes = 2
 global_ints = 0
 global_bytes = 1
 global_schema = algosdk.transaction.StateSchema(global_ints, global_bytes)
@@ -26,35 +44,12 @@ def create_app(client, private_key,
                global_schema, local_schema): 
     print("Creating new app")
 
-    # Define sender as creator
-    sender = account.address_from_private_key(private_key)
-
-    # Declare on_complete as NoOp
-    on_complete = algosdk.transaction.OnComplete.NoOpOC.real
-
-    # Get node suggested parameters
-    params = client.suggested_params()
-    params.flat_fee = True
-    params.fee = 1000
-
-    # Create unsigned transaction
-    txn = algosdk.transaction.ApplicationCreateTxn(
-        sender, params, on_complete, \
-        approval_program, clear_program, \
-        global_schema, local_schema)
-
-    # Sign transaction
-    signed_txn = txn.sign(private_key)
-    tx_id = signed_txn.transaction.get_txid()
-
-    # Send transaction
-    client.send_transactions([signed_txn])
-
-    # Await confirmation
-    common.wait_for_confirmation(client, tx_id)
+    # Run the async operation and await its confirmation
+    transaction_response = async_client.run_sync(
+        client, async_client.create_app, private_key,
+        approval_program, clear_program, global_schema, local_schema)
 
     # Display results
-    transaction_response = client.pending_transaction_info(tx_id)
     app_id = transaction_response['application-index']
     print("Created new app-id: ", app_id)
 
@@ -62,93 +57,54 @@ def create_app(client, private_key,
 
 # Opt-in to application
 def opt_in_app(client, private_key, index): 
-    # Declare sender
-    sender = account.address_from_private_key(private_key)
-    print("Opt-in from account: ", sender)
-
-    # Get node suggested parameters
-    params = client.suggested_params()
-    params.flat_fee = True
-    params.fee = 1000
-
-    # Create unsigned transaction
-    txn = algosdk.transaction.ApplicationOptInTxn(sender, params, index)
-
-    # Sign transaction
-    signed_txn = txn.sign(private_key)
-    tx_id = signed_txn.transaction.get_txid()
-
-    # Send transaction
-    client.send_transactions([signed_txn])
+    print("Opt-in from account: ", account.address_from_private_key(private_key))
 
-    # Await confirmation
-    common.wait_for_confirmation(client, tx_id)
+    # Run the async operation and await its confirmation
+    transaction_response = async_client.run_sync(client, async_client.opt_in_app, private_key, index)
 
     # Display results
-    transaction_response = client.pending_transaction_info(tx_id)
     print("Opt-in to app-id: ", transaction_response['txn']['txn']['apid'])    
 
 # Call application
-def call_app(client, private_key, index, app_args, accounts): 
-    # Declare sender
-    sender = account.address_from_private_key(private_key)
-    print("Call from account: ", sender)
+def call_app(client, private_key, index, app_args, accounts, boxes=None, budget_calls=0): 
+    print("Call from account: ", account.address_from_private_key(private_key))
 
-    # Get node suggested parameters
-    params = client.suggested_params()
-    params.flat_fee = True
-    params.fee = 1000
-
-    # Create unsigned transaction
-    txn = algosdk.transaction.ApplicationNoOpTxn(sender, params, index, app_args, accounts)
-
-    # Sign transaction
-    signed_txn = txn.sign(private_key)
-    tx_id = signed_txn.transaction.get_txid()
-
-    # Send transaction
-    client.send_transactions([signed_txn])
-
-    # Await confirmation
-    common.wait_for_confirmation(client, tx_id)
+    # Run the async operation and await its confirmation
+    transaction_response = async_client.run_sync(
+        client, async_client.call_app_with_budget, private_key, index, app_args, accounts, boxes, budget_calls)
 
     # Display results
-    transaction_response = client.pending_transaction_info(tx_id)
     print("Called app-id: ", transaction_response['txn']['txn']['apid'])
 
     if "global-state-delta" in transaction_response :
         print("Global State updated :\n", transaction_response['global-state-delta'])
     if "local-state-delta" in transaction_response :
         print("Local State updated :\n", transaction_response['local-state-delta'])
+    for log in transaction_response.get('logs', []):
+        print_event(events.decode_event(base64.b64decode(log)))
+
+# Print an event decoded by `events.decode_event` or an `events.Event`
+def print_event(event):
+    if event is None:
+        return
+
+    kind, address, root, diploma = event[-4:]
+    if root is not None:
+        print("Event {}: cohort {}".format(kind, root.hex()))
+    elif diploma is not None:
+        print("Event {}: {} {}".format(kind, address, diploma_codec.describe(diploma)))
+    else:
+        print("Event {}: {}".format(kind, address))
 
 # Update existing application
 def update_app(client, private_key, app_id, approval_program, clear_program): 
     print("Updating existing app")
 
-    # Declare sender
-    sender = account.address_from_private_key(private_key)
-
-    # Get node suggested parameters
-    params = client.suggested_params()
-    params.flat_fee = True
-    params.fee = 1000
-
-    # Create unsigned transaction
-    txn = algosdk.transaction.ApplicationUpdateTxn(sender, params, app_id, \
-                                            approval_program, clear_program) #, app_args)
-
-    # Sign transaction
-    signed_txn = txn.sign(private_key)
-    tx_id = signed_txn.transaction.get_txid()
-
-    # Send transaction
-    client.send_transactions([signed_txn])
-
-    # Await confirmation
-    common.wait_for_confirmation(client, tx_id)
+    # Run the async operation and await its confirmation
+    transaction_response = async_client.run_sync(
+        client, async_client.update_app, private_key, app_id, approval_program, clear_program)
 
     # Display results
-    transaction_response = client.pending_transaction_info(tx_id)
     app_id = transaction_response['txn']['txn']['apid']
     print("Updated existing app-id: ", app_id)
 
@@ -156,86 +112,49 @@ def update_app(client, private_key, app_id, approval_program, clear_program):
 def delete_app(client, private_key, index): 
     print("Deleting app")
 
-    # Declare sender
-    sender = account.address_from_private_key(private_key)
-
-    # Get node suggested parameters
-    params = client.suggested_params()
-    params.flat_fee = True
-    params.fee = 1000
-
-    # Create unsigned transaction
-    txn = algosdk.transaction.ApplicationDeleteTxn(sender, params, index)
-
-    # Sign transaction
-    signed_txn = txn.sign(private_key)
-    tx_id = signed_txn.transaction.get_txid()
-
-    # Send transaction
-    client.send_transactions([signed_txn])
-
-    # Await confirmation
-    common.wait_for_confirmation(client, tx_id)
+    # Run the async operation and await its confirmation
+    transaction_response = async_client.run_sync(client, async_client.delete_app, private_key, index)
 
     # Display results
-    transaction_response = client.pending_transaction_info(tx_id)
     print("Deleted app-id: ",transaction_response['txn']['txn']['apid'])    
 
 # Close out from application
 def close_out_app(client, private_key, index): 
-    # Declare sender
-    sender = account.address_from_private_key(private_key)
-    print("Closing out app for account: ", sender)
-
-    # Get node suggested parameters
-    params = client.suggested_params()
-    params.flat_fee = True
-    params.fee = 1000
-
-    # Create unsigned transaction
-    txn = algosdk.transaction.ApplicationCloseOutTxn(sender, params, index)
-
-    # Sign transaction
-    signed_txn = txn.sign(private_key)
-    tx_id = signed_txn.transaction.get_txid()
-
-    # Send transaction
-    client.send_transactions([signed_txn])
+    print("Closing out app for account: ", account.address_from_private_key(private_key))
 
-    # Await confirmation
-    common.wait_for_confirmation(client, tx_id)
+    # Run the async operation and await its confirmation
+    transaction_response = async_client.run_sync(client, async_client.close_out_app, private_key, index)
 
     # Display results
-    transaction_response = client.pending_transaction_info(tx_id)
     print("Closed out from app-id: ",transaction_response['txn']['txn']['apid'])
 
 # Clear application
 def clear_app(client, private_key, index): 
-    # Declare sender
-    sender = account.address_from_private_key(private_key)
-    print("Clearing app for account: ", sender)
+    print("Clearing app for account: ", account.address_from_private_key(private_key))
 
-    # Get node suggested parameters
-    params = client.suggested_params()
-    params.flat_fee = True
-    params.fee = 1000
+    # Run the async operation and await its confirmation
+    transaction_response = async_client.run_sync(client, async_client.clear_app, private_key, index)
 
-    # Create unsigned transaction
-    txn = algosdk.transaction.ApplicationClearStateTxn(sender, params, index)
-
-    # Sign transaction
-    signed_txn = txn.sign(private_key)
-    tx_id = signed_txn.transaction.get_txid()
+    # Display results
+    print("Cleared app-id: ",transaction_response['txn']['txn']['apid'])    
 
-    # Send transaction
-    client.send_transactions([signed_txn])
+# Fund the application account, which holds the minimum balance of the diploma boxes
+def fund_app(client, private_key, index, amount):
+    app_address = logic.get_application_address(index)
+    print("Funding app account {} with {} microAlgos".format(app_address, amount))
 
-    # Await confirmation
-    common.wait_for_confirmation(client, tx_id)
+    # Run the async operation and await its confirmation
+    transaction_response = async_client.run_sync(client, async_client.pay, private_key, app_address, amount)
 
     # Display results
-    transaction_response = client.pending_transaction_info(tx_id)
-    print("Cleared app-id: ",transaction_response['txn']['txn']['apid'])    
+    print("Funded in round: ", transaction_response['confirmed-round'])
+
+# Import the accounts of the configuration file into the keystore, returning their number. The
+# stat and digest are taken first, so that a change while parsing is imported again by the next session
+def import_keystore():
+    stat = keystore.config_stat(CONFIG_FILE)
+    digest = keystore.config_digest(CONFIG_FILE)
+    return keystore.import_accounts(KEYSTORE_FILE, *parse_config(), digest=digest, stat=stat)
 
 def parse_config():
     err_msg = """Malformed configuration file: """
@@ -279,118 +198,173 @@ def parse_config():
     # Return the parsed values
     return registrar, accounts, APP_ID
 
-def main():
-    help_msg = """Available commands:
+HELP_MSG = """Available commands:
         deploy: Deploy this smart contract for the first time
         update: Update this smart contract with new TEAL code
         opt-in <account-name>: Opt-in an account into this smart contract
         close-out <account-name>: Close-out an account from this smart contract
         delete: Delete this smart contract
         clear <account-name>: Clear this smart contract
-        issue-diploma <account-name> <diploma-metadata>: Issue a degree to an account
-        revoke-diploma <account-name>: Nullify the diploma of an account
-        inspect <account-name>: Inspect an account's diploma on the Algorand blockchain
-        inspect-global <creator-name>: Inspect this smart contract's global state
+        issue-diploma <account-name> <diploma-metadata> <degree-duration>: Issue a degree to an account
+        issue-diploma-batch <diploma-file> [sign-workers] [--journal <journal-file>]: Issue the degrees listed in a CSV
+            or JSONL file, recording their progress in a journal that a rerun resumes from
+        export-params <params-file>: Save the node's suggested parameters for an offline prepare
+        prepare <diploma-file> <params-file> <signed-file> [sign-workers]: Sign the degrees of a file offline
+        submit <signed-file> [offset]: Send the signed degrees of a file, resuming where it stopped
+        revoke-diploma <account-name> [cohort-root]: Nullify the diploma of an account, and keep it from being
+            verified or claimed from a cohort
+        reinstate-diploma <account-name> <cohort-root>: Lift the revocation of an account's degree from a cohort
+        revoke-diploma-batch <student-file> [--journal <journal-file>]: Nullify the diplomas of the students listed
+            in a file
+        job-status <journal-file>: Print how many rows of a journaled batch are in each state, and why any failed
+        fund-app <micro-algos>: Fund this smart contract's account to hold diploma boxes
+        issue-diploma-box <account-name> <diploma-metadata> <degree-duration>: Issue a degree into a box, without opt-in
+        issue-diploma-box-batch <diploma-file> [sign-workers] [--journal <journal-file>]: Issue the degrees listed in
+            a file into boxes
+        revoke-diploma-box <account-name> [cohort-root]: Delete the diploma box of an account, and keep it from
+            being verified or claimed from a cohort
+        commit-cohort <diploma-file> <proofs-file>: Commit the degrees of a file as one Merkle root, writing their proofs
+        revoke-cohort <cohort-root>: Revoke every degree of a committed cohort
+        verify-proof <proofs-file> <account-name>: Check the proof of an account's degree in a cohort
+        claim-diploma <proofs-file> <account-name>: Move an account's degree of a cohort into its local storage
+        inspect <account-name> [--local]: Inspect an account's diploma on the Algorand blockchain, or in the local mirror
+        inspect-box <account-name>: Inspect an account's diploma box on the Algorand blockchain
+        inspect-many <student-file>: Inspect the diplomas of the students listed in a file
+        inspect-global: Inspect this smart contract's global state
+        sync [start-round]: Mirror the diplomas into a local database, following new blocks
+        events [start-round]: Print the events of this smart contract, following new blocks
         reassign-registrar <account-name>: Assign an account to be the current registrar
-        help: Print this help message""" 
-
-    if len(sys.argv) < 2:
-        print("Must supply at least command argument")
-        print(help_msg)
-        return
-
-    try:
-        registrar, accounts, APP_ID = parse_config()
-    except ValueError as e:
-        # There was an error
-        print(e)
-        return
-
-    # Initialize an `AlgodClient`
-    algod_client = algod.AlgodClient(algod_token, algod_address)
-
-    # Define the public and private keys
-    pub_keys = {name: common.get_public_key_from_mnemonic(mnemonic) for (name, mnemonic) in accounts.items()}
-    priv_keys = {name: common.get_private_key_from_mnemonic(mnemonic) for (name, mnemonic) in accounts.items()}
-
-    if sys.argv[1] == "deploy" or sys.argv[1] == "update":
+        import-keystore: Import the accounts of the configuration file into the keystore
+        serve [socket-path]: Run commands sent over a Unix socket, or stdin, with a warm client
+        help: Print this help message
+
+Options, given before the command:
+        --metrics <metrics-file>: Record the latency, count and size of every node request and the time of every
+            phase, written to a Prometheus textfile, or to JSON if the file name ends in .json
+        --trace: With --metrics, also record every phase as a span of a trace, written to the JSON file only"""
+
+class Session:
+    """The parsed configuration, node client and account keys shared by every command.
+
+    Loading a session is the expensive part of a command, so a long-running
+    server loads it once and reuses it for every command it runs. The accounts
+    are read from the keystore when one has been imported, otherwise from the
+    configuration file. Either way, each key is only decoded when first used.
+    """
+
+    def __init__(self):
+        if os.path.exists(KEYSTORE_FILE):
+            store = keystore.Keystore(KEYSTORE_FILE)
+
+            # A keystore imported before the configuration file last changed is imported again
+            if os.path.exists(CONFIG_FILE) and store.config_changed(CONFIG_FILE):
+                store.close()
+                print("{} changed since it was imported, importing it into {} again".format(CONFIG_FILE, KEYSTORE_FILE))
+                import_keystore()
+                store = keystore.Keystore(KEYSTORE_FILE)
+
+            self.registrar, self.APP_ID = store.registrar, store.app_id
+            self.pub_keys, self.priv_keys = store.pub_keys, store.priv_keys
+        else:
+            self.registrar, accounts, self.APP_ID = parse_config()
+            self.pub_keys, self.priv_keys = keystore.config_keys(accounts)
+
+        # Initialize an `AlgodClient` reusing its connections to the node
+        self.client = transport.PooledAlgodClient(algod_token, algod_address, max_connections=algod_max_connections,
+                                                  compress=algod_compress)
+        self._mirror = None
+
+    # Open the local mirror on first use, so that only the commands reading it pay for it
+    def mirror(self):
+        if self._mirror is None:
+            self._mirror = sync.Mirror(MIRROR_FILE, self.APP_ID)
+        return self._mirror
+
+# Run the command given by `args`, the command line arguments without the program name
+def run_command(session, args):
+    algod_client = session.client
+    registrar = session.registrar
+    APP_ID = session.APP_ID
+    pub_keys = session.pub_keys
+    priv_keys = session.priv_keys
+
+    if args[0] == "deploy" or args[0] == "update":
         # The `deploy` and `update` commands take no additional arguments
-        if len(sys.argv) != 2:
-            print(help_msg)
+        if len(args) != 1:
+            print(HELP_MSG)
             return
 
-        # Read the smart contract source files
-        smart_contract_file = open("./artifacts/diploma_smart_contract.teal", "rb")
-        smart_contract_source = smart_contract_file.read()
-        smart_contract_program = common.compile_program(algod_client, smart_contract_source)
-
-        clear_program_file = open("./artifacts/clear_program.teal", "rb")
-        clear_program_source = clear_program_file.read()
-        clear_program = common.compile_program(algod_client, clear_program_source)
+        # Load the assembled programs, only compiling them when their sources changed
+        smart_contract_program = build_cache.compiled_program(algod_client, "diploma_smart_contract")
+        clear_program = build_cache.compiled_program(algod_client, "clear_program")
 
         # If this is a first time deploy
-        if sys.argv[1] == "deploy":
+        if args[0] == "deploy":
             # Create the diploma application
             app_id = create_app(algod_client, priv_keys[registrar], smart_contract_program, clear_program, global_schema, local_schema)
 
             print("Record the APP_ID {} in {}".format(app_id, CONFIG_FILE))
-        elif sys.argv[1] == "update":
+            if os.path.exists(KEYSTORE_FILE):
+                print("Then rerun import-keystore to update {}".format(KEYSTORE_FILE))
+        elif args[0] == "update":
             # This is a update to the smart contract
             update_app(algod_client, priv_keys[registrar], APP_ID, smart_contract_program, clear_program)
 
-        # Clean up the source files
-        smart_contract_file.close()
-        clear_program_file.close()
-
-    elif sys.argv[1] == "opt-in":
+    elif args[0] == "opt-in":
         # The `opt-in` command takes one additional argument
-        if len(sys.argv) != 3:
-            print(help_msg)
+        if len(args) != 2:
+            print(HELP_MSG)
             return
 
-        account = sys.argv[2]
+        account = args[1]
 
         # Opt-in to the `account`
         opt_in_app(algod_client, priv_keys[account], APP_ID)
 
-    elif sys.argv[1] == "close-out":
+    elif args[0] == "close-out":
         # The `close-out` command takes one additional arguments
-        if len(sys.argv) != 3:
-            print(help_msg)
+        if len(args) != 2:
+            print(HELP_MSG)
             return
 
-        account = sys.argv[2]
+        account = args[1]
 
         # Close out the `account`
         close_out_app(algod_client, priv_keys[account], APP_ID)
 
-    elif sys.argv[1] == "delete":
+    elif args[0] == "delete":
         # The `delete` command takes no additional arguments
-        if len(sys.argv) != 2:
-            print(help_msg)
+        if len(args) != 1:
+            print(HELP_MSG)
             return
 
         delete_app(algod_client, priv_keys[registrar], APP_ID)
 
-    elif sys.argv[1] == "clear":
+    elif args[0] == "clear":
         # The `clear` command takes one additional arguments
-        if len(sys.argv) != 3:
-            print(help_msg)
+        if len(args) != 2:
+            print(HELP_MSG)
             return
 
-        account = sys.argv[2]
+        account = args[1]
         clear_app(algod_client, priv_keys[account], APP_ID)
 
-    elif sys.argv[1] == "issue-diploma":
-        # The `issue-diploma` command takes two additional arguments
-        if len(sys.argv) != 4:
-            print(help_msg)
+    elif args[0] == "issue-diploma":
+        # The `issue-diploma` command takes three additional arguments
+        if len(args) != 4:
+            print(HELP_MSG)
             return
 
-        student = sys.argv[2]
-        diploma_metadata = sys.argv[3]
+        student = args[1]
+        diploma_metadata = args[2]
+        degree_duration = int(args[3])
 
-        app_args = [b'issue_diploma', bytes(diploma_metadata, 'utf-8')]
+        try:
+            app_args = batch.issue_diploma_args(diploma_codec.encode(diploma_metadata, degree_duration))
+        except ValueError as e:
+            # The diploma does not fit the compact encoding or the registry
+            print(e)
+            return
         accounts = [pub_keys[student]]
 
         print("Issuing diploma for {}: {}".format(student, diploma_metadata))
@@ -398,51 +372,442 @@ def main():
         # Call application with the relevant arguments
         call_app(algod_client, priv_keys[registrar], APP_ID, app_args, accounts)
 
-    elif sys.argv[1] == "revoke-diploma":
-        # The `revoke-diploma` command takes one additional argument
-        if len(sys.argv) != 3:
-            print(help_msg)
+    elif args[0] == "issue-diploma-batch" or args[0] == "issue-diploma-box-batch":
+        # The `issue-diploma-batch` and `issue-diploma-box-batch` commands take one or two additional
+        # arguments and an optional `--journal` file
+        journal_file, args = parse_journal(args)
+        if len(args) not in (2, 3):
+            print(HELP_MSG)
+            return
+
+        diploma_file = args[1]
+        sign_workers = int(args[2]) if len(args) == 3 else None
+        boxes = args[0] == "issue-diploma-box-batch"
+
+        # Stream the rows of the `diploma_file`, where students may also be referenced by name
+        resolve_student = lambda student: pub_keys.get(student, student)
+        rows = batch.read_diploma_rows(diploma_file, resolve_student)
+
+        try:
+            # Every row is checked before anything is sent. A journal packs all of them up front anyway
+            if journal_file is None:
+                batch.validate_diploma_file(diploma_file, resolve_student)
+
+            if journal_file is not None:
+                issued, failed = journal.issue_diplomas(algod_client, journal_file, priv_keys[registrar], APP_ID, rows,
+                                                        sign_workers=sign_workers, boxes=boxes)
+            else:
+                issued, failed = batch.issue_diplomas_batch(algod_client, priv_keys[registrar], APP_ID, rows,
+                                                            sign_workers=sign_workers, boxes=boxes)
+        except ValueError as e:
+            # There was an error in the `diploma_file`
+            print(e)
+            return
+
+        print("Issued {} diplomas, {} failed".format(issued, failed))
+
+    elif args[0] == "export-params":
+        # The `export-params` command takes one additional argument
+        if len(args) != 2:
+            print(HELP_MSG)
+            return
+
+        params_file = args[1]
+        params_cache.save_params(params_file, algod_client.suggested_params())
+        print("Saved the suggested parameters to {}".format(params_file))
+
+    elif args[0] == "prepare":
+        # The `prepare` command takes three or four additional arguments
+        if len(args) not in (4, 5):
+            print(HELP_MSG)
+            return
+
+        diploma_file, params_file, signed_file = args[1:4]
+        sign_workers = int(args[4]) if len(args) == 5 else None
+
+        # Only the registrar key is needed here, the node is never contacted
+        rows = batch.read_diploma_rows(diploma_file, lambda student: pub_keys.get(student, student))
+        params = params_cache.load_params(params_file)
+
+        try:
+            # Check every row before the `signed_file` is started, so that no partial file is left behind
+            batch.validate_diploma_file(diploma_file, lambda student: pub_keys.get(student, student))
+            num_groups = txnfile.prepare_diplomas(signed_file, params, priv_keys[registrar], APP_ID, rows,
+                                                  sign_workers=sign_workers)
+        except ValueError as e:
+            # There was an error in the `diploma_file`
+            print(e)
+            return
+
+        print("Signed {} groups valid until round {} into {}".format(num_groups, params.last, signed_file))
+
+    elif args[0] == "submit":
+        # The `submit` command takes one or two additional arguments
+        if len(args) not in (2, 3):
+            print(HELP_MSG)
+            return
+
+        signed_file = args[1]
+        offset = int(args[2]) if len(args) == 3 else None
+
+        try:
+            confirmed, failed = txnfile.submit_file(algod_client, signed_file, offset)
+        except ValueError as e:
+            # The `signed_file` is not a valid signed transaction file
+            print(e)
             return
 
-        student = sys.argv[2]
+        print("Issued {} diplomas, {} failed".format(confirmed, failed))
+
+    elif args[0] == "revoke-diploma":
+        # The `revoke-diploma` command takes one or two additional arguments
+        if len(args) not in (2, 3):
+            print(HELP_MSG)
+            return
 
-        app_args = [b'revoke_diploma']
+        student = args[1]
+
+        app_args = [methods.REVOKE_DIPLOMA]
         accounts = [pub_keys[student]]
+        boxes = []
+        if len(args) == 3:
+            # The diploma was committed in a cohort, so its revocation is recorded in a box
+            root = bytes.fromhex(args[2])
+            app_args.append(root)
+            boxes.append(merkle.revocation_box(pub_keys[student], root))
+
+        # A diploma claimed from a cohort is revoked from it too, so its box is referenced
+        claimed_root = (common.get_local_state(algod_client, pub_keys[student], APP_ID) or {}).get('claimed')
+        if claimed_root is not None and merkle.revocation_box(pub_keys[student], claimed_root) not in boxes:
+            boxes.append(merkle.revocation_box(pub_keys[student], claimed_root))
 
         print("Revoking diploma for {}".format(student))
+        if boxes:
+            print("The app account must hold {} more microAlgos for this revocation".format(
+                merkle.REVOCATION_MIN_BALANCE))
 
         # Call application with the relevant arguments
-        call_app(algod_client, priv_keys[registrar], APP_ID, app_args, accounts)
+        call_app(algod_client, priv_keys[registrar], APP_ID, app_args, accounts, boxes)
+
+    elif args[0] == "reinstate-diploma":
+        # The `reinstate-diploma` command takes two additional arguments
+        if len(args) != 3:
+            print(HELP_MSG)
+            return
+
+        student = args[1]
+        root = bytes.fromhex(args[2])
+
+        app_args = [methods.REINSTATE_DIPLOMA, root]
+        accounts = [pub_keys[student]]
+        boxes = [merkle.revocation_box(pub_keys[student], root)]
+
+        print("Reinstating the diploma of {} in the cohort with root {}".format(student, root.hex()))
+
+        # Call application with the relevant arguments
+        call_app(algod_client, priv_keys[registrar], APP_ID, app_args, accounts, boxes)
+
+    elif args[0] == "revoke-diploma-batch":
+        # The `revoke-diploma-batch` command takes one additional argument and an optional `--journal` file
+        journal_file, args = parse_journal(args)
+        if len(args) != 2:
+            print(HELP_MSG)
+            return
+
+        # Stream the students, one address or account name per line, of the `student_file`
+        student_file = args[1]
+        with open(student_file, 'r') as sfile:
+            students = (line.strip() for line in sfile if line.strip())
+            addrs = (pub_keys.get(student, student) for student in students)
+
+            try:
+                if journal_file is not None:
+                    revoked, failed = journal.revoke_diplomas(algod_client, journal_file, priv_keys[registrar], APP_ID,
+                                                              addrs)
+                else:
+                    revoked, failed = batch.revoke_diplomas_batch(algod_client, priv_keys[registrar], APP_ID, addrs)
+            except ValueError as e:
+                # The journal holds another job
+                print(e)
+                return
+
+        print("Revoked {} diplomas, {} failed".format(revoked, failed))
+
+    elif args[0] == "job-status":
+        # The `job-status` command takes one additional argument
+        if len(args) != 2:
+            print(HELP_MSG)
+            return
 
-    elif sys.argv[1] == "inspect":
-        # The `inspect` command takes one additional argument
-        if len(sys.argv) != 3:
-            print(help_msg)
+        journal_file = args[1]
+        if not os.path.exists(journal_file):
+            print("No journal at {}".format(journal_file))
+            return
+
+        job = journal.Journal(journal_file)
+        try:
+            if job.kind is None:
+                print("{} holds no job".format(journal_file))
+                return
+
+            print("{} job of app-id {} from {}".format(job.kind, job.app_id, job.sender))
+            for state, num_rows in job.counts().items():
+                print("  {}: {}".format(state, num_rows))
+            for student, error in job.failed_rows():
+                print("Failed {}: {}".format(student, error))
+        finally:
+            job.close()
+
+    elif args[0] == "fund-app":
+        # The `fund-app` command takes one additional argument
+        if len(args) != 2:
+            print(HELP_MSG)
+            return
+
+        amount = int(args[1])
+        fund_app(algod_client, priv_keys[registrar], APP_ID, amount)
+
+    elif args[0] == "issue-diploma-box":
+        # The `issue-diploma-box` command takes three additional arguments
+        if len(args) != 4:
+            print(HELP_MSG)
+            return
+
+        student = args[1]
+        diploma_metadata = args[2]
+        degree_duration = int(args[3])
+
+        try:
+            app_args = batch.issue_diploma_args(diploma_codec.encode(diploma_metadata, degree_duration),
+                                                boxes=True)
+        except ValueError as e:
+            # The diploma does not fit the compact encoding or the registry
+            print(e)
+            return
+        accounts = [pub_keys[student]]
+        boxes = [common.diploma_box(pub_keys[student])]
+
+        print("Issuing diploma box for {}: {}".format(student, diploma_metadata))
+        print("The app account must hold {} more microAlgos for this box".format(
+            common.diploma_box_min_balance(app_args[1])))
+
+        # Call application with the relevant arguments
+        call_app(algod_client, priv_keys[registrar], APP_ID, app_args, accounts, boxes)
+
+    elif args[0] == "revoke-diploma-box":
+        # The `revoke-diploma-box` command takes one or two additional arguments
+        if len(args) not in (2, 3):
+            print(HELP_MSG)
+            return
+
+        student = args[1]
+
+        app_args = [methods.REVOKE_DIPLOMA_BOX]
+        accounts = [pub_keys[student]]
+        boxes = [common.diploma_box(pub_keys[student])]
+        if len(args) == 3:
+            # The diploma was also committed in a cohort, so its revocation is recorded in a box
+            root = bytes.fromhex(args[2])
+            app_args.append(root)
+            boxes.append(merkle.revocation_box(pub_keys[student], root))
+
+        print("Revoking diploma box for {}".format(student))
+
+        # Call application with the relevant arguments
+        call_app(algod_client, priv_keys[registrar], APP_ID, app_args, accounts, boxes)
+
+    elif args[0] == "commit-cohort":
+        # The `commit-cohort` command takes two additional arguments
+        if len(args) != 3:
+            print(HELP_MSG)
+            return
+
+        diploma_file = args[1]
+        proofs_file = args[2]
+
+        # Stream the rows of the `diploma_file` once to build the tree and again to write the proofs
+        resolve_student = lambda student: pub_keys.get(student, student)
+        try:
+            tree = merkle.build_cohort(batch.read_diploma_rows(diploma_file, resolve_student))
+            merkle.write_proofs(proofs_file, tree, batch.read_diploma_rows(diploma_file, resolve_student))
+        except ValueError as e:
+            # There was an error in the `diploma_file`
+            print(e)
+            return
+
+        app_args = [methods.COMMIT_COHORT, tree.root]
+        boxes = [merkle.cohort_box(tree.root)]
+
+        print("Committing a cohort of {} diplomas with root {}".format(len(tree), tree.root.hex()))
+        print("The app account must hold {} more microAlgos for this cohort".format(merkle.COHORT_MIN_BALANCE))
+
+        # Call application with the relevant arguments
+        call_app(algod_client, priv_keys[registrar], APP_ID, app_args, [], boxes)
+        print("Wrote the proof of every diploma to {}".format(proofs_file))
+
+    elif args[0] == "revoke-cohort":
+        # The `revoke-cohort` command takes one additional argument
+        if len(args) != 2:
+            print(HELP_MSG)
+            return
+
+        root = bytes.fromhex(args[1])
+
+        app_args = [methods.REVOKE_COHORT, root]
+        boxes = [merkle.cohort_box(root)]
+
+        print("Revoking the cohort with root {}".format(root.hex()))
+
+        # Call application with the relevant arguments
+        call_app(algod_client, priv_keys[registrar], APP_ID, app_args, [], boxes)
+
+    elif args[0] == "verify-proof" or args[0] == "claim-diploma":
+        # The `verify-proof` and `claim-diploma` commands take two additional arguments
+        if len(args) != 3:
+            print(HELP_MSG)
+            return
+
+        proofs_file = args[1]
+        student = args[2]
+
+        # Students may be referenced by their account name in the configuration file
+        try:
+            record = merkle.find_proof(proofs_file, pub_keys.get(student, student))
+        except ValueError as e:
+            # There was an error in the `proofs_file`
+            print(e)
+            return
+
+        if record is None:
+            print("No proof for {} in {}".format(student, proofs_file))
+            return
+
+        # The proof is checked locally before anything is sent
+        if not merkle.verify_record(record):
+            print("The proof of {} does not lead to root {}".format(student, record['root'].hex()))
+            return
+
+        if args[0] == "verify-proof":
+            committed_round = merkle.get_cohort_round(algod_client, APP_ID, record['root'])
+            revoked_round = merkle.get_revocation_round(algod_client, APP_ID, record['student'], record['root'])
+            if committed_round is None:
+                print("The proof of {} is valid, but its cohort is not committed".format(student))
+            elif revoked_round is not None:
+                print("The proof of {} is valid, but its diploma was revoked in round {}".format(
+                    student, revoked_round))
+            else:
+                print("The proof of {} is valid, its cohort was committed in round {}".format(
+                    student, committed_round))
+                print("\t", "diploma", diploma_codec.describe(record['diploma']))
+            return
+
+        app_args = merkle.proof_args(record, claim=True)
+        accounts = [record['student']]
+        boxes = [merkle.cohort_box(record['root']), merkle.revocation_box(record['student'], record['root'])]
+
+        print("Claiming the diploma of {} into its local storage".format(student))
+
+        # The student sends the claim, grouped with the calls pooling the budget of its proof
+        call_app(algod_client, priv_keys[student], APP_ID, app_args, accounts, boxes,
+                 merkle.budget_calls(len(record['proof'])))
+
+    elif args[0] == "inspect-box":
+        # The `inspect-box` command takes one additional argument
+        if len(args) != 2:
+            print(HELP_MSG)
+            return
+
+        # Inspect the diploma box of an account supplied by name
+        account = args[1]
+        common.read_box_diploma(algod_client, pub_keys[account], APP_ID)
+
+    elif args[0] == "inspect":
+        # The `inspect` command takes one additional argument and an optional `--local` flag
+        if len(args) not in (2, 3) or (len(args) == 3 and args[2] != "--local"):
+            print(HELP_MSG)
             return
 
         # Inspect an account supplied by name
-        account = sys.argv[2]
-        common.read_local_state(algod_client, pub_keys[account], APP_ID)
+        account = args[1]
+        if len(args) == 3:
+            # Answer from the local mirror, without contacting the node
+            if not os.path.exists(MIRROR_FILE):
+                print("No local mirror in {}, run sync first".format(MIRROR_FILE))
+                return
+            sync.read_mirror_diplomas(session.mirror(), pub_keys[account])
+        else:
+            common.read_local_state(algod_client, pub_keys[account], APP_ID)
+
+    elif args[0] == "sync":
+        # The `sync` command takes at most one additional argument
+        if len(args) > 2:
+            print(HELP_MSG)
+            return
+
+        start_round = int(args[1]) if len(args) == 2 else None
 
-    elif sys.argv[1] == "inspect-global":
-        # The `inspect-global` command takes one additional argument
-        if len(sys.argv) != 3:
-            print(help_msg)
+        try:
+            # Catch up from the checkpoint and keep following new blocks
+            session.mirror().sync(algod_client, start_round, follow=True)
+        except ValueError as e:
+            # The first sync was not given a start round
+            print(e)
+
+    elif args[0] == "events":
+        # The `events` command takes at most one additional argument
+        if len(args) > 2:
+            print(HELP_MSG)
+            return
+
+        start_round = int(args[1]) if len(args) == 2 else None
+
+        try:
+            # Resume from the checkpoint and keep following new blocks
+            for event in events.follow_events(algod_client, APP_ID, start_round, EVENTS_CHECKPOINT_FILE):
+                print("Round {}:".format(event.round), end=" ")
+                print_event(event)
+        except ValueError as e:
+            # The first run was not given a start round
+            print(e)
+
+    elif args[0] == "inspect-many":
+        # The `inspect-many` command takes one additional argument
+        if len(args) != 2:
+            print(HELP_MSG)
             return
 
-        # Inspect this app by its `creator`
-        creator = sys.argv[2]
-        common.read_global_state(algod_client, pub_keys[creator], APP_ID)
+        # Stream the students, one address or account name per line, of the `student_file`
+        student_file = args[1]
+        with open(student_file, 'r') as sfile:
+            students = (line.strip() for line in sfile if line.strip())
+            addrs = (pub_keys.get(student, student) for student in students)
+
+            for addr, local_state in common.get_local_states(algod_client, addrs, APP_ID):
+                if local_state is None:
+                    print("{}: not opted in".format(addr))
+                elif 'diploma' not in local_state:
+                    print("{}: no diploma".format(addr))
+                else:
+                    print("{}: {}".format(addr, diploma_codec.describe(local_state['diploma'])))
+
+    elif args[0] == "inspect-global":
+        # The `inspect-global` command takes at most one additional argument. The
+        # `creator` was once needed to find the app and is now accepted but unused
+        if len(args) > 2:
+            print(HELP_MSG)
+            return
 
-    elif sys.argv[1] == "reassign-registrar":
+        common.read_global_state(algod_client, APP_ID)
+
+    elif args[0] == "reassign-registrar":
         # The `reassign-registrar` command takes one additional argument
-        if len(sys.argv) != 3:
-            print(help_msg)
+        if len(args) != 2:
+            print(HELP_MSG)
             return
 
-        new_registrar = sys.argv[2]
+        new_registrar = args[1]
 
-        app_args = [b'reassign_registrar']
+        app_args = [methods.REASSIGN_REGISTRAR]
         accounts = [pub_keys[new_registrar]]
 
         print("Reassigning the registrar to be {}".format(new_registrar))
@@ -450,12 +815,108 @@ def main():
         # Call application with the relevant arguments
         call_app(algod_client, priv_keys[registrar], APP_ID, app_args, accounts)
 
-    elif sys.argv[1] == "help":
-        print(help_msg)
+    elif args[0] == "import-keystore":
+        # The `import-keystore` command takes no additional arguments
+        if len(args) != 1:
+            print(HELP_MSG)
+            return
+
+        # Re-read the configuration file since the session may come from the keystore
+        num_accounts = import_keystore()
+        print("Imported {} accounts from {} into {}".format(num_accounts, CONFIG_FILE, KEYSTORE_FILE))
+
+    elif args[0] == "help":
+        print(HELP_MSG)
 
     else:
-        print("Invalid command and arguments: {}".format(sys.argv[1:]))
-        print(help_msg)
+        print("Invalid command and arguments: {}".format(args))
+        print(HELP_MSG)
+
+# Helper function that splits the `--journal <journal-file>` option off the end of the `args` of a
+# batch command, returning the journal file, or `None`, and the remaining arguments
+def parse_journal(args):
+    if len(args) >= 2 and args[-2] == "--journal":
+        return args[-1], args[:-2]
+    return None, args
+
+# Parse the options given before the command, returning the metrics file and the remaining arguments
+def parse_options(args):
+    metrics_file = None
+    tracing = False
+    while args and args[0] in ("--metrics", "--trace"):
+        if args[0] == "--metrics":
+            if len(args) < 2:
+                raise ValueError("--metrics requires a file name")
+            metrics_file = args[1]
+            args = args[2:]
+        else:
+            tracing = True
+            args = args[1:]
+
+    if tracing and metrics_file is None:
+        raise ValueError("--trace requires --metrics")
+    if metrics_file is not None:
+        metrics.enable(tracing)
+    return metrics_file, args
+
+# Helper function that returns `run_command` writing the metrics to `metrics_file` after every
+# command, so that a long-running server keeps the file current
+def exporting_run_command(metrics_file):
+    def _run_command(session, args):
+        try:
+            with metrics.span("command", command=args[0] if args else None):
+                run_command(session, args)
+        finally:
+            metrics.export(metrics_file)
+    return _run_command
+
+def main():
+    try:
+        metrics_file, args = parse_options(sys.argv[1:])
+    except ValueError as e:
+        print(e)
+        print(HELP_MSG)
+        return
+
+    if len(args) < 1:
+        print("Must supply at least command argument")
+        print(HELP_MSG)
+        return
+
+    # The `help` command needs no configuration
+    if args[0] == "help":
+        print(HELP_MSG)
+        return
+
+    try:
+        session = Session()
+    except ValueError as e:
+        # There was an error
+        print(e)
+        return
+
+    command = run_command if metrics_file is None else exporting_run_command(metrics_file)
+
+    if args[0] == "serve":
+        # The `serve` command takes at most one additional argument
+        if len(args) > 2:
+            print(HELP_MSG)
+            return
+
+        # Keep the suggested parameters fresh in the background for every command
+        params_cache.get_provider(session.client, background=True)
+
+        if len(args) == 2:
+            try:
+                server.serve_socket(session, command, args[1])
+            except ValueError as e:
+                # The socket path is taken by something else
+                print(e)
+        else:
+            server.serve_stdin(session, command)
+        return
+
+    command(session, args)
 
     # TODO: Handle multiple diplomas
 
@@ -0,0 +1,152 @@
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# The number of commands run concurrently when reading commands from stdin
+STDIN_WORKERS = 16
+
+# The commands that keep following new blocks and never return. Each would hold a worker thread
+# of the server for good, so they are rejected and must be run on their own
+FOLLOWING_COMMANDS = {"sync", "events", "serve"}
+
+class _ThreadLocalStdout(io.TextIOBase):
+    """Routes `print` output into the buffer of the command running on the current thread.
+
+    Commands report their progress with `print`, so every command thread gets its own
+    buffer while output from any other thread still reaches the real stdout, which
+    `serve_stdin` points at stderr.
+    """
+
+    def __init__(self, stdout):
+        self._stdout = stdout
+        self._local = threading.local()
+
+    def capture(self):
+        self._local.buffer = io.StringIO()
+
+    def release(self):
+        output = self._local.buffer.getvalue()
+        self._local.buffer = None
+        return output
+
+    def write(self, text):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            return self._stdout.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        self._stdout.flush()
+
+def _install_stdout():
+    if not isinstance(sys.stdout, _ThreadLocalStdout):
+        sys.stdout = _ThreadLocalStdout(sys.stdout)
+    return sys.stdout
+
+# Run one request with the `run_command` of `run_diploma.py` and build its response. A request is
+# a JSON object with the command line `args` and an optional `id` echoed back in the response
+def handle_request(session, run_command, line):
+    stdout = _install_stdout()
+
+    try:
+        request = json.loads(line)
+        args = request['args']
+        if not isinstance(args, list) or not args:
+            raise ValueError("args must be a non-empty list")
+    except (ValueError, KeyError, TypeError) as e:
+        return {'ok': False, 'output': "Malformed request: {}".format(e)}
+
+    if str(args[0]) in FOLLOWING_COMMANDS:
+        response = {'ok': False, 'output': "The {} command never returns, so it is not run by the server\n".format(
+            args[0])}
+    else:
+        stdout.capture()
+        ok = True
+        try:
+            run_command(session, [str(arg) for arg in args])
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+            ok = False
+
+        response = {'ok': ok, 'output': stdout.release()}
+    if 'id' in request:
+        response['id'] = request['id']
+    return response
+
+# Serve the commands of `run_command` on a Unix socket at `path`. Every connection may send any
+# number of newline-delimited requests and is served on its own thread
+def serve_socket(session, run_command, path):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                response = handle_request(session, run_command, line)
+                self.wfile.write((json.dumps(response) + "\n").encode())
+
+    # Remove a stale socket left behind by a previous server, but nothing else at its path
+    if os.path.lexists(path):
+        path_stat = os.lstat(path)
+        if not stat.S_ISSOCK(path_stat.st_mode) or path_stat.st_uid != os.getuid():
+            raise ValueError("Refusing to replace {}, which is not a socket owned by this user".format(path))
+        os.remove(path)
+
+    # Every command is signed with the registrar key, so only this user may connect. The socket
+    # is created without any access for the group or others, as the keystore file is
+    old_umask = os.umask(0o077)
+    try:
+        unix_server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    finally:
+        os.umask(old_umask)
+
+    with unix_server:
+        unix_server.daemon_threads = True
+        print("Serving commands on {}".format(path))
+        try:
+            unix_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+
+# Serve the commands of `run_command` read as newline-delimited requests from stdin. Up to
+# `workers` commands run concurrently, so responses are written in completion order. Responses
+# are written to a private duplicate of the stdout file descriptor, which is then pointed at
+# stderr, so that the output of threads that run no command, such as the workers a command
+# starts, cannot corrupt the stream of responses
+def serve_stdin(session, run_command, workers=STDIN_WORKERS):
+    sys.stdout.flush()
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    _install_stdout()
+    write_lock = threading.Lock()
+
+    def _serve(line):
+        response = handle_request(session, run_command, line)
+        with write_lock:
+            responses.write(json.dumps(response) + "\n")
+            responses.flush()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for line in sys.stdin:
+            if line.strip():
+                executor.submit(_serve, line)
+
+# Send one command to a server listening on the Unix socket at `path` and return its response
+def request(path, args, request_id=None):
+    message = {'args': args}
+    if request_id is not None:
+        message['id'] = request_id
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall((json.dumps(message) + "\n").encode())
+        with sock.makefile('r') as sfile:
+            return json.loads(sfile.readline())
@@ -0,0 +1,63 @@
+import base64
+from concurrent.futures import ProcessPoolExecutor
+
+from algosdk import account, encoding
+
+# The smallest number of transactions signed across the worker processes. Handing a chunk to a
+# worker costs about as much as signing a few dozen transactions and starting the workers costs
+# more, so smaller batches are signed faster in process
+MIN_POOL_TXNS = 512
+
+# The private keys held by this worker process, by address
+_worker_keys = {}
+
+def _init_worker(private_keys):
+    for private_key in private_keys:
+        _worker_keys[account.address_from_private_key(private_key)] = private_key
+
+# Helper function that signs a transaction and returns the signed transaction as msgpack bytes
+def sign_encoded(txn, private_key):
+    return base64.b64decode(encoding.msgpack_encode(txn.sign(private_key)))
+
+# Sign a chunk of transactions inside a worker with the key of each transaction's sender
+def _sign_chunk(txns):
+    return [sign_encoded(txn, _worker_keys[txn.sender]) for txn in txns]
+
+class SigningPool:
+    """Signs chunks of unsigned transactions across a pool of worker processes.
+
+    Ed25519 signing and msgpack encoding are CPU bound, so in bulk runs they are
+    spread over every core. The private keys are sent to each worker once when
+    it starts, so only the unsigned transactions cross the process boundary. Batches
+    of fewer than `min_txns` transactions are signed in process, and the workers are
+    only started by the first batch that is not.
+    """
+
+    def __init__(self, private_keys, workers=None, min_txns=MIN_POOL_TXNS):
+        self._keys = {account.address_from_private_key(private_key): private_key for private_key in private_keys}
+        self._workers = workers
+        self._min_txns = min_txns
+        self._executor = None
+
+    # Sign every chunk of transactions in `chunks`, yielding the list of signed msgpack blobs of
+    # each chunk in order. A chunk is typically one atomic group
+    def sign(self, chunks):
+        chunks = list(chunks)
+        if sum(len(txns) for txns in chunks) < self._min_txns:
+            return ([sign_encoded(txn, self._keys[txn.sender]) for txn in txns] for txns in chunks)
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers, initializer=_init_worker, initargs=(list(self._keys.values()),))
+        return self._executor.map(_sign_chunk, chunks)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -0,0 +1,183 @@
+import base64
+import sqlite3
+import threading
+
+from algosdk import encoding
+
+from assets import diploma_methods as methods
+
+import confirmation
+import diploma_codec
+
+# The number of rounds between the progress reports of a sync
+SYNC_PROGRESS = 1000
+
+# The `OnComplete` of an application call as stored in a block, where a NoOp is omitted
+OPT_IN, CLOSE_OUT, CLEAR_STATE = 1, 2, 3
+
+# The storage a diploma of the mirror lives in on the chain
+LOCAL, BOX = "local", "box"
+
+class Mirror:
+    """A local SQLite mirror of the diplomas of one app, synced from the blocks.
+
+    The current diploma of each account is indexed by its address, next to the history
+    of every call that changed it. Each block is applied in a single SQLite transaction
+    along with the checkpoint of its round, so an interrupted sync resumes where it stopped.
+    """
+
+    def __init__(self, path, app_id):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS diplomas (address TEXT NOT NULL, storage TEXT NOT NULL, "
+                               "diploma BLOB, round INTEGER NOT NULL, "
+                               "PRIMARY KEY (address, storage)) WITHOUT ROWID")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS history (round INTEGER NOT NULL, txid TEXT NOT NULL, "
+                               "address TEXT NOT NULL, action TEXT NOT NULL, storage TEXT, diploma BLOB)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS history_address ON history (address, round)")
+            self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('APP_ID', ?)", (str(app_id),))
+
+        mirrored_app_id = int(self._meta('APP_ID'))
+        if mirrored_app_id != app_id:
+            raise ValueError("The mirror holds app-id {}, not {}".format(mirrored_app_id, app_id))
+        self.app_id = app_id
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _meta(self, key):
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    # The last round applied to the mirror, or `None` before the first sync
+    @property
+    def last_round(self):
+        last_round = self._meta('round')
+        return None if last_round is None else int(last_round)
+
+    # The registrar as of the last applied round, or `None` if no change of it was synced
+    @property
+    def registrar(self):
+        return self._meta('registrar')
+
+    # Return the diplomas of `addr` by the storage they live in, decoded as by `common.decode_state`
+    def get_diplomas(self, addr):
+        rows = self._query("SELECT storage, diploma FROM diplomas WHERE address = ?", (addr,))
+        return {storage: {'diploma': diploma} for (storage, diploma) in rows}
+
+    # Return every synced call that changed the diploma or the app membership of `addr`, oldest first
+    def get_history(self, addr):
+        return self._query("SELECT round, txid, action, storage, diploma FROM history "
+                           "WHERE address = ? ORDER BY round, rowid", (addr,))
+
+    # Apply the changes of every call to this app in the decoded `block` of round `rnd`
+    def apply_block(self, rnd, block):
+        with self._lock, self._conn:
+            for stxn in block.get('txns', []):
+                txn = stxn['txn']
+                if txn.get('type') == 'appl' and (txn.get('apid') or stxn.get('apid')) == self.app_id:
+                    self._apply_call(rnd, block, stxn)
+
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('round', ?)", (str(rnd),))
+
+    def _apply_call(self, rnd, block, stxn):
+        txn = stxn['txn']
+        txid = confirmation.block_txid(block, stxn)
+        sender = encoding.encode_address(txn['snd'])
+        on_complete = txn.get('apan', 0)
+        app_args = txn.get('apaa', [])
+        accounts = [encoding.encode_address(addr) for addr in txn.get('apat', [])]
+
+        def record(address, action, storage=None, diploma=None):
+            self._conn.execute("INSERT INTO history VALUES (?, ?, ?, ?, ?, ?)",
+                               (rnd, txid, address, action, storage, diploma))
+
+        # The ledger only reports the state deltas, so a local state removed by leaving the app
+        # and the boxes written by a method are derived from the call itself
+        if on_complete == OPT_IN:
+            record(sender, "opt-in")
+        elif on_complete in (CLOSE_OUT, CLEAR_STATE):
+            self._conn.execute("DELETE FROM diplomas WHERE address = ? AND storage = ?", (sender, LOCAL))
+            record(sender, "close-out" if on_complete == CLOSE_OUT else "clear", LOCAL)
+        elif app_args and app_args[0] == methods.ISSUE_DIPLOMA_BOX:
+            self._conn.execute("INSERT OR REPLACE INTO diplomas VALUES (?, ?, ?, ?)",
+                               (accounts[0], BOX, app_args[1], rnd))
+            record(accounts[0], "issue", BOX, app_args[1])
+        elif app_args and app_args[0] == methods.REVOKE_DIPLOMA_BOX:
+            self._conn.execute("DELETE FROM diplomas WHERE address = ? AND storage = ?", (accounts[0], BOX))
+            record(accounts[0], "revoke", BOX)
+
+        txinfo = confirmation.block_transaction_info(block, stxn)
+        for account_delta in txinfo.get('local-state-delta', []):
+            self._apply_local_delta(rnd, record, account_delta['address'], account_delta['delta'])
+
+        for entry in txinfo.get('global-state-delta', []):
+            if base64.b64decode(entry['key']) == b'registrar':
+                registrar = encoding.encode_address(base64.b64decode(entry['value']['bytes']))
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('registrar', ?)", (registrar,))
+                record(registrar, "registrar")
+
+    def _apply_local_delta(self, rnd, record, address, delta):
+        rows = self._conn.execute("SELECT diploma FROM diplomas WHERE address = ? AND storage = ?",
+                                  (address, LOCAL)).fetchall()
+        state = {'diploma': rows[0][0]} if rows else {}
+
+        for entry in delta:
+            key = base64.b64decode(entry['key']).decode('utf-8', 'replace')
+            value = entry['value']
+            if value['action'] == 1:
+                state[key] = base64.b64decode(value.get('bytes', ''))
+            elif value['action'] == 2:
+                state[key] = value.get('uint', 0)
+            else:
+                state.pop(key, None)
+
+        if state.get('diploma') is None:
+            self._conn.execute("DELETE FROM diplomas WHERE address = ? AND storage = ?", (address, LOCAL))
+        else:
+            self._conn.execute("INSERT OR REPLACE INTO diplomas VALUES (?, ?, ?, ?)",
+                               (address, LOCAL, state['diploma'], rnd))
+
+        # Only a change of the diploma itself is an issuance or a revocation
+        if any(base64.b64decode(entry['key']) == b'diploma' for entry in delta):
+            if state.get('diploma') is None:
+                record(address, "revoke", LOCAL)
+            else:
+                record(address, "issue", LOCAL, state['diploma'])
+
+    # Apply every block from the checkpoint, or from `start_round` on the first sync, up to the
+    # latest round. Blocks are fetched `workers` at a time but applied in order. With `follow`
+    # set, keep applying each new block as it is produced. Returns the last applied round
+    def sync(self, client, start_round=None, follow=False, workers=confirmation.FETCH_WORKERS):
+        next_round = start_round if self.last_round is None else self.last_round + 1
+        if next_round is None:
+            raise ValueError("The first sync of the mirror needs a start round")
+
+        for rnd, block in confirmation.iter_blocks(client, next_round, follow, workers):
+            self.apply_block(rnd, block)
+            if rnd % SYNC_PROGRESS == 0:
+                print("Synced up to round {}".format(rnd))
+
+        print("Synced up to round {}".format(self.last_round))
+        return self.last_round
+
+    def close(self):
+        self._conn.close()
+
+# Read the diplomas of `addr` from the local `mirror`, without contacting the node
+def read_mirror_diplomas(mirror, addr):
+    diplomas = mirror.get_diplomas(addr)
+    print(f"diplomas of account {addr} for app_id {mirror.app_id} as of round {mirror.last_round}:")
+
+    # Check if there is a diploma to even display
+    if not diplomas:
+        print("\t", "No diploma")
+        return
+
+    for storage, diploma in diplomas.items():
+        for key, value in diploma.items():
+            print("\t", storage, key, diploma_codec.describe(value))
@@ -0,0 +1,767 @@
+import base64
+import collections
+import hashlib
+import re
+
+from algosdk import encoding
+
+# The highest version of the programs this module assembles and runs
+MAX_VERSION = 8
+
+# The version of the bytecode `assemble` emits for the same source. It changes whenever the size
+# or the cost of an assembled program does, so that measurements of different ones are told apart
+ASSEMBLER_VERSION = 2
+
+# The limits of the stack and of a byte string of a program
+MAX_STACK_DEPTH = 1000
+MAX_BYTES_LENGTH = 4096
+
+# The scratch space slots of a program
+SCRATCH_SLOTS = 256
+
+UINT64_MAX = 2 ** 64 - 1
+
+# The named integer constants of `int`
+NAMED_INTS = {
+    'NoOp': 0, 'OptIn': 1, 'CloseOut': 2, 'ClearState': 3, 'UpdateApplication': 4, 'DeleteApplication': 5,
+    'unknown': 0, 'pay': 1, 'keyreg': 2, 'acfg': 3, 'axfer': 4, 'afrz': 5, 'appl': 6,
+}
+
+# The fields of `txn` and `global` by their index in the bytecode
+TXN_FIELDS = [
+    'Sender', 'Fee', 'FirstValid', 'FirstValidTime', 'LastValid', 'Note', 'Lease', 'Receiver', 'Amount',
+    'CloseRemainderTo', 'VotePK', 'SelectionPK', 'VoteFirst', 'VoteLast', 'VoteKeyDilution', 'Type',
+    'TypeEnum', 'XferAsset', 'AssetAmount', 'AssetSender', 'AssetReceiver', 'AssetCloseTo', 'GroupIndex',
+    'TxID', 'ApplicationID', 'OnCompletion', 'ApplicationArgs', 'NumAppArgs', 'Accounts', 'NumAccounts',
+    'ApprovalProgram', 'ClearStateProgram', 'RekeyTo', 'ConfigAsset', 'ConfigAssetTotal',
+    'ConfigAssetDecimals', 'ConfigAssetDefaultFrozen', 'ConfigAssetUnitName', 'ConfigAssetName',
+    'ConfigAssetURL', 'ConfigAssetMetadataHash', 'ConfigAssetManager', 'ConfigAssetReserve',
+    'ConfigAssetFreeze', 'ConfigAssetClawback', 'FreezeAsset', 'FreezeAssetAccount', 'FreezeAssetFrozen',
+    'Assets', 'NumAssets', 'Applications', 'NumApplications', 'GlobalNumUint', 'GlobalNumByteSlice',
+    'LocalNumUint', 'LocalNumByteSlice', 'ExtraProgramPages', 'Nonparticipation', 'Logs', 'NumLogs',
+    'CreatedAssetID', 'CreatedApplicationID', 'LastLog', 'StateProofPK', 'ApprovalProgramPages',
+    'NumApprovalProgramPages', 'ClearStateProgramPages', 'NumClearStateProgramPages',
+]
+GLOBAL_FIELDS = [
+    'MinTxnFee', 'MinBalance', 'MaxTxnLife', 'ZeroAddress', 'GroupSize', 'LogicSigVersion', 'Round',
+    'LatestTimestamp', 'CurrentApplicationID', 'CreatorAddress', 'CurrentApplicationAddress', 'GroupID',
+    'OpcodeBudget', 'CallerApplicationID', 'CallerApplicationAddress',
+]
+
+# The `txn` fields that are arrays, indexed by `txna` and `txnas`
+TXN_ARRAY_FIELDS = {'ApplicationArgs', 'Accounts', 'Assets', 'Applications', 'Logs'}
+
+class TealError(Exception):
+    """Raised when a program fails to assemble or fails while it runs."""
+
+class BudgetExceededError(TealError):
+    """Raised when the programs of a group run out of their pooled opcode budget."""
+
+class Budget:
+    """The opcode budget pooled by the application calls of a group."""
+
+    def __init__(self, limit):
+        self.remaining = limit
+
+# The opcodes of every supported operation, with the kind of their immediate arguments
+# and their opcode cost. Every other operation is rejected by the assembler
+OPS = {
+    'err': (0x00, None, 1), 'sha256': (0x01, None, 35), 'sha512_256': (0x03, None, 45),
+    '+': (0x08, None, 1), '-': (0x09, None, 1), '/': (0x0a, None, 1), '*': (0x0b, None, 1),
+    '<': (0x0c, None, 1), '>': (0x0d, None, 1), '<=': (0x0e, None, 1), '>=': (0x0f, None, 1),
+    '&&': (0x10, None, 1), '||': (0x11, None, 1), '==': (0x12, None, 1), '!=': (0x13, None, 1),
+    '!': (0x14, None, 1), 'len': (0x15, None, 1), 'itob': (0x16, None, 1), 'btoi': (0x17, None, 1),
+    '%': (0x18, None, 1), '|': (0x19, None, 1), '&': (0x1a, None, 1), '^': (0x1b, None, 1),
+    '~': (0x1c, None, 1),
+    'intcblock': (0x20, 'ints', 1), 'intc': (0x21, 'uint8', 1), 'intc_0': (0x22, None, 1),
+    'intc_1': (0x23, None, 1), 'intc_2': (0x24, None, 1), 'intc_3': (0x25, None, 1),
+    'bytecblock': (0x26, 'byteses', 1), 'bytec': (0x27, 'uint8', 1), 'bytec_0': (0x28, None, 1),
+    'bytec_1': (0x29, None, 1), 'bytec_2': (0x2a, None, 1), 'bytec_3': (0x2b, None, 1),
+    'txn': (0x31, 'txn', 1), 'global': (0x32, 'global', 1), 'gtxn': (0x33, 'gtxn', 1),
+    'load': (0x34, 'uint8', 1), 'store': (0x35, 'uint8', 1), 'txna': (0x36, 'txna', 1),
+    'gtxna': (0x37, 'gtxna', 1), 'loads': (0x3e, None, 1), 'stores': (0x3f, None, 1),
+    'bnz': (0x40, 'label', 1), 'bz': (0x41, 'label', 1), 'b': (0x42, 'label', 1),
+    'return': (0x43, None, 1), 'assert': (0x44, None, 1), 'bury': (0x45, 'uint8', 1),
+    'popn': (0x46, 'uint8', 1), 'dupn': (0x47, 'uint8', 1), 'pop': (0x48, None, 1),
+    'dup': (0x49, None, 1), 'dup2': (0x4a, None, 1), 'dig': (0x4b, 'uint8', 1), 'swap': (0x4c, None, 1),
+    'select': (0x4d, None, 1), 'cover': (0x4e, 'uint8', 1), 'uncover': (0x4f, 'uint8', 1),
+    'concat': (0x50, None, 1), 'substring': (0x51, 'uint8x2', 1), 'substring3': (0x52, None, 1),
+    'getbyte': (0x55, None, 1), 'extract': (0x57, 'uint8x2', 1), 'extract3': (0x58, None, 1),
+    'extract_uint16': (0x59, None, 1), 'extract_uint32': (0x5a, None, 1), 'extract_uint64': (0x5b, None, 1),
+    'balance': (0x60, None, 1), 'app_opted_in': (0x61, None, 1), 'app_local_get': (0x62, None, 1),
+    'app_local_get_ex': (0x63, None, 1), 'app_global_get': (0x64, None, 1),
+    'app_global_get_ex': (0x65, None, 1), 'app_local_put': (0x66, None, 1),
+    'app_global_put': (0x67, None, 1), 'app_local_del': (0x68, None, 1), 'app_global_del': (0x69, None, 1),
+    'min_balance': (0x78, None, 1),
+    'pushbytes': (0x80, 'bytes', 1), 'pushint': (0x81, 'varuint', 1),
+    'callsub': (0x88, 'label', 1), 'retsub': (0x89, None, 1), 'proto': (0x8a, 'uint8x2', 1),
+    'frame_dig': (0x8b, 'int8', 1), 'frame_bury': (0x8c, 'int8', 1), 'switch': (0x8d, 'labels', 1),
+    'match': (0x8e, 'labels', 1),
+    'shl': (0x90, None, 1), 'shr': (0x91, None, 1), 'bzero': (0xaf, None, 1),
+    'b<': (0xa4, None, 1), 'b>': (0xa5, None, 1), 'b<=': (0xa6, None, 1), 'b>=': (0xa7, None, 1),
+    'b==': (0xa8, None, 1), 'b!=': (0xa9, None, 1),
+    'log': (0xb0, None, 1),
+    'box_create': (0xb9, None, 1), 'box_extract': (0xba, None, 1), 'box_replace': (0xbb, None, 1),
+    'box_del': (0xbc, None, 1), 'box_len': (0xbd, None, 1), 'box_get': (0xbe, None, 1),
+    'box_put': (0xbf, None, 1), 'txnas': (0xc0, 'txn', 1),
+}
+OPCODES = {opcode: name for name, (opcode, _, _) in OPS.items()}
+
+# Helper function that encodes `value` as a varuint
+def _varuint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+# Helper function that decodes the varuint at `pc` of `program`, returning it and the pc after it
+def _read_varuint(program, pc):
+    value, shift = 0, 0
+    while True:
+        if pc >= len(program):
+            raise TealError("varuint runs past the end of the program")
+        byte = program[pc]
+        value |= (byte & 0x7f) << shift
+        pc += 1
+        if byte < 0x80:
+            return value, pc
+        shift += 7
+
+# Helper function that splits a line of TEAL source into its tokens, keeping quoted strings whole
+def _tokenize(line):
+    tokens, token, i = [], '', 0
+    while i < len(line):
+        char = line[i]
+        if char == '"':
+            end = i + 1
+            while end < len(line) and line[end] != '"':
+                end += 2 if line[end] == '\\' else 1
+            token += line[i:end + 1]
+            i = end + 1
+            continue
+        if line.startswith('//', i):
+            break
+        if char.isspace():
+            if token:
+                tokens.append(token)
+            token = ''
+        else:
+            token += char
+        i += 1
+    if token:
+        tokens.append(token)
+    return tokens
+
+# Helper function that parses the integer constant `token`
+def _parse_int(token):
+    if token in NAMED_INTS:
+        return NAMED_INTS[token]
+    try:
+        value = int(token, 0)
+    except ValueError:
+        raise TealError("Invalid integer constant {}".format(token))
+    if not 0 <= value <= UINT64_MAX:
+        raise TealError("Integer constant out of range {}".format(token))
+    return value
+
+# Helper function that parses the byte string constant of `tokens`
+def _parse_bytes(tokens):
+    if len(tokens) == 1 and tokens[0].startswith('"'):
+        return tokens[0][1:-1].encode('utf-8').decode('unicode_escape').encode('latin-1')
+    if len(tokens) == 1 and tokens[0].startswith('0x'):
+        return bytes.fromhex(tokens[0][2:])
+    if len(tokens) == 2 and tokens[0] in ('base64', 'b64'):
+        return base64.b64decode(tokens[1])
+    if len(tokens) == 2 and tokens[0] in ('base32', 'b32'):
+        return base64.b32decode(tokens[1] + '=' * (-len(tokens[1]) % 8))
+    if len(tokens) == 1 and re.match(r'(b64|base64)\(.*\)$', tokens[0]):
+        return base64.b64decode(tokens[0][tokens[0].index('(') + 1:-1])
+    raise TealError("Invalid byte constant {}".format(' '.join(tokens)))
+
+# Helper function that returns the index of the field `name` in `fields`
+def _field_index(fields, name):
+    if name not in fields:
+        raise TealError("Unknown field {}".format(name))
+    return fields.index(name)
+
+# Helper function that parses the constant of an `int`, `byte` or `addr` pseudo-op, returning the
+# kind of its constant block and its value
+def _pseudo_constant(name, args):
+    if name == 'int':
+        return 'intcblock', _parse_int(args[0])
+    if name == 'byte':
+        return 'bytecblock', _parse_bytes(args)
+    return 'bytecblock', encoding.decode_address(args[0])
+
+# Helper function that lays out the constant blocks of the `int`, `byte` and `addr` pseudo-ops of
+# the tokenized `lines` as goal does. The constants are ranked by how often they are referenced,
+# ties by their first reference. From version 4 on, a constant referenced once is pushed instead.
+# A kind whose block the source writes itself gets none. Malformed constants are left to `assemble`
+def _constant_blocks(lines, version):
+    counts = {'intcblock': collections.Counter(), 'bytecblock': collections.Counter()}
+    explicit = set()
+    for _, tokens in lines:
+        name, args = tokens[0], tokens[1:]
+        if name in counts:
+            explicit.add(name)
+        elif name in ('int', 'byte', 'addr'):
+            try:
+                kind, value = _pseudo_constant(name, args)
+            except (IndexError, ValueError, TealError):
+                continue
+            counts[kind][value] += 1
+
+    blocks = {}
+    for kind, kind_counts in counts.items():
+        ranked = sorted(kind_counts, key=lambda value: -kind_counts[value])
+        if version >= 4:
+            ranked = [value for value in ranked if kind_counts[value] > 1]
+        if kind not in explicit and ranked:
+            blocks[kind] = ranked
+    return blocks
+
+# Assemble the TEAL `source` into the bytecode of a program. The `int`, `byte` and `addr` constants
+# are laid out in constant blocks at its start and referenced with `intc` and `bytec`, as goal and
+# algod assemble them, so that the size and cost of the bytecode match theirs
+def assemble(source):
+    version = 1
+    program = bytearray()
+    labels, references = {}, []
+
+    lines = [(line_num, tokens) for line_num, tokens in
+             ((line_num, _tokenize(line.strip())) for line_num, line in enumerate(source.splitlines(), start=1))
+             if tokens]
+    for _, tokens in lines:
+        if tokens[0] == '#pragma' and len(tokens) == 3 and tokens[1] == 'version' and tokens[2].isdigit():
+            version = int(tokens[2])
+            break
+
+    # The constant blocks come first, so that every reference to them follows
+    blocks = _constant_blocks(lines, version)
+    constant_index = {kind: {value: index for index, value in enumerate(block)} for kind, block in blocks.items()}
+    if 'intcblock' in blocks:
+        program += bytes([OPS['intcblock'][0]]) + _varuint(len(blocks['intcblock'])) + b''.join(
+            _varuint(value) for value in blocks['intcblock'])
+    if 'bytecblock' in blocks:
+        program += bytes([OPS['bytecblock'][0]]) + _varuint(len(blocks['bytecblock'])) + b''.join(
+            _varuint(len(value)) + value for value in blocks['bytecblock'])
+
+    for line_num, tokens in lines:
+        try:
+            name, args = tokens[0], tokens[1:]
+            if name == '#pragma':
+                if len(args) != 2 or args[0] != 'version':
+                    raise TealError("Unknown pragma")
+                version = int(args[1])
+                if not 1 <= version <= MAX_VERSION:
+                    raise TealError("Unsupported version {}".format(version))
+                continue
+            if name.endswith(':') and not args:
+                labels[name[:-1]] = len(program)
+                continue
+
+            # The pseudo-ops, which are assembled into the ops above. A constant is referenced from
+            # its block if it has one, and pushed otherwise
+            if name in ('int', 'byte', 'addr'):
+                kind, value = _pseudo_constant(name, args)
+                index = constant_index.get(kind, {}).get(value)
+                prefix = 'intc' if kind == 'intcblock' else 'bytec'
+                if index is None:
+                    name, args = ('pushint', [str(value)]) if kind == 'intcblock' else ('pushbytes', [value])
+                elif index < 4:
+                    name, args = '{}_{}'.format(prefix, index), []
+                else:
+                    name, args = prefix, [str(index)]
+            elif name == 'pushbytes':
+                args = [_parse_bytes(args)]
+            elif name == 'txn' and len(args) == 2:
+                name = 'txna'
+            elif name == 'gtxn' and len(args) == 3:
+                name = 'gtxna'
+
+            if name not in OPS:
+                raise TealError("Unsupported opcode {}".format(name))
+            opcode, immediates, _ = OPS[name]
+            program.append(opcode)
+
+            if immediates is None:
+                if args:
+                    raise TealError("{} expects no arguments".format(name))
+            elif immediates == 'varuint':
+                program += _varuint(_parse_int(args[0]))
+            elif immediates == 'bytes':
+                program += _varuint(len(args[0])) + args[0]
+            elif immediates == 'uint8':
+                program.append(int(args[0]))
+            elif immediates == 'int8':
+                program += int(args[0]).to_bytes(1, 'big', signed=True)
+            elif immediates == 'uint8x2':
+                program += bytes([int(args[0]), int(args[1])])
+            elif immediates == 'txn':
+                program.append(_field_index(TXN_FIELDS, args[0]))
+            elif immediates == 'txna':
+                program += bytes([_field_index(TXN_FIELDS, args[0]), int(args[1])])
+            elif immediates == 'global':
+                program.append(_field_index(GLOBAL_FIELDS, args[0]))
+            elif immediates == 'gtxn':
+                program += bytes([int(args[0]), _field_index(TXN_FIELDS, args[1])])
+            elif immediates == 'gtxna':
+                program += bytes([int(args[0]), _field_index(TXN_FIELDS, args[1]), int(args[2])])
+            elif immediates == 'ints':
+                program += _varuint(len(args)) + b''.join(_varuint(_parse_int(arg)) for arg in args)
+            elif immediates == 'byteses':
+                values = [_parse_bytes([arg]) for arg in args]
+                program += _varuint(len(values)) + b''.join(_varuint(len(v)) + v for v in values)
+            elif immediates == 'label':
+                references.append((len(program), len(program) + 2, args[0], line_num))
+                program += b'\x00\x00'
+            elif immediates == 'labels':
+                program.append(len(args))
+                end = len(program) + 2 * len(args)
+                for arg in args:
+                    references.append((len(program), end, arg, line_num))
+                    program += b'\x00\x00'
+        except (IndexError, ValueError) as e:
+            raise TealError("Line {}: malformed {}: {}".format(line_num, tokens[0], e))
+        except TealError as e:
+            raise TealError("Line {}: {}".format(line_num, e))
+
+    # Resolve the branch offsets, which are relative to the end of their instruction
+    for position, end, label, line_num in references:
+        if label not in labels:
+            raise TealError("Line {}: unknown label {}".format(line_num, label))
+        program[position:position + 2] = (labels[label] - end).to_bytes(2, 'big', signed=True)
+
+    return _varuint(version) + bytes(program)
+
+class Program:
+    """A program decoded from its bytecode once, so that it can be run many times."""
+
+    def __init__(self, bytecode):
+        self.version, pc = _read_varuint(bytecode, 0)
+        if not 1 <= self.version <= MAX_VERSION:
+            raise TealError("Unsupported program version {}".format(self.version))
+
+        # Every instruction by its pc, as `(name, immediates, next pc, cost)`
+        self.instructions = {}
+        self.start = pc
+        while pc < len(bytecode):
+            start = pc
+            opcode = bytecode[pc]
+            if opcode not in OPCODES:
+                raise TealError("Unsupported opcode 0x{:02x} at pc={}".format(opcode, pc))
+            name = OPCODES[opcode]
+            _, kind, cost = OPS[name]
+            pc += 1
+
+            if kind is None:
+                immediates = ()
+            elif kind == 'varuint':
+                value, pc = _read_varuint(bytecode, pc)
+                immediates = (value,)
+            elif kind == 'bytes':
+                length, pc = _read_varuint(bytecode, pc)
+                immediates = (bytecode[pc:pc + length],)
+                pc += length
+            elif kind in ('uint8', 'txn', 'global'):
+                immediates = (bytecode[pc],)
+                pc += 1
+            elif kind == 'int8':
+                immediates = (int.from_bytes(bytecode[pc:pc + 1], 'big', signed=True),)
+                pc += 1
+            elif kind in ('uint8x2', 'txna', 'gtxn'):
+                immediates = (bytecode[pc], bytecode[pc + 1])
+                pc += 2
+            elif kind == 'gtxna':
+                immediates = tuple(bytecode[pc:pc + 3])
+                pc += 3
+            elif kind == 'ints':
+                count, pc = _read_varuint(bytecode, pc)
+                values = []
+                for _ in range(count):
+                    value, pc = _read_varuint(bytecode, pc)
+                    values.append(value)
+                immediates = (values,)
+            elif kind == 'byteses':
+                count, pc = _read_varuint(bytecode, pc)
+                values = []
+                for _ in range(count):
+                    length, pc = _read_varuint(bytecode, pc)
+                    values.append(bytecode[pc:pc + length])
+                    pc += length
+                immediates = (values,)
+            elif kind == 'label':
+                offset = int.from_bytes(bytecode[pc:pc + 2], 'big', signed=True)
+                pc += 2
+                immediates = (pc + offset,)
+            elif kind == 'labels':
+                count = bytecode[pc]
+                end = pc + 1 + 2 * count
+                immediates = (tuple(end + int.from_bytes(bytecode[i:i + 2], 'big', signed=True)
+                                    for i in range(pc + 1, end, 2)),)
+                pc = end
+
+            if pc > len(bytecode):
+                raise TealError("{} runs past the end of the program".format(name))
+            self.instructions[start] = (name, immediates, pc, cost)
+
+        self.end = len(bytecode)
+        for name, immediates, _, _ in self.instructions.values():
+            targets = immediates[0] if name in ('switch', 'match') else immediates if OPS[name][1] == 'label' else ()
+            for target in targets:
+                if target != self.end and target not in self.instructions:
+                    raise TealError("{} branches to an invalid pc={}".format(name, target))
+
+class _Frame:
+    """A frame of a subroutine call, as `callsub` and `proto` set it up."""
+
+    def __init__(self, return_pc, height):
+        self.return_pc = return_pc
+        self.height = height
+        self.args = None
+        self.returns = None
+
+# Helper functions that check the type of an operand
+def _uint(value, name):
+    if not isinstance(value, int):
+        raise TealError("{} arg wanted type uint64 got []byte".format(name))
+    return value
+
+def _bytes(value, name):
+    if not isinstance(value, bytes):
+        raise TealError("{} arg wanted type []byte got uint64".format(name))
+    return value
+
+def _check_uint(value, name):
+    if value > UINT64_MAX:
+        raise TealError("{} overflowed".format(name))
+    if value < 0:
+        raise TealError("{} would result negative".format(name))
+    return value
+
+def _check_bytes(value):
+    if len(value) > MAX_BYTES_LENGTH:
+        raise TealError("byte string longer than {}".format(MAX_BYTES_LENGTH))
+    return value
+
+# The operations that pop two uint64 operands and push a uint64 result
+_BINARY_UINT_OPS = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '<': lambda a, b: int(a < b),
+    '>': lambda a, b: int(a > b),
+    '<=': lambda a, b: int(a <= b),
+    '>=': lambda a, b: int(a >= b),
+    '&&': lambda a, b: int(bool(a) and bool(b)),
+    '||': lambda a, b: int(bool(a) or bool(b)),
+    '|': lambda a, b: a | b,
+    '&': lambda a, b: a & b,
+    '^': lambda a, b: a ^ b,
+    'shl': lambda a, b: (a << b) & UINT64_MAX,
+    'shr': lambda a, b: a >> b,
+}
+
+# The operations that compare two byte strings as big-endian unsigned integers
+_BYTES_COMPARISONS = {
+    'b<': lambda a, b: a < b, 'b>': lambda a, b: a > b, 'b<=': lambda a, b: a <= b,
+    'b>=': lambda a, b: a >= b, 'b==': lambda a, b: a == b, 'b!=': lambda a, b: a != b,
+}
+
+# Run the decoded `program` in the application context `ctx`, spending its opcode cost from the
+# pooled `budget`. The `ctx` provides the fields of the transactions, the state of the applications
+# and the logs. Returns whether the program approved, or raises `TealError` if it failed
+def run(program, ctx, budget):
+    stack, scratch, frames, constants = [], [0] * SCRATCH_SLOTS, [], {}
+    pc = program.start
+
+    def pop():
+        if not stack:
+            raise TealError("stack underflow")
+        return stack.pop()
+
+    def push(value):
+        if len(stack) >= MAX_STACK_DEPTH:
+            raise TealError("stack overflow")
+        stack.append(value)
+
+    while pc != program.end:
+        name, immediates, next_pc, cost = program.instructions[pc]
+        budget.remaining -= cost
+        if budget.remaining < 0:
+            raise BudgetExceededError("dynamic cost budget exceeded, executing {}".format(name))
+
+        try:
+            if name in _BINARY_UINT_OPS:
+                b, a = _uint(pop(), name), _uint(pop(), name)
+                push(_check_uint(_BINARY_UINT_OPS[name](a, b), name))
+            elif name in ('pushint', 'pushbytes'):
+                push(immediates[0])
+            elif name in ('bnz', 'bz', 'b'):
+                if name == 'b' or bool(_uint(pop(), name)) == (name == 'bnz'):
+                    next_pc = immediates[0]
+            elif name == '==' or name == '!=':
+                b, a = pop(), pop()
+                if type(a) != type(b):
+                    raise TealError("cannot compare uint64 to []byte")
+                push(int((a == b) == (name == '==')))
+            elif name in ('/', '%'):
+                b, a = _uint(pop(), name), _uint(pop(), name)
+                if b == 0:
+                    raise TealError("{} 0".format(name))
+                push(a // b if name == '/' else a % b)
+            elif name == '!':
+                push(int(_uint(pop(), name) == 0))
+            elif name == '~':
+                push(UINT64_MAX ^ _uint(pop(), name))
+            elif name == 'return':
+                return bool(_uint(pop(), name))
+            elif name == 'assert':
+                if not _uint(pop(), name):
+                    raise TealError("assert failed")
+            elif name == 'err':
+                raise TealError("err opcode executed")
+            elif name in ('sha256', 'sha512_256'):
+                push(hashlib.new(name, _bytes(pop(), name)).digest())
+            elif name == 'len':
+                push(len(_bytes(pop(), name)))
+            elif name == 'itob':
+                push(_uint(pop(), name).to_bytes(8, 'big'))
+            elif name == 'btoi':
+                value = _bytes(pop(), name)
+                if len(value) > 8:
+                    raise TealError("btoi arg too long, got [{}]byte".format(len(value)))
+                push(int.from_bytes(value, 'big'))
+            elif name == 'concat':
+                b, a = _bytes(pop(), name), _bytes(pop(), name)
+                push(_check_bytes(a + b))
+            elif name in _BYTES_COMPARISONS:
+                b, a = _bytes(pop(), name), _bytes(pop(), name)
+                if len(a) > 64 or len(b) > 64:
+                    raise TealError("{} arguments longer than 64 bytes".format(name))
+                push(int(_BYTES_COMPARISONS[name](int.from_bytes(a, 'big'), int.from_bytes(b, 'big'))))
+            elif name in ('substring', 'extract', 'substring3', 'extract3'):
+                if name in ('substring', 'extract'):
+                    start, other = immediates
+                else:
+                    other, start = _uint(pop(), name), _uint(pop(), name)
+                value = _bytes(pop(), name)
+                if name == 'extract' and other == 0:
+                    other = len(value) - start
+                end = start + other if name.startswith('extract') else other
+                if start > end or end > len(value):
+                    raise TealError("{} range beyond length of string".format(name))
+                push(value[start:end])
+            elif name in ('extract_uint16', 'extract_uint32', 'extract_uint64'):
+                size = int(name[len('extract_uint'):]) // 8
+                start = _uint(pop(), name)
+                value = _bytes(pop(), name)
+                if start + size > len(value):
+                    raise TealError("{} range beyond length of string".format(name))
+                push(int.from_bytes(value[start:start + size], 'big'))
+            elif name == 'getbyte':
+                index = _uint(pop(), name)
+                value = _bytes(pop(), name)
+                if index >= len(value):
+                    raise TealError("getbyte index beyond length of string")
+                push(value[index])
+            elif name == 'bzero':
+                push(_check_bytes(bytes(_uint(pop(), name))))
+            elif name == 'intcblock' or name == 'bytecblock':
+                constants[name] = immediates[0]
+            elif name in ('intc', 'bytec') or name[:-1] in ('intc_', 'bytec_'):
+                block = constants.get('intcblock' if name.startswith('intc') else 'bytecblock', [])
+                index = immediates[0] if immediates else int(name[-1])
+                if index >= len(block):
+                    raise TealError("{} index beyond the constant block".format(name))
+                push(block[index])
+            elif name == 'load':
+                push(scratch[immediates[0]])
+            elif name == 'store':
+                scratch[immediates[0]] = pop()
+            elif name == 'loads':
+                push(scratch[_uint(pop(), name) % SCRATCH_SLOTS])
+            elif name == 'stores':
+                value = pop()
+                scratch[_uint(pop(), name) % SCRATCH_SLOTS] = value
+            elif name == 'pop':
+                pop()
+            elif name == 'popn':
+                for _ in range(immediates[0]):
+                    pop()
+            elif name == 'dup':
+                value = pop()
+                push(value)
+                push(value)
+            elif name == 'dupn':
+                value = pop()
+                for _ in range(immediates[0] + 1):
+                    push(value)
+            elif name == 'dup2':
+                b, a = pop(), pop()
+                for value in (a, b, a, b):
+                    push(value)
+            elif name == 'dig':
+                if immediates[0] >= len(stack):
+                    raise TealError("dig {} with stack length {}".format(immediates[0], len(stack)))
+                push(stack[-1 - immediates[0]])
+            elif name == 'bury':
+                if immediates[0] == 0 or immediates[0] >= len(stack):
+                    raise TealError("bury {} with stack length {}".format(immediates[0], len(stack)))
+                stack[-1 - immediates[0]] = stack[-1]
+                stack.pop()
+            elif name == 'swap':
+                b, a = pop(), pop()
+                push(b)
+                push(a)
+            elif name == 'select':
+                condition, b, a = _uint(pop(), name), pop(), pop()
+                push(b if condition else a)
+            elif name == 'cover':
+                depth = immediates[0]
+                if depth >= len(stack):
+                    raise TealError("cover {} with stack length {}".format(depth, len(stack)))
+                stack.insert(len(stack) - 1 - depth, stack.pop())
+            elif name == 'uncover':
+                depth = immediates[0]
+                if depth >= len(stack):
+                    raise TealError("uncover {} with stack length {}".format(depth, len(stack)))
+                stack.append(stack.pop(len(stack) - 1 - depth))
+            elif name in ('switch', 'match'):
+                targets = immediates[0]
+                if name == 'switch':
+                    index = _uint(pop(), name)
+                else:
+                    key = pop()
+                    candidates = [pop() for _ in targets][::-1]
+                    index = candidates.index(key) if key in candidates else len(targets)
+                if index < len(targets):
+                    next_pc = targets[index]
+            elif name == 'callsub':
+                frames.append(_Frame(next_pc, len(stack)))
+                next_pc = immediates[0]
+            elif name == 'proto':
+                if not frames:
+                    raise TealError("proto outside of a subroutine")
+                frame = frames[-1]
+                frame.args, frame.returns = immediates
+                if frame.args > frame.height:
+                    raise TealError("proto with {} args on a stack of {}".format(frame.args, frame.height))
+            elif name in ('frame_dig', 'frame_bury'):
+                if not frames or frames[-1].args is None:
+                    raise TealError("{} without a proto".format(name))
+                index = frames[-1].height + immediates[0]
+                if not frames[-1].height - frames[-1].args <= index < len(stack):
+                    raise TealError("{} {} out of the frame".format(name, immediates[0]))
+                if name == 'frame_dig':
+                    push(stack[index])
+                else:
+                    stack[index] = pop()
+            elif name == 'retsub':
+                if not frames:
+                    raise TealError("retsub with an empty call stack")
+                frame = frames.pop()
+                if frame.args is not None:
+                    if len(stack) < frame.height + frame.returns:
+                        raise TealError("retsub expected {} return values".format(frame.returns))
+                    returns = stack[len(stack) - frame.returns:]
+                    del stack[frame.height - frame.args:]
+                    stack.extend(returns)
+                next_pc = frame.return_pc
+            elif name == 'txn' or name == 'txnas':
+                field = TXN_FIELDS[immediates[0]]
+                index = _uint(pop(), name) if name == 'txnas' else None
+                push(ctx.txn_field(ctx.group_index, field, index))
+            elif name == 'txna':
+                push(ctx.txn_field(ctx.group_index, TXN_FIELDS[immediates[0]], immediates[1]))
+            elif name == 'gtxn':
+                push(ctx.txn_field(immediates[0], TXN_FIELDS[immediates[1]], None))
+            elif name == 'gtxna':
+                push(ctx.txn_field(immediates[0], TXN_FIELDS[immediates[1]], immediates[2]))
+            elif name == 'global':
+                field = GLOBAL_FIELDS[immediates[0]]
+                push(budget.remaining if field == 'OpcodeBudget' else ctx.global_field(field))
+            elif name == 'app_global_get':
+                value = ctx.app_global_get(ctx.app_id, _bytes(pop(), name))
+                push(0 if value is None else value)
+            elif name == 'app_global_get_ex':
+                key = _bytes(pop(), name)
+                value = ctx.app_global_get(ctx.resolve_app(pop()), key)
+                push(0 if value is None else value)
+                push(int(value is not None))
+            elif name == 'app_global_put':
+                value = pop()
+                ctx.app_global_put(_bytes(pop(), name), value)
+            elif name == 'app_global_del':
+                ctx.app_global_del(_bytes(pop(), name))
+            elif name == 'app_local_get':
+                key = _bytes(pop(), name)
+                value = ctx.app_local_get(ctx.resolve_account(pop()), ctx.app_id, key)
+                push(0 if value is None else value)
+            elif name == 'app_local_get_ex':
+                key = _bytes(pop(), name)
+                app_id = ctx.resolve_app(pop())
+                value = ctx.app_local_get(ctx.resolve_account(pop()), app_id, key)
+                push(0 if value is None else value)
+                push(int(value is not None))
+            elif name == 'app_local_put':
+                value = pop()
+                key = _bytes(pop(), name)
+                ctx.app_local_put(ctx.resolve_account(pop()), key, value)
+            elif name == 'app_local_del':
+                key = _bytes(pop(), name)
+                ctx.app_local_del(ctx.resolve_account(pop()), key)
+            elif name == 'app_opted_in':
+                app_id = ctx.resolve_app(pop())
+                push(int(ctx.opted_in(ctx.resolve_account(pop()), app_id)))
+            elif name == 'balance' or name == 'min_balance':
+                account = ctx.resolve_account(pop())
+                push(ctx.balance(account) if name == 'balance' else ctx.min_balance(account))
+            elif name == 'log':
+                ctx.log(_bytes(pop(), name))
+            elif name == 'box_create':
+                size = _uint(pop(), name)
+                push(int(ctx.box_create(_bytes(pop(), name), size)))
+            elif name == 'box_put':
+                value = _bytes(pop(), name)
+                ctx.box_put(_bytes(pop(), name), value)
+            elif name == 'box_get' or name == 'box_len':
+                value = ctx.box_get(_bytes(pop(), name))
+                if name == 'box_get':
+                    push(b'' if value is None else value)
+                else:
+                    push(0 if value is None else len(value))
+                push(int(value is not None))
+            elif name == 'box_del':
+                push(int(ctx.box_del(_bytes(pop(), name))))
+            elif name in ('box_extract', 'box_replace'):
+                if name == 'box_extract':
+                    length, start = _uint(pop(), name), _uint(pop(), name)
+                else:
+                    replacement, start = _bytes(pop(), name), _uint(pop(), name)
+                box_name = _bytes(pop(), name)
+                value = ctx.box_get(box_name)
+                if value is None:
+                    raise TealError("no such box")
+                end = start + (length if name == 'box_extract' else len(replacement))
+                if end > len(value):
+                    raise TealError("{} range beyond length of box".format(name))
+                if name == 'box_extract':
+                    push(value[start:end])
+                else:
+                    ctx.box_put(box_name, value[:start] + replacement + value[end:])
+            else:
+                raise TealError("unsupported opcode {}".format(name))
+        except TealError as e:
+            if isinstance(e, BudgetExceededError) or ' pc=' in str(e):
+                raise
+            raise TealError("{} pc={}".format(e, pc))
+
+        pc = next_pc
+
+    # Falling off the end approves if exactly one non-zero integer is left on the stack
+    if len(stack) != 1:
+        raise TealError("stack len is {} instead of 1".format(len(stack)))
+    return bool(_uint(stack[0], 'return'))
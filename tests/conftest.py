@@ -1,26 +1,137 @@
+import base64
+import os
+import sys
+
 from pytest import fixture
+import algosdk
+import algosdk.transaction
+from algosdk.box_reference import BoxReference
+from algosdk.v2client import algod
 from algopytest import (
+    AlgoUser,
+    SmartContractAccount,
+    TxnElemsContext,
+    application_global_state,
+    call_app,
+    close_out_app,
     create_app,
     compile_program,
+    group_transaction,
     opt_in_app,
-    close_out_app,
+    payment_transaction,
 )
-import algosdk.transaction
+from algopytest.account_ops import add_standalone_account, defund_account
+from algopytest.config_params import ConfigParams
 from pyteal import Mode
 
 # Load the smart contracts from this project. The path to find these
 # imports is set by the environment variable `$PYTHONPATH`.
 from diploma_smart_contract import diploma_program
 from clear_program import clear_program
+import diploma_methods as methods
+
+# The microAlgos every user is funded with by the owner once per session
+USER_FUNDS = 10_000_000
+
+# The microAlgos the application account is funded with to hold boxes
+APP_FUNDS = 1_000_000
+
+# The modules of this project live in its base directory, next to `run_diploma.py`
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# The names of the fixtures of the users that have opted in to ``smart_contract_id``
+OPTED_IN_FIXTURES = ["owner_in", "user1_in", "user2_in", "user3_in", "user4_in"]
+
+# The most transactions the network accepts in one atomic group
+MAX_GROUP_SIZE = 16
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--fake-algod",
+        action="store_true",
+        help="run the tests against an in-process fake algod instead of the sandbox",
+    )
+
+def pytest_configure(config):
+    """Start the fake algod when requested, pointing *AlgoPytest* at it.
+
+    Under pytest-xdist only the controller starts it, and the workers find it
+    through the environment variables they inherit.
+    """
+    if not config.getoption("--fake-algod") or hasattr(config, "workerinput"):
+        return
+
+    import fake_algod
+
+    node = fake_algod.FakeAlgod()
+    algod_server, kmd_server, indexer_server = fake_algod.serve(node, algod_port=0, kmd_port=0, indexer_port=0)
+    config.add_cleanup(algod_server.shutdown)
+    config.add_cleanup(kmd_server.shutdown)
+    config.add_cleanup(indexer_server.shutdown)
+
+    settings = {
+        "ALGOD_ADDRESS": "http://localhost:{}".format(algod_server.server_address[1]),
+        "KMD_ADDRESS": "http://localhost:{}".format(kmd_server.server_address[1]),
+        "INDEXER_ADDRESS": "http://localhost:{}".format(indexer_server.server_address[1]),
+        "KMD_WALLET_NAME": fake_algod.KMD_WALLET_NAME,
+        "INITIAL_FUNDS_ACCOUNT": node.genesis_account,
+    }
+    os.environ.update(settings)
+    for name, value in settings.items():
+        setattr(ConfigParams, name.lower(), value)
 
 @fixture
+def fake_app():
+    """Deploy the ``diploma_program`` on a fresh in-process fake algod, with its genesis account as registrar.
+
+    Returns the node, a client of it, the private key of the registrar and the app ID. The
+    modules of this project are tested against it directly, without AlgoPytest.
+    """
+    import async_client
+    import fake_algod
+    from pyteal import compileTeal
+
+    node = fake_algod.FakeAlgod()
+    client = fake_algod.FakeAlgodClient(node)
+    private_key = node.genesis_keys[node.genesis_account]
+
+    approval, clear = (base64.b64decode(client.compile(compileTeal(program, Mode.Application, version=8))['result'])
+                       for program in (diploma_program(), clear_program()))
+    global_schema = algosdk.transaction.StateSchema(num_uints=0, num_byte_slices=1)
+    local_schema = algosdk.transaction.StateSchema(num_uints=0, num_byte_slices=2)
+    txinfo = async_client.run_sync(client, async_client.create_app, private_key, approval, clear,
+                                   global_schema, local_schema)
+    return node, client, private_key, txinfo['application-index']
+
+def fake_students(node, client, app_id, count):
+    """Return the addresses of ``count`` new accounts of the fake ``node``, funded and opted in to ``app_id``."""
+    import async_client
+
+    students = []
+    for _ in range(count):
+        private_key, address = algosdk.account.generate_account()
+        node.fund(address, USER_FUNDS)
+        async_client.run_sync(client, async_client.opt_in_app, private_key, app_id)
+        students.append(address)
+    return students
+
+def algod_client():
+    """Return a client of the node the tests run against."""
+    return algod.AlgodClient(ConfigParams.algod_token, ConfigParams.algod_address)
+
+def send_group(pairs):
+    """Send the ``(signer, txn)`` pairs in atomic groups of up to ``MAX_GROUP_SIZE``."""
+    for i in range(0, len(pairs), MAX_GROUP_SIZE):
+        group_transaction(*pairs[i:i + MAX_GROUP_SIZE])
+
+@fixture(scope="session")
 def smart_contract_components():
     """Return the components of a smart contract required to deploy without deploying yet."""
-    diploma_program_compiled = compile_program(diploma_program(), mode=Mode.Application, version=5)
-    clear_program_compiled = compile_program(clear_program(), mode=Mode.Application, version=5)
+    diploma_program_compiled = compile_program(diploma_program(), mode=Mode.Application, version=8)
+    clear_program_compiled = compile_program(clear_program(), mode=Mode.Application, version=8)
     global_schema = algosdk.transaction.StateSchema(num_uints=0, num_byte_slices=1)
-    local_schema = algosdk.transaction.StateSchema(num_uints=0, num_byte_slices=1)    
-    
+    local_schema = algosdk.transaction.StateSchema(num_uints=0, num_byte_slices=2)
+
     return (
         diploma_program_compiled,
         clear_program_compiled,
@@ -28,52 +139,173 @@ def smart_contract_components():
         local_schema,
     )
 
+@fixture(scope="session")
+def session_users():
+    """Create the funded ``owner`` and users shared by every test of this session.
+
+    Under pytest-xdist every worker runs its own session, so every worker gets its own
+    accounts. The owner is funded first, and then funds every user in one atomic group.
+    """
+    owner = add_standalone_account(name="owner")
+    users = [add_standalone_account(funded=False, name="user{}".format(i)) for i in range(1, 5)]
+
+    with TxnElemsContext():
+        pairs = [payment_transaction(owner, user, USER_FUNDS) for user in users]
+    send_group(pairs)
+
+    yield owner, users
+
+    # Clean up by returning the funds of every user to the owner, and the owner's to the network
+    with TxnElemsContext():
+        pairs = [payment_transaction(user, owner, 0, close_remainder_to=owner) for user in users]
+    send_group(pairs)
+    defund_account(owner)
+
+@fixture
+def owner(session_users):
+    """The funded ``owner`` account shared by every test of this session."""
+    return session_users[0]
+
+@fixture
+def user1(session_users):
+    """The funded ``user1`` account shared by every test of this session."""
+    return session_users[1][0]
+
+@fixture
+def user2(session_users):
+    """The funded ``user2`` account shared by every test of this session."""
+    return session_users[1][1]
+
 @fixture
-def smart_contract_id(owner):
-    """Deploy the ``diploma_program`` to the Algorand network."""
+def user3(session_users):
+    """The funded ``user3`` account shared by every test of this session."""
+    return session_users[1][2]
+
+@fixture
+def user4(session_users):
+    """The funded ``user4`` account shared by every test of this session."""
+    return session_users[1][3]
+
+@fixture(scope="session")
+def session_smart_contract_id(session_users):
+    """Deploy the ``diploma_program`` once per session, with its account funded to hold boxes."""
+    owner, _ = session_users
     with create_app(
             owner,
-            approval_program=diploma_program(), 
+            approval_program=diploma_program(),
             clear_program=clear_program(),
-            local_bytes=1,
-            local_ints=1,
-            global_bytes=1,        
+            version=8,
+            local_bytes=2,
+            local_ints=0,
+            global_bytes=1,
     ) as app_id:
+        payment_transaction(owner, SmartContractAccount(app_id), APP_FUNDS)
         yield app_id
 
-def opt_in_user(user, smart_contract_id):
-    """Opt-in the ``user`` to the ``smart_contract_id`` application."""
-    opt_in_app(user, smart_contract_id)
+def reset_smart_contract(app_id, owner, users):
+    """Reset the state of the shared ``app_id`` left behind by a test to that of a fresh deployment.
+
+    Every account still opted in is closed out, the ``owner`` is made the registrar again
+    and every box is deleted, each in as few atomic groups as possible.
+    """
+    client = algod_client()
+    accounts = [owner] + users
+
+    # Close out every account still opted in, which also drops its diploma
+    # The creator of the app gets its info even when it has not opted in
+    opted_in = []
+    for account in accounts:
+        try:
+            info = client.account_application_info(account.address, app_id)
+        except algosdk.error.AlgodHTTPError:
+            continue
+        if 'app-local-state' in info:
+            opted_in.append(account)
+
+    with TxnElemsContext():
+        pairs = [close_out_app(account, app_id) for account in opted_in]
+    send_group(pairs)
+
+    # Reassign the registrar back to the `owner` from whichever account holds the role
+    registrar = application_global_state(app_id, address_fields=['registrar'])['registrar']
+    if registrar != owner.address:
+        holder = next((account for account in accounts if account.address == registrar), None)
+        if holder is None:
+            raise RuntimeError("The registrar {} is not an account of this session".format(registrar))
+        call_app(holder, app_id, app_args=[methods.REASSIGN_REGISTRAR], accounts=[owner])
+
+    # Delete every diploma box, named by its student, every cohort box and every box recording
+    # the revocation of a diploma from a cohort, named by its student and cohort root
+    pairs = []
+    for box in client.application_boxes(app_id).get('boxes', []):
+        name = base64.b64decode(box['name'])
+        with TxnElemsContext():
+            if name.startswith(b'cohort'):
+                signer, txn = call_app(owner, app_id, app_args=[methods.REVOKE_COHORT, name[len(b'cohort'):]])
+            elif len(name) == 64:
+                student = AlgoUser(algosdk.encoding.encode_address(name[:32]))
+                signer, txn = call_app(owner, app_id, app_args=[methods.REINSTATE_DIPLOMA, name[32:]],
+                                       accounts=[student])
+            else:
+                student = AlgoUser(algosdk.encoding.encode_address(name))
+                signer, txn = call_app(owner, app_id, app_args=[methods.REVOKE_DIPLOMA_BOX], accounts=[student])
+        txn.boxes = BoxReference.translate_box_references([(0, name)], txn.foreign_apps, txn.index)
+        pairs.append((signer, txn))
+    send_group(pairs)
+
+@fixture
+def smart_contract_id(session_smart_contract_id, session_users):
+    """The ``diploma_program`` deployed once per session, reset to a fresh state after each test."""
+    yield session_smart_contract_id
+
+    owner, users = session_users
+    reset_smart_contract(session_smart_contract_id, owner, users)
+
+@fixture
+def opted_in_users(request, smart_contract_id):
+    """Opt in every user whose ``*_in`` fixture the test requests, all in one atomic group.
+
+    The users are closed out again by the reset of ``smart_contract_id``. A ``*_in``
+    fixture requested dynamically by the test opts in on its own.
+    """
+    users = [request.getfixturevalue(name[:-len("_in")])
+             for name in OPTED_IN_FIXTURES if name in request.fixturenames]
+
+    with TxnElemsContext():
+        pairs = [opt_in_app(user, smart_contract_id) for user in users]
+    send_group(pairs)
+
+    return users
+
+def opt_in_user(user, opted_in_users, smart_contract_id):
+    """Return the ``user`` after making sure it has opted in to the ``smart_contract_id`` application."""
+    if user not in opted_in_users:
+        opt_in_app(user, smart_contract_id)
+        opted_in_users.append(user)
 
-    # The test runs here    
-    yield user
-    
-    # Clean up by closing out of the application    
-    close_out_app(user, smart_contract_id)
+    return user
 
 @fixture
-def owner_in(owner, smart_contract_id):
+def owner_in(owner, opted_in_users, smart_contract_id):
     """Create an ``owner`` fixture that has already opted in to ``smart_contract_id``."""
-    yield from opt_in_user(owner, smart_contract_id)
+    return opt_in_user(owner, opted_in_users, smart_contract_id)
 
 @fixture
-def user1_in(user1, smart_contract_id):
+def user1_in(user1, opted_in_users, smart_contract_id):
     """Create an ``user1`` fixture that has already opted in to ``smart_contract_id``."""
-    yield from opt_in_user(user1, smart_contract_id)
+    return opt_in_user(user1, opted_in_users, smart_contract_id)
 
 @fixture
-def user2_in(user2, smart_contract_id):
+def user2_in(user2, opted_in_users, smart_contract_id):
     """Create an ``user2`` fixture that has already opted in to ``smart_contract_id``."""
-    yield from opt_in_user(user2, smart_contract_id)
+    return opt_in_user(user2, opted_in_users, smart_contract_id)
 
 @fixture
-def user3_in(user3, smart_contract_id):
+def user3_in(user3, opted_in_users, smart_contract_id):
     """Create an ``user3`` fixture that has already opted in to ``smart_contract_id``."""
-    yield from opt_in_user(user3, smart_contract_id)
+    return opt_in_user(user3, opted_in_users, smart_contract_id)
 
 @fixture
-def user4_in(user4, smart_contract_id):
+def user4_in(user4, opted_in_users, smart_contract_id):
     """Create an ``user4`` fixture that has already opted in to ``smart_contract_id``."""
-    yield from opt_in_user(user4, smart_contract_id)    
-    
-        
+    return opt_in_user(user4, opted_in_users, smart_contract_id)
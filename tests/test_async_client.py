@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from algosdk import account
+
+import async_client
+import fake_algod
+
+async def threaded_client(client):
+    """Return the async ``client`` an operation of ``run_sync`` runs on."""
+    return client
+
+def test_run_sync_reuses_threaded_client():
+    """Test that consecutive operations on one client share their ``ThreadedAlgodClient``, and still work."""
+    node = fake_algod.FakeAlgod()
+    client = fake_algod.FakeAlgodClient(node)
+    private_key = node.genesis_keys[node.genesis_account]
+    receiver = account.generate_account()[1]
+
+    assert async_client.run_sync(client, threaded_client) is async_client.run_sync(client, threaded_client)
+    for amount in (100_000, 200_000):
+        async_client.run_sync(client, async_client.pay, private_key, receiver, amount)
+    assert node.accounts[receiver]['amount'] == 300_000
+
+def test_run_sync_concurrent_operations():
+    """Test that operations run concurrently from several threads each get a ``ThreadedAlgodClient`` of their own."""
+    node = fake_algod.FakeAlgod()
+    client = fake_algod.FakeAlgodClient(node)
+    private_key = node.genesis_keys[node.genesis_account]
+    receivers = [account.generate_account()[1] for _ in range(8)]
+
+    with ThreadPoolExecutor(max_workers=len(receivers)) as executor:
+        list(executor.map(lambda receiver: async_client.run_sync(client, async_client.pay, private_key,
+                                                                 receiver, 100_000), receivers))
+    assert all(node.accounts[receiver]['amount'] == 100_000 for receiver in receivers)
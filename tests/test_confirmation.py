@@ -0,0 +1,132 @@
+import base64
+import copy
+
+import algosdk.transaction
+import msgpack
+from algosdk import account, encoding
+
+import confirmation
+import diploma_codec
+import fake_algod
+
+# The network of the block below, as algod reports it
+GENESIS_ID = "testnet-v1.0"
+GENESIS_HASH = base64.b64decode("SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI=")
+
+DIPLOMA = diploma_codec.encode("Damian Barabonkov :: MIT :: BSc :: Mathematics :: 2020", 4)
+
+def go_string(value):
+    """Return the bytes ``value`` as a string that msgpack encodes into the same bytes, as algod encodes Go strings."""
+    return value.decode('utf-8', 'surrogateescape')
+
+def signed_txn_fields(signed_txn):
+    """Return the fields of ``signed_txn`` as they are msgpack encoded."""
+    return msgpack.unpackb(base64.b64decode(encoding.msgpack_encode(signed_txn)), raw=False)
+
+def algod_block(signed_txns):
+    """Return a block of round 7 confirming the ``signed_txns`` in the msgpack encoding of algod.
+
+    Algod strips the genesis hash from every transaction of a block and the genesis ID from
+    those that carried one, which it flags with ``hgi``. The apply data of an application call
+    holds its state deltas and logs as Go strings, which msgpack encodes as strings even when
+    they are not UTF-8. The first transaction issues a diploma and the second creates an app.
+    """
+    registrar = signed_txns[0].transaction.sender
+    entries = []
+    for signed_txn in signed_txns:
+        entry = signed_txn_fields(signed_txn)
+        del entry['txn']['gh']
+        if signed_txn.transaction.genesis_id:
+            del entry['txn']['gen']
+            entry['hgi'] = True
+        entries.append(entry)
+
+    entries[0]['dt'] = {
+        'gd': {go_string(b'registrar'): {'at': 1, 'bs': go_string(encoding.decode_address(registrar))}},
+        'ld': {1: {go_string(b'diploma'): {'at': 1, 'bs': go_string(DIPLOMA)}}},
+        'lg': [go_string(b'\x00' + DIPLOMA)],
+    }
+    entries[1]['apid'] = 1234
+
+    block = {'rnd': 7, 'gen': GENESIS_ID, 'gh': GENESIS_HASH, 'ts': 1700000000, 'txns': entries}
+    return msgpack.packb({'block': block, 'cert': {}}, use_bin_type=True, unicode_errors='surrogateescape')
+
+def test_block_txid():
+    """Test that the txids computed from a block match those algod returned for the group it confirmed."""
+    node = fake_algod.FakeAlgod()
+    client = fake_algod.FakeAlgodClient(node)
+    private_key = node.genesis_keys[node.genesis_account]
+    receiver = account.generate_account()[1]
+
+    # Blocks strip the genesis ID only from the transactions that carry one
+    params = client.suggested_params()
+    params_without_gen = copy.copy(params)
+    params_without_gen.gen = None
+    txns = [algosdk.transaction.PaymentTxn(node.genesis_account, params, receiver, 100_000),
+            algosdk.transaction.PaymentTxn(node.genesis_account, params_without_gen, receiver, 200_000)]
+    algosdk.transaction.assign_group_id(txns)
+    signed_txns = [txn.sign(private_key) for txn in txns]
+    first_txid = client.send_transactions(signed_txns)
+
+    block = confirmation.fetch_block(client, node.last_round)
+    assert [confirmation.block_txid(block, stxn) for stxn in block['txns']] == [txn.get_txid() for txn in signed_txns]
+    assert confirmation.block_txid(block, block['txns'][0]) == first_txid
+
+def test_tracker_resolves_sent_group():
+    """Test that a ``ConfirmationTracker`` resolves the txid algod returned for a sent group from its block."""
+    node = fake_algod.FakeAlgod()
+    client = fake_algod.FakeAlgodClient(node)
+    private_key = node.genesis_keys[node.genesis_account]
+
+    tracker = confirmation.ConfirmationTracker(client)
+    txn = algosdk.transaction.PaymentTxn(node.genesis_account, client.suggested_params(),
+                                         account.generate_account()[1], 100_000)
+    future = tracker.track(client.send_transaction(txn.sign(private_key)), txn.last_valid_round)
+    tracker.wait()
+    assert future.result()['confirmed-round'] == node.last_round
+
+def test_algod_block():
+    """Test the txids and transaction info decoded from a block encoded by algod rather than by the fake node."""
+    private_key, sender = account.generate_account()
+    student = account.generate_account()[1]
+    params = algosdk.transaction.SuggestedParams(1000, 5, 1005, base64.b64encode(GENESIS_HASH).decode(),
+                                                 GENESIS_ID, flat_fee=True)
+    params_without_gen = copy.copy(params)
+    params_without_gen.gen = None
+    txns = [algosdk.transaction.ApplicationNoOpTxn(sender, params, 1234, [b'\x01', DIPLOMA], [student]),
+            algosdk.transaction.ApplicationCreateTxn(sender, params_without_gen, 0, b'\x08\x81\x01\x43',
+                                                     b'\x08\x81\x01\x43', algosdk.transaction.StateSchema(0, 1),
+                                                     algosdk.transaction.StateSchema(0, 2))]
+    signed_txns = [txn.sign(private_key) for txn in txns]
+
+    block = confirmation.decode_block(algod_block(signed_txns))
+    assert [confirmation.block_txid(block, stxn) for stxn in block['txns']] == [txn.get_txid() for txn in signed_txns]
+
+    txinfo = confirmation.block_transaction_info(block, block['txns'][0])
+    assert txinfo['confirmed-round'] == 7
+    assert txinfo['global-state-delta'] == [{'key': base64.b64encode(b'registrar').decode(), 'value': {
+        'action': 1, 'bytes': base64.b64encode(encoding.decode_address(sender)).decode()}}]
+    assert txinfo['local-state-delta'] == [{'address': student, 'delta': [{
+        'key': base64.b64encode(b'diploma').decode(), 'value': {'action': 1, 'bytes': base64.b64encode(DIPLOMA).decode()}}]}]
+    assert txinfo['logs'] == [base64.b64encode(b'\x00' + DIPLOMA).decode()]
+    assert confirmation.block_transaction_info(block, block['txns'][1])['application-index'] == 1234
+
+def test_resolve_block():
+    """Test that a block resolves the transactions it confirms and fails those past their last valid round."""
+    private_key, sender = account.generate_account()
+    params = algosdk.transaction.SuggestedParams(1000, 5, 1005, base64.b64encode(GENESIS_HASH).decode(),
+                                                 GENESIS_ID, flat_fee=True)
+    txns = [algosdk.transaction.ApplicationNoOpTxn(sender, params, 1234, [b'\x01', DIPLOMA], [sender]),
+            algosdk.transaction.ApplicationCreateTxn(sender, params, 0, b'\x08\x81\x01\x43', b'\x08\x81\x01\x43',
+                                                     algosdk.transaction.StateSchema(0, 1),
+                                                     algosdk.transaction.StateSchema(0, 2))]
+    signed_txns = [txn.sign(private_key) for txn in txns]
+    block = confirmation.decode_block(algod_block(signed_txns))
+
+    confirmed, expired, unbounded = (confirmation.Future() for _ in range(3))
+    pending = {signed_txns[0].get_txid(): (confirmed, 1005), "EXPIRED": (expired, 7), "UNBOUNDED": (unbounded, None)}
+    confirmation.resolve_block(pending, 7, block)
+
+    assert confirmed.result()['confirmed-round'] == 7
+    assert isinstance(expired.exception(), confirmation.TransactionExpiredError)
+    assert list(pending) == ["UNBOUNDED"]
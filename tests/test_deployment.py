@@ -12,9 +12,12 @@ from algopytest import (
     clear_app,
 )
 
-def test_owner_funded(owner):
-    """Test whether the ``owner`` fixture was funded correctly."""
-    balance = account_balance(owner)
+def test_account_funded(create_user):
+    """Test whether a freshly created account was funded correctly.
+
+    The ``owner`` is shared by every test of a session and pays their fees,
+    so its balance is not checked here."""
+    balance = account_balance(create_user())
     assert balance == 1_000_000_000
 
 def test_initialization(owner, smart_contract_id):
@@ -0,0 +1,42 @@
+import os
+
+from algosdk import account
+from pytest import raises
+
+import batch
+import diploma_codec
+
+
+# Return the metadata of a diploma of the holder with `name`
+def metadata(name):
+    return diploma_codec.SEPARATOR.join([name, "MIT", "BSc", "2020"])
+
+
+def test_encode_longest_name():
+    """Test that the longest name still fits in local state along with the key of the diploma."""
+    name = "a" * (diploma_codec.MAX_SIZE - diploma_codec.LAYOUT.size)
+    diploma = diploma_codec.encode(metadata(name), 4)
+
+    assert len(diploma_codec.STATE_KEY) + len(diploma) == diploma_codec.MAX_KEY_VALUE_BYTES
+    assert diploma_codec.decode(diploma)['name'] == name
+
+
+def test_encode_too_long_name():
+    """Test that a name one UTF-8 byte too long is rejected, counting the bytes rather than the characters."""
+    name = "é" + "a" * (diploma_codec.MAX_SIZE - diploma_codec.LAYOUT.size - 1)
+
+    with raises(ValueError, match="at most 113 bytes"):
+        diploma_codec.encode(metadata(name), 4)
+
+
+def test_validate_too_long_name(tmp_path):
+    """Test that a diploma file holding a name too long to store is rejected before anything is sent."""
+    path = os.path.join(tmp_path, "diplomas.csv")
+    student = account.generate_account()[1]
+    with open(path, 'w') as dfile:
+        dfile.write("student,metadata,duration\n")
+        dfile.write("{},{},4\n".format(student, metadata("a" * 113)))
+        dfile.write("{},{},4\n".format(student, metadata("a" * 114)))
+
+    with raises(ValueError, match="row 2"):
+        batch.validate_diploma_file(path)
@@ -1,23 +1,57 @@
+import base64
+import hashlib
+
 import pytest
 import algosdk
+from algosdk.box_reference import BoxReference
+from algosdk.v2client import algod
 
 from algopytest import (
+    AlgoUser,
+    TxnElemsContext,
+    TxnIDContext,
     application_global_state,
     application_local_state,
     call_app, 
+    group_transaction,
     opt_in_app,
     close_out_app,
+    payment_transaction,
 )
+from algopytest.config_params import ConfigParams
+
+import diploma_events as events
+import diploma_methods as methods
+
+import diploma_codec
+import merkle
+
+def encode_diploma(name="Damian Barabonkov", duration=4, degree="BSc"):
+    """Return the diploma of ``name`` encoded by the client's codec, as it is issued on the chain."""
+    return diploma_codec.encode(f"{name} :: MIT :: {degree} :: Computer Science and Engineering :: 2020", duration)
+
+DIPLOMA = encode_diploma()
+
+def local_diploma(smart_contract_id, user):
+    """Return the raw diploma in the local state of ``user``, or ``None`` if there is none.
 
-DIPLOMA_METADATA = "Damian Barabonkov :: MIT :: BSc Computer Science and Engineering :: 2020"
+    The diplomas are binary, so they are read as bytes rather than decoded by AlgoPytest.
+    """
+    client = algod.AlgodClient(ConfigParams.algod_token, ConfigParams.algod_address)
+    local_state = client.account_application_info(user.address, smart_contract_id).get('app-local-state', {})
+    for entry in local_state.get('key-value', []):
+        if base64.b64decode(entry['key']) == b'diploma':
+            return base64.b64decode(entry['value']['bytes'])
+
+    return None
 
 def issue_diploma(owner_in, user_in, smart_contract_id):
     """Test that the ``issue_diploma`` logic of the smart contract passes."""
     # The application arguments and account to be passed in to 
     # the smart contract as it expects
-    app_args = ['issue_diploma', DIPLOMA_METADATA, 4]
+    app_args = [methods.ISSUE_DIPLOMA, DIPLOMA]
 
-    # Issue the `DIPLOMA_METADATA` to the recipient `user`
+    # Issue the `DIPLOMA` to the recipient `user`
     call_app(owner_in, smart_contract_id, app_args=app_args, accounts=[user_in])
 
 
@@ -37,43 +71,49 @@ def test_issue_diplomas(request, owner_in, users, smart_contract_id):
         issue_diploma(owner_in, user_in, smart_contract_id)
 
         # Check that the diploma was issued
-        state = application_local_state(smart_contract_id, user_in)
-        assert state['diploma'] == DIPLOMA_METADATA
-        assert state['degree_duration'] == 4
+        assert local_diploma(smart_contract_id, user_in) == DIPLOMA
 
-def test_issue_many_diplomas(request, owner_in, create_user, smart_contract_id):
+def test_issue_many_diplomas(owner_in, smart_contract_id):
     """Test that many diplomas may be issued to many users.
 
-    This test showcases how to use ``create_user`` to dynamically create users."""
+    This test showcases how to fund, opt in and close out dynamically created
+    users in atomic groups rather than one transaction at a time."""
     num_users = 8
     users = []
     for i in range(num_users):
-        user = create_user()
-        users.append(user)
-        opt_in_app(user, smart_contract_id)
+        private_key, address = algosdk.account.generate_account()
+        users.append(AlgoUser(address, private_key, f"many{i}"))
 
-        # Do some funky business to capture the `user` of this
-        # local scope for every iteration of the loop
-        def opt_out_fn(user):
-            def _wrapper():
-                close_out_app(user, smart_contract_id)
-            return _wrapper
+    # Fund every user from the `owner_in` and opt them all in, each in a single group
+    with TxnElemsContext():
+        funding = [payment_transaction(owner_in, user, 1_000_000) for user in users]
+    group_transaction(*funding)
 
-        # Opt out each `user` upon completion of this test, pass or fail
-        request.addfinalizer(opt_out_fn(user))
+    with TxnElemsContext():
+        opt_ins = [opt_in_app(user, smart_contract_id) for user in users]
+    group_transaction(*opt_ins)
 
-        issue_diploma(owner_in, user, smart_contract_id)
+    try:
+        # Issue the diplomas four at a time, in batches sent as one group
+        with TxnElemsContext():
+            batches = [issue_diplomas_batch(owner_in, users[i:i + 4], smart_contract_id)
+                       for i in range(0, num_users, 4)]
+        group_transaction(*batches)
 
-    for user in users:
-        # Check that the diploma was issued to `user`
-        state = application_local_state(smart_contract_id, user)
-        assert state['diploma'] == DIPLOMA_METADATA
-        assert state['degree_duration'] == 4
+        for i, user in enumerate(users):
+            # Check that the diploma was issued to `user`
+            assert local_diploma(smart_contract_id, user) == encode_diploma(f"Student {i % 4}", i % 4 + 1)
+    finally:
+        # Close out every user and return its funds to the `owner_in`, pass or fail
+        with TxnElemsContext():
+            close_outs = [close_out_app(user, smart_contract_id) for user in users]
+            close_outs += [payment_transaction(user, owner_in, 0, close_remainder_to=owner_in) for user in users]
+        group_transaction(*close_outs)
 
 
 def test_issue_diploma_raises(user1_in, smart_contract_id):
     """Test that no non-registrar may issue diplomas."""
-    # Issue the `DIPLOMA_METADATA` to the recipient `user1`
+    # Issue the `DIPLOMA` to the recipient `user1`
     with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):    
         issue_diploma(user1_in, user1_in, smart_contract_id)
 
@@ -83,12 +123,10 @@ def test_revoke_diploma(owner_in, user1_in, smart_contract_id):
     issue_diploma(owner_in, user1_in, smart_contract_id)
 
     # Check that the diploma was issued
-    state = application_local_state(smart_contract_id, user1_in)
-    assert state['diploma'] == DIPLOMA_METADATA
-    assert state['degree_duration'] == 4
+    assert local_diploma(smart_contract_id, user1_in) == DIPLOMA
 
-    # Revoke the `DIPLOMA_METADATA` to the `user1`
-    call_app(owner_in, smart_contract_id, app_args=['revoke_diploma'], accounts=[user1_in])
+    # Revoke the `DIPLOMA` of the `user1`
+    call_app(owner_in, smart_contract_id, app_args=[methods.REVOKE_DIPLOMA], accounts=[user1_in])
 
     # Check that the diploma has been revoked
     state = application_local_state(smart_contract_id, user1_in)
@@ -100,18 +138,62 @@ def test_revoke_diploma_raises(owner_in, user1_in, user2_in, smart_contract_id):
     issue_diploma(owner_in, user1_in, smart_contract_id)
 
     # Check that the diploma was issued
-    state = application_local_state(smart_contract_id, user1_in)
-    assert state['diploma'] == DIPLOMA_METADATA
-    assert state['degree_duration'] == 4
+    assert local_diploma(smart_contract_id, user1_in) == DIPLOMA
 
-    # The `user2` attempts to revoke the `DIPLOMA_METADATA` of `user1`
+    # The `user2` attempts to revoke the `DIPLOMA` of `user1`
     with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):    
-        call_app(user2_in, smart_contract_id, app_args=['revoke_diploma'], accounts=[user1_in])
+        call_app(user2_in, smart_contract_id, app_args=[methods.REVOKE_DIPLOMA], accounts=[user1_in])
+
+def issue_diplomas_batch(owner_in, users_in, smart_contract_id):
+    """Issue a distinct diploma to every user of ``users_in`` in a single application call."""
+    app_args = [methods.ISSUE_DIPLOMAS_BATCH]
+    for i, _ in enumerate(users_in):
+        app_args.append(encode_diploma(f"Student {i}", i + 1))
+
+    return call_app(owner_in, smart_contract_id, app_args=app_args, accounts=users_in)
+
+def test_issue_diplomas_batch(owner_in, user1_in, user2_in, user3_in, user4_in, smart_contract_id):
+    """Test that up to four diplomas may be issued in one application call."""
+    users_in = [user1_in, user2_in, user3_in, user4_in]
+    issue_diplomas_batch(owner_in, users_in, smart_contract_id)
+
+    # Check that every user got its own diploma
+    for i, user_in in enumerate(users_in):
+        assert local_diploma(smart_contract_id, user_in) == encode_diploma(f"Student {i}", i + 1)
+
+def test_issue_diplomas_batch_raises(owner_in, user1_in, user2_in, smart_contract_id):
+    """Test that no non-registrar may batch issue diplomas, nor with missing arguments."""
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        issue_diplomas_batch(user1_in, [user1_in, user2_in], smart_contract_id)
+
+    # The registrar supplies two accounts but only one diploma
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app(owner_in, smart_contract_id, app_args=[methods.ISSUE_DIPLOMAS_BATCH, DIPLOMA],
+                 accounts=[user1_in, user2_in])
+
+def test_revoke_diplomas_batch(owner_in, user1_in, user2_in, user3_in, smart_contract_id):
+    """Test that the owner may revoke several diplomas in one application call."""
+    issue_diplomas_batch(owner_in, [user1_in, user2_in, user3_in], smart_contract_id)
+
+    # Revoke the diplomas of `user1` and `user3` only
+    call_app(owner_in, smart_contract_id, app_args=[methods.REVOKE_DIPLOMAS_BATCH], accounts=[user1_in, user3_in])
+
+    # Check that only those diplomas have been revoked
+    assert application_local_state(smart_contract_id, user1_in) == {}
+    assert local_diploma(smart_contract_id, user2_in) == encode_diploma("Student 1", 2)
+    assert application_local_state(smart_contract_id, user3_in) == {}
+
+def test_revoke_diplomas_batch_raises(owner_in, user1_in, user2_in, smart_contract_id):
+    """Test that no non-registrar may batch revoke diplomas."""
+    issue_diplomas_batch(owner_in, [user1_in, user2_in], smart_contract_id)
+
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app(user2_in, smart_contract_id, app_args=[methods.REVOKE_DIPLOMAS_BATCH], accounts=[user1_in, user2_in])
 
 def test_reassign_registrar(owner_in, user1_in, smart_contract_id):
     """Test that the registrar may be reassigned."""
     # Make the `user1` the registrar
-    call_app(owner_in, smart_contract_id, app_args=['reassign_registrar'], accounts=[user1_in])
+    call_app(owner_in, smart_contract_id, app_args=[methods.REASSIGN_REGISTRAR], accounts=[user1_in])
 
     # Read the registrar's address from the application's global state
     state = application_global_state(
@@ -124,10 +206,317 @@ def test_reassign_registrar(owner_in, user1_in, smart_contract_id):
 
     # In order for the `smart_contract_id` to be cleaned up correctly by AlgoPytest,
     # creator of the smart contract must be reverted as the registrar
-    call_app(user1_in, smart_contract_id, app_args=['reassign_registrar'], accounts=[owner_in])
+    call_app(user1_in, smart_contract_id, app_args=[methods.REASSIGN_REGISTRAR], accounts=[owner_in])
 
 def test_reassign_registrar_raises(user1_in, smart_contract_id):
     """Test that no non-registrar may re-assign the current registrar."""
     # Make the `user1` attempt to take over as the registrar
     with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):    
-        call_app(user1_in, smart_contract_id, app_args=['reassign_registrar'], accounts=[user1_in])
+        call_app(user1_in, smart_contract_id, app_args=[methods.REASSIGN_REGISTRAR], accounts=[user1_in])
+
+def call_logs(txn_id):
+    """Return the logs of the confirmed transaction ``txn_id``."""
+    client = algod.AlgodClient(ConfigParams.algod_token, ConfigParams.algod_address)
+    return [base64.b64decode(log) for log in client.pending_transaction_info(txn_id).get('logs', [])]
+
+def issued_event(user, diploma=DIPLOMA):
+    """Return the event logged by issuing a diploma to ``user``."""
+    return events.ISSUED + algosdk.encoding.decode_address(user.address) + diploma
+
+def test_issue_diploma_logs(owner_in, user1_in, smart_contract_id):
+    """Test that issuing a diploma logs an ``ISSUED`` event."""
+    with TxnIDContext():
+        txn_id, _ = call_app(owner_in, smart_contract_id, app_args=[methods.ISSUE_DIPLOMA, DIPLOMA],
+                             accounts=[user1_in])
+
+    assert call_logs(txn_id) == [issued_event(user1_in)]
+
+def test_issue_diplomas_batch_logs(owner_in, user1_in, user2_in, smart_contract_id):
+    """Test that a batch issuance logs an ``ISSUED`` event per diploma, in the order of the accounts."""
+    phd = encode_diploma(degree="PhD", duration=6)
+    app_args = [methods.ISSUE_DIPLOMAS_BATCH, DIPLOMA, phd]
+    with TxnIDContext():
+        txn_id, _ = call_app(owner_in, smart_contract_id, app_args=app_args, accounts=[user1_in, user2_in])
+
+    assert call_logs(txn_id) == [issued_event(user1_in), issued_event(user2_in, phd)]
+
+def test_revoke_diploma_logs(owner_in, user1_in, smart_contract_id):
+    """Test that revoking a diploma logs a ``REVOKED`` event."""
+    issue_diploma(owner_in, user1_in, smart_contract_id)
+    with TxnIDContext():
+        txn_id, _ = call_app(owner_in, smart_contract_id, app_args=[methods.REVOKE_DIPLOMA], accounts=[user1_in])
+
+    assert call_logs(txn_id) == [events.REVOKED + algosdk.encoding.decode_address(user1_in.address)]
+
+def test_reassign_registrar_logs(owner_in, user1_in, smart_contract_id):
+    """Test that reassigning the registrar logs a ``REGISTRAR_REASSIGNED`` event."""
+    with TxnIDContext():
+        txn_id, _ = call_app(owner_in, smart_contract_id, app_args=[methods.REASSIGN_REGISTRAR], accounts=[user1_in])
+
+    assert call_logs(txn_id) == [events.REGISTRAR_REASSIGNED + algosdk.encoding.decode_address(user1_in.address)]
+
+def call_app_with_box(sender, smart_contract_id, app_args, user):
+    """Call the smart contract with ``user`` as the account and its diploma box referenced."""
+    with TxnElemsContext():
+        signer, txn = call_app(sender, smart_contract_id, app_args=app_args, accounts=[user])
+
+    # AlgoPytest does not take box references, so add one to the unsent transaction
+    box_name = algosdk.encoding.decode_address(user.address)
+    txn.boxes = BoxReference.translate_box_references([(0, box_name)], txn.foreign_apps, txn.index)
+    group_transaction((signer, txn))
+
+def diploma_box(smart_contract_id, user):
+    """Return the value of the diploma box of ``user``, or ``None`` if there is none."""
+    client = algod.AlgodClient(ConfigParams.algod_token, ConfigParams.algod_address)
+    box_name = algosdk.encoding.decode_address(user.address)
+    try:
+        box = client.application_box_by_name(smart_contract_id, box_name)
+    except algosdk.error.AlgodHTTPError:
+        return None
+
+    return base64.b64decode(box['value'])
+
+def test_issue_diploma_box(owner, user1, user2, smart_contract_id):
+    """Test that diplomas may be issued into boxes without the users opting in."""
+    app_args = [methods.ISSUE_DIPLOMA_BOX, DIPLOMA]
+    for user in [user1, user2]:
+        call_app_with_box(owner, smart_contract_id, app_args, user)
+
+        # Check that the diploma was issued
+        assert diploma_box(smart_contract_id, user) == DIPLOMA
+
+def test_reissue_diploma_box(owner, user1, smart_contract_id):
+    """Test that a diploma box may be reissued with a diploma of a different length."""
+    phd = encode_diploma("D. Barabonkov", degree="PhD", duration=6)
+    call_app_with_box(owner, smart_contract_id, [methods.ISSUE_DIPLOMA_BOX, DIPLOMA], user1)
+    call_app_with_box(owner, smart_contract_id, [methods.ISSUE_DIPLOMA_BOX, phd], user1)
+
+    # Check that the diploma was replaced
+    assert diploma_box(smart_contract_id, user1) == phd
+
+def test_issue_diploma_box_raises(user1, smart_contract_id):
+    """Test that no non-registrar may issue diploma boxes."""
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_box(user1, smart_contract_id, [methods.ISSUE_DIPLOMA_BOX, DIPLOMA], user1)
+
+def test_revoke_diploma_box(owner, user1, smart_contract_id):
+    """Test that the owner may revoke a diploma box."""
+    call_app_with_box(owner, smart_contract_id, [methods.ISSUE_DIPLOMA_BOX, DIPLOMA], user1)
+    assert diploma_box(smart_contract_id, user1) is not None
+
+    # Revoke the diploma box of `user1`
+    call_app_with_box(owner, smart_contract_id, [methods.REVOKE_DIPLOMA_BOX], user1)
+
+    # Check that the diploma box has been deleted
+    assert diploma_box(smart_contract_id, user1) is None
+
+def test_revoke_diploma_box_raises(owner, user1, user2, smart_contract_id):
+    """Test that no non-registrar may revoke a diploma box."""
+    call_app_with_box(owner, smart_contract_id, [methods.ISSUE_DIPLOMA_BOX, DIPLOMA], user1)
+
+    # The `user2` attempts to revoke the diploma box of `user1`
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_box(user2, smart_contract_id, [methods.REVOKE_DIPLOMA_BOX], user1)
+
+def test_unknown_selector_raises(owner_in, user1_in, smart_contract_id):
+    """Test that a call naming no method of the smart contract is rejected."""
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: err opcode executed'):
+        call_app(owner_in, smart_contract_id, app_args=[b'\x7f'], accounts=[user1_in])
+
+def merkle_leaf(user, diploma=DIPLOMA):
+    """Return the leaf hash of the diploma of ``user`` in a cohort's Merkle tree."""
+    return merkle.leaf_hash(user.address, diploma)
+
+def merkle_cohort(leaves):
+    """Return the root of the Merkle tree of ``leaves`` and the proof of its first leaf."""
+    tree = merkle.MerkleTree(leaves)
+    return tree.root, tree.proof(0)
+
+def revocation_box_name(user, root):
+    """Return the name of the box recording the revocation of the diploma of ``user`` from the cohort ``root``."""
+    return algosdk.encoding.decode_address(user.address) + root
+
+def call_app_with_cohort(sender, smart_contract_id, app_args, users, root, budget_calls=0):
+    """Call the smart contract with the box of the cohort ``root`` referenced, grouped with ``budget_calls``.
+
+    The boxes recording the revocation of the diplomas of the ``users`` from the cohort are referenced too.
+    """
+    with TxnElemsContext():
+        signer, txn = call_app(sender, smart_contract_id, app_args=app_args, accounts=users)
+        budget_txns = [call_app(sender, smart_contract_id, app_args=[methods.INCREASE_BUDGET], note=str(i))
+                       for i in range(budget_calls)]
+
+    # AlgoPytest does not take box references, so add them to the unsent transaction
+    box_names = [b'cohort' + root] + [revocation_box_name(user, root) for user in users]
+    txn.boxes = BoxReference.translate_box_references([(0, name) for name in box_names], txn.foreign_apps,
+                                                      txn.index)
+    group_transaction((signer, txn), *budget_txns)
+
+def cohort_box(smart_contract_id, root):
+    """Return the value of the box of the cohort ``root``, or ``None`` if there is none."""
+    client = algod.AlgodClient(ConfigParams.algod_token, ConfigParams.algod_address)
+    try:
+        box = client.application_box_by_name(smart_contract_id, b'cohort' + root)
+    except algosdk.error.AlgodHTTPError:
+        return None
+
+    return base64.b64decode(box['value'])
+
+def proof_args(selector, root, proof, diploma=DIPLOMA):
+    """Return the application arguments of a call verifying a proof of a diploma, as the client encodes them."""
+    record = {'diploma': diploma, 'root': root, 'proof': proof}
+    return merkle.proof_args(record, claim=selector == methods.CLAIM_DIPLOMA)
+
+def test_commit_cohort(owner, user1, user2, smart_contract_id):
+    """Test that the owner may commit a cohort as a Merkle root."""
+    root, _ = merkle_cohort([merkle_leaf(user1), merkle_leaf(user2)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+
+    # Check that the cohort box holds the round of its commitment
+    assert int.from_bytes(cohort_box(smart_contract_id, root), 'big') > 0
+
+def test_commit_cohort_raises(user1, user2, smart_contract_id):
+    """Test that no non-registrar may commit a cohort."""
+    root, _ = merkle_cohort([merkle_leaf(user1), merkle_leaf(user2)])
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(user1, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+
+def test_verify_diploma_proof(owner, user1, user2, user3, smart_contract_id):
+    """Test that anyone may verify the proof of a diploma of a committed cohort."""
+    root, proof = merkle_cohort([merkle_leaf(user1), merkle_leaf(user2), merkle_leaf(user3)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+
+    # The `user2` verifies the diploma of `user1`
+    app_args = proof_args(methods.VERIFY_DIPLOMA_PROOF, root, proof)
+    call_app_with_cohort(user2, smart_contract_id, app_args, [user1], root)
+
+@pytest.mark.parametrize(
+    "diploma",
+    [
+        # A diploma with another degree than committed
+        encode_diploma(degree="PhD"),
+        # A diploma with another degree duration than committed
+        encode_diploma(duration=6),
+    ]
+)
+def test_verify_diploma_proof_raises(owner, user1, user2, diploma, smart_contract_id):
+    """Test that a diploma other than the committed one does not verify."""
+    root, proof = merkle_cohort([merkle_leaf(user1), merkle_leaf(user2)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+
+    app_args = proof_args(methods.VERIFY_DIPLOMA_PROOF, root, proof, diploma)
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(user1, smart_contract_id, app_args, [user1], root)
+
+def test_claim_diploma(owner, user1_in, user2, smart_contract_id):
+    """Test that a diploma of a committed cohort may be moved into local storage."""
+    root, proof = merkle_cohort([merkle_leaf(user1_in), merkle_leaf(user2)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+
+    app_args = proof_args(methods.CLAIM_DIPLOMA, root, proof)
+    call_app_with_cohort(user1_in, smart_contract_id, app_args, [user1_in], root)
+
+    # Check that the diploma was claimed
+    assert local_diploma(smart_contract_id, user1_in) == DIPLOMA
+
+def test_claim_diploma_budget(owner, user1_in, smart_contract_id):
+    """Test that a long proof verifies only with the budget of the calls grouped with it."""
+    # A cohort of 1024 diplomas, where all but the one of `user1` are dummies
+    leaves = [merkle_leaf(user1_in)] + [hashlib.sha256(i.to_bytes(8, 'big')).digest() for i in range(1023)]
+    root, proof = merkle_cohort(leaves)
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+
+    app_args = proof_args(methods.CLAIM_DIPLOMA, root, proof)
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'dynamic cost budget exceeded'):
+        call_app_with_cohort(user1_in, smart_contract_id, app_args, [user1_in], root)
+    call_app_with_cohort(user1_in, smart_contract_id, app_args, [user1_in], root, budget_calls=1)
+
+    # Check that the diploma was claimed
+    assert local_diploma(smart_contract_id, user1_in) == DIPLOMA
+
+def test_revoke_cohort(owner, user1, user2, smart_contract_id):
+    """Test that no diploma of a revoked cohort verifies."""
+    root, proof = merkle_cohort([merkle_leaf(user1), merkle_leaf(user2)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+    call_app_with_cohort(owner, smart_contract_id, [methods.REVOKE_COHORT, root], [], root)
+
+    # Check that the cohort box has been deleted
+    assert cohort_box(smart_contract_id, root) is None
+
+    app_args = proof_args(methods.VERIFY_DIPLOMA_PROOF, root, proof)
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(user1, smart_contract_id, app_args, [user1], root)
+
+def test_revoke_claimed_diploma(owner, user1_in, user2, smart_contract_id):
+    """Test that a diploma revoked from its cohort can neither be claimed again nor verified."""
+    root, proof = merkle_cohort([merkle_leaf(user1_in), merkle_leaf(user2)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+
+    app_args = proof_args(methods.CLAIM_DIPLOMA, root, proof)
+    call_app_with_cohort(user1_in, smart_contract_id, app_args, [user1_in], root)
+
+    # Revoke the claimed diploma of `user1` from its cohort
+    call_app_with_cohort(owner, smart_contract_id, [methods.REVOKE_DIPLOMA, root], [user1_in], root)
+    assert local_diploma(smart_contract_id, user1_in) is None
+
+    # Resubmitting the same proof does not bring the diploma back
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(user1_in, smart_contract_id, app_args, [user1_in], root)
+    assert local_diploma(smart_contract_id, user1_in) is None
+
+    verify_args = proof_args(methods.VERIFY_DIPLOMA_PROOF, root, proof)
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(user2, smart_contract_id, verify_args, [user1_in], root)
+
+    # Once reinstated, the diploma verifies again
+    call_app_with_cohort(owner, smart_contract_id, [methods.REINSTATE_DIPLOMA, root], [user1_in], root)
+    call_app_with_cohort(user2, smart_contract_id, verify_args, [user1_in], root)
+
+def test_revoke_claimed_diploma_without_root(owner, user1_in, user2, smart_contract_id):
+    """Test that a claimed diploma revoked without its cohort root cannot be claimed again."""
+    root, proof = merkle_cohort([merkle_leaf(user1_in), merkle_leaf(user2)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+
+    app_args = proof_args(methods.CLAIM_DIPLOMA, root, proof)
+    call_app_with_cohort(user1_in, smart_contract_id, app_args, [user1_in], root)
+
+    # The claim keeps its cohort root, so a plain revocation records its revocation from the cohort
+    call_app_with_cohort(owner, smart_contract_id, [methods.REVOKE_DIPLOMA], [user1_in], root)
+    assert local_diploma(smart_contract_id, user1_in) is None
+
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(user1_in, smart_contract_id, app_args, [user1_in], root)
+    assert local_diploma(smart_contract_id, user1_in) is None
+
+def test_revoke_claimed_diplomas_batch(owner, user1_in, user2, smart_contract_id):
+    """Test that a claimed diploma revoked in a batch cannot be claimed again."""
+    root, proof = merkle_cohort([merkle_leaf(user1_in), merkle_leaf(user2)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+
+    app_args = proof_args(methods.CLAIM_DIPLOMA, root, proof)
+    call_app_with_cohort(user1_in, smart_contract_id, app_args, [user1_in], root)
+    call_app_with_cohort(owner, smart_contract_id, [methods.REVOKE_DIPLOMAS_BATCH], [user1_in], root)
+
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(user1_in, smart_contract_id, app_args, [user1_in], root)
+    assert local_diploma(smart_contract_id, user1_in) is None
+
+def test_revoke_unclaimed_diploma(owner, user1, user2, smart_contract_id):
+    """Test that a diploma of a cohort may be revoked before its student has opted in to claim it."""
+    root, proof = merkle_cohort([merkle_leaf(user1), merkle_leaf(user2)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.COMMIT_COHORT, root], [], root)
+    call_app_with_cohort(owner, smart_contract_id, [methods.REVOKE_DIPLOMA, root], [user1], root)
+
+    app_args = proof_args(methods.VERIFY_DIPLOMA_PROOF, root, proof)
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(user2, smart_contract_id, app_args, [user1], root)
+
+def test_reinstate_diploma_raises(owner, user1, user2, smart_contract_id):
+    """Test that no non-registrar may lift a revocation, nor one that was never recorded."""
+    root, _ = merkle_cohort([merkle_leaf(user1), merkle_leaf(user2)])
+    call_app_with_cohort(owner, smart_contract_id, [methods.REVOKE_DIPLOMA, root], [user1], root)
+
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(user1, smart_contract_id, [methods.REINSTATE_DIPLOMA, root], [user1], root)
+    with pytest.raises(algosdk.error.AlgodHTTPError, match=r'transaction .*: logic eval error: assert failed'):
+        call_app_with_cohort(owner, smart_contract_id, [methods.REINSTATE_DIPLOMA, root], [user2], root)
@@ -0,0 +1,108 @@
+import os
+
+from algosdk import account, logic
+
+from assets import diploma_methods as methods
+
+import async_client
+import diploma_codec
+import fake_algod
+import journal
+import merkle
+from conftest import USER_FUNDS, fake_students
+
+DIPLOMA = diploma_codec.encode("Damian Barabonkov :: MIT :: BSc :: Mathematics :: 2020", 4)
+
+class Interrupted(Exception):
+    """Stands in for the process dying, which the journal must survive."""
+
+class LostResponseClient(fake_algod.FakeAlgodClient):
+    """A client of the fake ``node`` whose first ``failures`` sends raise ``error`` after the node accepted them."""
+
+    def __init__(self, node, error, failures=1):
+        super().__init__(node)
+        self.error = error
+        self.failures = failures
+
+    def send_raw_transaction(self, txn, **kwargs):
+        txid = super().send_raw_transaction(txn, **kwargs)
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return txid
+
+def issued_on_chain(node, app_id):
+    """Return the students of every diploma issued to them by a confirmed ``issue_diplomas_batch`` call."""
+    students = []
+    for block in node.blocks:
+        for stxn in block['txns']:
+            txn = stxn['txn']
+            if txn.get('apid') == app_id and txn.get('apaa', [b''])[0] == methods.ISSUE_DIPLOMAS_BATCH:
+                students += txn['apat']
+    return students
+
+def test_resume_after_interrupted_submit(fake_app, tmp_path):
+    """Test that a job dying after its group was sent resumes without issuing any diploma twice."""
+    node, client, private_key, app_id = fake_app
+    students = fake_students(node, client, app_id, 8)
+    rows = [(student, DIPLOMA) for student in students]
+    path = os.path.join(tmp_path, "job.db")
+
+    # The node accepts the group, but the job dies before it learns so
+    try:
+        journal.issue_diplomas(LostResponseClient(node, Interrupted()), path, private_key, app_id, rows)
+    except Interrupted:
+        pass
+    else:
+        raise AssertionError("The job was not interrupted")
+
+    job = journal.Journal(path)
+    assert job.counts()[journal.SIGNED] == len(rows)
+    job.close()
+
+    # The resumed job neither reads the rows again nor issues their diplomas again
+    issued, failed = journal.issue_diplomas(fake_algod.FakeAlgodClient(node), path, private_key, app_id, [])
+    assert (issued, failed) == (len(rows), 0)
+    assert len(issued_on_chain(node, app_id)) == len(rows)
+
+def test_resend_already_in_ledger(fake_app, tmp_path, capsys):
+    """Test that a group resent after its response was lost counts as confirmed when the node reports it in the ledger."""
+    node, client, private_key, app_id = fake_app
+    students = fake_students(node, client, app_id, 8)
+    rows = [(student, DIPLOMA) for student in students]
+    path = os.path.join(tmp_path, "job.db")
+
+    # The lost response looks transient, so the same group is signed and sent again
+    lossy_client = LostResponseClient(node, ConnectionResetError("Connection reset by peer"))
+    issued, failed = journal.issue_diplomas(lossy_client, path, private_key, app_id, rows)
+    assert (issued, failed) == (len(rows), 0)
+    assert "retrying" in capsys.readouterr().out
+    assert len(issued_on_chain(node, app_id)) == len(rows)
+
+    job = journal.Journal(path)
+    assert job.counts()[journal.CONFIRMED] == len(rows)
+    assert job.submissions() == []
+    job.close()
+
+def test_revoke_claimed_diploma(fake_app, tmp_path):
+    """Test that a revocation job revokes a claimed diploma from the cohort it was claimed from."""
+    node, client, private_key, app_id = fake_app
+    node.fund(logic.get_application_address(app_id), 1_000_000)
+    student_key, student = account.generate_account()
+    node.fund(student, USER_FUNDS)
+    async_client.run_sync(client, async_client.opt_in_app, student_key, app_id)
+    other, = fake_students(node, client, app_id, 1)
+
+    tree = merkle.MerkleTree([merkle.leaf_hash(student, DIPLOMA), merkle.leaf_hash(other, DIPLOMA)])
+    record = {'student': student, 'diploma': DIPLOMA, 'root': tree.root, 'proof': tree.proof(0)}
+    async_client.run_sync(client, async_client.call_app, private_key, app_id, [methods.COMMIT_COHORT, tree.root], [],
+                          [merkle.cohort_box(tree.root)])
+    async_client.run_sync(client, async_client.call_app, student_key, app_id, merkle.proof_args(record, claim=True),
+                          [student], [merkle.cohort_box(tree.root), merkle.revocation_box(student, tree.root)])
+
+    # Only the claimed diploma is revoked from its cohort, the other had none to revoke from
+    revoked, failed = journal.revoke_diplomas(client, os.path.join(tmp_path, "job.db"), private_key, app_id,
+                                              [student, other])
+    assert (revoked, failed) == (2, 0)
+    assert merkle.get_revocation_round(client, app_id, student, tree.root) is not None
+    assert merkle.get_revocation_round(client, app_id, other, tree.root) is None
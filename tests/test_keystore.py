@@ -0,0 +1,101 @@
+import os
+import stat
+
+from algosdk import account, mnemonic
+
+import keystore
+
+def generate_accounts(*names):
+    """Return a fresh mnemonic for every account of ``names``, as parsed from the configuration file."""
+    return {name: mnemonic.from_private_key(account.generate_account()[0]) for name in names}
+
+def test_lazy_keys():
+    """Test that ``LazyKeys`` derives each key on first access only, and at most once."""
+    accounts = {"alice": "alice's key", "bob": "bob's key"}
+    derived = []
+
+    def derive(name):
+        derived.append(name)
+        return accounts[name]
+
+    keys = keystore.LazyKeys(accounts.keys, derive)
+    assert sorted(keys) == ["alice", "bob"] and len(keys) == 2
+    assert derived == []
+
+    assert keys["bob"] == "bob's key"
+    assert keys["bob"] == "bob's key"
+    assert derived == ["bob"]
+    assert keys.get("charlie") is None
+
+def test_import_accounts(tmp_path):
+    """Test that the keystore is only readable by its owner and holds the keys of the imported accounts."""
+    path = os.path.join(tmp_path, "keystore.db")
+    accounts = generate_accounts("alice", "bob")
+
+    umask = os.umask(0o022)
+    try:
+        assert keystore.import_accounts(path, "alice", accounts, 44, digest="digest") == 2
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    store = keystore.Keystore(path)
+    assert (store.registrar, store.app_id, store.config_digest) == ("alice", 44, "digest")
+    assert store.pub_keys["bob"] == account.address_from_private_key(mnemonic.to_private_key(accounts["bob"]))
+    assert store.priv_keys["alice"] == mnemonic.to_private_key(accounts["alice"])
+    store.close()
+
+def test_reimport_drops_accounts(tmp_path):
+    """Test that importing the accounts again drops those no longer listed and records the new digest."""
+    path = os.path.join(tmp_path, "keystore.db")
+    accounts = generate_accounts("alice", "bob")
+    keystore.import_accounts(path, "alice", accounts, 44, digest="before")
+
+    del accounts["bob"]
+    keystore.import_accounts(path, "alice", accounts, 45, digest="after")
+    store = keystore.Keystore(path)
+    assert list(store.pub_keys) == ["alice"]
+    assert (store.app_id, store.config_digest) == (45, "after")
+    store.close()
+
+def test_config_digest(tmp_path):
+    """Test that the digest of a configuration file changes with its contents."""
+    path = os.path.join(tmp_path, "config.yml")
+    with open(path, 'w') as cfile:
+        cfile.write("APP_ID: 44\n")
+    digest = keystore.config_digest(path)
+    assert keystore.config_digest(path) == digest
+
+    with open(path, 'w') as cfile:
+        cfile.write("APP_ID: 45\n")
+    assert keystore.config_digest(path) != digest
+
+def test_config_changed(tmp_path, monkeypatch):
+    """Test that the configuration file is only hashed once its size or modification time changed."""
+    path = os.path.join(tmp_path, "config.yml")
+    store_path = os.path.join(tmp_path, "keystore.db")
+    with open(path, 'w') as cfile:
+        cfile.write("APP_ID: 44\n")
+    keystore.import_accounts(store_path, "alice", generate_accounts("alice"), 44,
+                             digest=keystore.config_digest(path), stat=keystore.config_stat(path))
+
+    digested = []
+    config_digest = keystore.config_digest
+    monkeypatch.setattr(keystore, "config_digest", lambda path: digested.append(path) or config_digest(path))
+
+    store = keystore.Keystore(store_path)
+    assert not store.config_changed(path)
+    assert digested == []
+
+    # Touching the file without changing it costs one digest, after which its stat is recorded
+    os.utime(path, ns=(0, 0))
+    assert not store.config_changed(path)
+    store.close()
+    store = keystore.Keystore(store_path)
+    assert not store.config_changed(path)
+    assert len(digested) == 1
+
+    with open(path, 'w') as cfile:
+        cfile.write("APP_ID: 45\n")
+    assert store.config_changed(path)
+    store.close()
@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+
+import build_cache
+import metrics
+
+@pytest.fixture
+def registry():
+    """Switch on the recording of metrics and spans for one test."""
+    metrics.enable(tracing=True)
+    yield
+    metrics.disable()
+
+def record_request():
+    """Record one request to the node inside a span."""
+    with metrics.span("send", groups=1):
+        metrics.observe_node_request('POST', '/v2/transactions', 0.01, sent=100, received=50)
+
+def test_export_prometheus(registry, tmp_path):
+    """Test that the Prometheus export holds every recorded metric and leaves no temporary file behind."""
+    path = os.path.join(tmp_path, "diploma.prom")
+    record_request()
+    metrics.export(path)
+
+    with open(path) as mfile:
+        content = mfile.read()
+    assert 'algo_diploma_node_request_seconds_count{endpoint="/v2/transactions",method="POST"} 1' in content
+    assert 'algo_diploma_node_sent_bytes_total{endpoint="/v2/transactions"} 100' in content
+    assert 'algo_diploma_phase_seconds_count{phase="send"} 1' in content
+    assert os.listdir(tmp_path) == ["diploma.prom"]
+
+def test_export_json(registry, tmp_path):
+    """Test that the JSON export holds the spans of the trace."""
+    path = os.path.join(tmp_path, "diploma.json")
+    record_request()
+    metrics.export(path)
+
+    with open(path) as mfile:
+        exported = json.load(mfile)
+    assert [(span['name'], span['attributes']) for span in exported['spans']] == [("send", {'groups': 1})]
+
+def test_export_atomic(registry, tmp_path, monkeypatch):
+    """Test that an export replaces the previous one whole, and leaves it in place when it fails."""
+    path = os.path.join(tmp_path, "diploma.prom")
+    with open(path, 'w') as mfile:
+        mfile.write("previous export\n")
+    record_request()
+    replace = os.replace
+
+    # The previous export stays in place until the new one is completely written
+    def checked_replace(src, dst):
+        with open(dst) as mfile:
+            assert mfile.read() == "previous export\n"
+        with open(src) as mfile:
+            assert mfile.read() == metrics._registry.to_prometheus()
+        replace(src, dst)
+    monkeypatch.setattr(os, "replace", checked_replace)
+    metrics.export(path)
+    with open(path) as mfile:
+        exported = mfile.read()
+    assert exported != "previous export\n"
+
+    def failed_replace(src, dst):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(os, "replace", failed_replace)
+    record_request()
+    with pytest.raises(OSError):
+        metrics.export(path)
+    with open(path) as mfile:
+        assert mfile.read() == exported
+    assert os.listdir(tmp_path) == ["diploma.prom"]
+
+class CompilingClient:
+    """A client whose compilations of TEAL are counted, returning a fixed program."""
+
+    def __init__(self):
+        self.compiled = 0
+
+    def compile(self, teal):
+        self.compiled += 1
+        return {'result': "AQ==", 'hash': "hash"}
+
+def test_compile_span_on_cache_miss(registry, tmp_path, monkeypatch):
+    """Test that compiling a program missing from the build cache is recorded as a compile span."""
+    monkeypatch.setattr(build_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(build_cache, "_compiled", {})
+    monkeypatch.setattr(build_cache, "generate_teal", lambda name, teal_version: "#pragma version 8\nint 1\n")
+    client = CompilingClient()
+
+    assert build_cache.compiled_program(client, "clear_program") == b'\x01'
+    assert [span['name'] for span in metrics._registry.to_json()['spans']] == ["compile"]
+
+    # The cached bytecode is loaded again without compiling
+    monkeypatch.setattr(build_cache, "_compiled", {})
+    assert build_cache.compiled_program(client, "clear_program") == b'\x01'
+    assert client.compiled == 1
+    assert len(metrics._registry.to_json()['spans']) == 1
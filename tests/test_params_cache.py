@@ -0,0 +1,40 @@
+import algosdk.transaction
+
+import confirmation
+import fake_algod
+import params_cache
+
+def produce_blocks(node, client, count):
+    """Have the in-process fake ``node`` produce ``count`` blocks, one payment each."""
+    private_key = node.genesis_keys[node.genesis_account]
+    for i in range(count):
+        txn = algosdk.transaction.PaymentTxn(node.genesis_account, client.suggested_params(),
+                                             node.genesis_account, 0, note=bytes([i]))
+        client.send_transaction(txn.sign(private_key))
+
+def test_params_age_by_observed_rounds():
+    """Test that the cached params are refetched once enough rounds are observed, however fast they came."""
+    node = fake_algod.FakeAlgod()
+    client = fake_algod.FakeAlgodClient(node)
+    provider = params_cache.SuggestedParamsProvider(client, refresh_rounds=5)
+    first = provider.get().first
+
+    # The rounds pass well within the time of one round, so only the observed round ages the params
+    produce_blocks(node, client, 5)
+    provider.observe_round(node.last_round)
+    assert provider.get().first == first
+
+    produce_blocks(node, client, 1)
+    provider.observe_round(node.last_round)
+    assert provider.get().first == node.last_round
+
+def test_confirmation_tracker_reports_rounds():
+    """Test that the rounds polled by a ``ConfirmationTracker`` age the shared params of its client."""
+    node = fake_algod.FakeAlgod()
+    client = fake_algod.FakeAlgodClient(node)
+    provider = params_cache.get_provider(client)
+    tracker = confirmation.ConfirmationTracker(client)
+
+    produce_blocks(node, client, params_cache.REFRESH_ROUNDS + 1)
+    tracker.poll()
+    assert provider.get().first == node.last_round
@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# A server whose command prints, and starts a thread that prints outside of any command
+SERVER = """
+import threading
+import server
+
+def run_command(session, args):
+    print("ran", args[0])
+    worker = threading.Thread(target=print, args=("worker of", args[0]))
+    worker.start()
+    worker.join()
+
+server.serve_stdin(None, run_command)
+"""
+
+def test_stdin_responses_only():
+    """Test that only the responses reach stdout in stdin mode, and output printed by other threads goes to stderr."""
+    requests = "".join(json.dumps({'id': i, 'args': ["cmd{}".format(i)]}) + "\n" for i in range(8))
+    result = subprocess.run([sys.executable, "-c", SERVER], input=requests, capture_output=True, text=True,
+                            cwd=PROJECT_DIR, timeout=60)
+
+    responses = [json.loads(line) for line in result.stdout.splitlines()]
+    assert sorted((response['id'], response['output']) for response in responses) == [
+        (i, "ran cmd{}\n".format(i)) for i in range(8)]
+    assert all(response['ok'] for response in responses)
+    assert sorted(result.stderr.splitlines()) == ["worker of cmd{}".format(i) for i in range(8)]
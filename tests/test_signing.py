@@ -0,0 +1,41 @@
+import algosdk.transaction
+from algosdk import account
+
+import batch
+import diploma_codec
+import signing
+
+GENESIS_HASH = "SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI="
+
+
+# Build the groups of `num_txns` unsigned `issue_diplomas_batch` calls sent by `sender`
+def build_groups(sender, num_txns):
+    params = algosdk.transaction.SuggestedParams(1000, 1, 1001, GENESIS_HASH, "test", True)
+    student = account.generate_account()[1]
+    rows = ((student, diploma_codec.encode("Diploma {} :: MIT :: BSc :: 2020".format(i), 4))
+            for i in range(num_txns * batch.ACCOUNTS_PER_CALL))
+    return list(batch.group_calls(batch.issue_calls(sender, params, 1, rows)))
+
+
+def test_small_batch_in_process():
+    """Test that a batch below the threshold is signed without starting the worker processes."""
+    private_key, sender = account.generate_account()
+    groups = build_groups(sender, 20)
+
+    with signing.SigningPool([private_key], 2) as pool:
+        signed = list(pool.sign(groups))
+        assert pool._executor is None
+
+    assert signed == [[signing.sign_encoded(txn, private_key) for txn in txns] for txns in groups]
+
+
+def test_large_batch_in_workers():
+    """Test that a batch at the threshold is signed by the worker processes as it is in process."""
+    private_key, sender = account.generate_account()
+    groups = build_groups(sender, 20)
+
+    with signing.SigningPool([private_key], 2, min_txns=20) as pool:
+        signed = list(pool.sign(groups))
+        assert pool._executor is not None
+
+    assert signed == [[signing.sign_encoded(txn, private_key) for txn in txns] for txns in groups]
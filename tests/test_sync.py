@@ -0,0 +1,64 @@
+import os
+
+import pytest
+from algosdk import logic
+
+from assets import diploma_methods as methods
+
+import async_client
+import batch
+import common
+import diploma_codec
+import sync
+from conftest import fake_students
+
+DIPLOMA = diploma_codec.encode("Damian Barabonkov :: MIT :: BSc :: Mathematics :: 2020", 4)
+
+def test_mirror(fake_app, tmp_path):
+    """Test that the mirror follows the issuance and revocation of diplomas in local storage and boxes."""
+    node, client, private_key, app_id = fake_app
+    student1, student2 = fake_students(node, client, app_id, 2)
+    node.fund(logic.get_application_address(app_id), 1_000_000)
+
+    async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                          batch.issue_diploma_args(DIPLOMA), [student1])
+    async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                          batch.issue_diploma_args(DIPLOMA), [student2])
+    async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                          [methods.REVOKE_DIPLOMA], [student2])
+    async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                          batch.issue_diploma_args(DIPLOMA, boxes=True), [student2], [common.diploma_box(student2)])
+
+    mirror = sync.Mirror(os.path.join(tmp_path, "mirror.db"), app_id)
+    assert mirror.sync(client, start_round=1) == node.last_round
+    assert mirror.get_diplomas(student1) == {sync.LOCAL: {'diploma': DIPLOMA}}
+    assert mirror.get_diplomas(student2) == {sync.BOX: {'diploma': DIPLOMA}}
+    assert [(action, storage) for (_, _, action, storage, _) in mirror.get_history(student2)] == [
+        ("opt-in", None), ("issue", sync.LOCAL), ("revoke", sync.LOCAL), ("issue", sync.BOX)]
+    mirror.close()
+
+def test_mirror_checkpoint(fake_app, tmp_path):
+    """Test that a reopened mirror resumes from its checkpoint, applying no block twice."""
+    node, client, private_key, app_id = fake_app
+    student, = fake_students(node, client, app_id, 1)
+    path = os.path.join(tmp_path, "mirror.db")
+
+    mirror = sync.Mirror(path, app_id)
+    with pytest.raises(ValueError):
+        mirror.sync(client)
+    checkpoint = mirror.sync(client, start_round=1)
+    mirror.close()
+
+    async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                          batch.issue_diploma_args(DIPLOMA), [student])
+
+    # The start round of a later sync is ignored in favor of the checkpoint
+    mirror = sync.Mirror(path, app_id)
+    assert mirror.last_round == checkpoint
+    assert mirror.sync(client, start_round=1) == node.last_round
+    assert [action for (_, _, action, _, _) in mirror.get_history(student)] == ["opt-in", "issue"]
+    mirror.close()
+
+    # A mirror belongs to the app it was first synced for
+    with pytest.raises(ValueError):
+        sync.Mirror(path, app_id + 1)
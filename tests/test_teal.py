@@ -0,0 +1,28 @@
+import teal
+
+def test_assemble_constant_blocks():
+    """Test that constants referenced more than once are laid out in constant blocks as goal does."""
+    source = """#pragma version 8
+byte "diploma"
+int 7
+int 1
+int 7
+byte "diploma"
+pushint 7
+int 5
+concat
+return"""
+    assert teal.assemble(source) == bytes.fromhex(
+        "08"                      # version
+        "200107"                  # intcblock 7
+        "2601076469706c6f6d61"    # bytecblock "diploma"
+        "28" "22" "8101" "22" "28" "8107" "8105"
+        "50" "43")
+
+def test_assemble_constant_blocks_ranking():
+    """Test that the most referenced constants get the shortest references, and that old versions push none."""
+    source = "\n".join(["#pragma version 8"] + ["int {}".format(i) for i in range(6) for _ in range(i + 2)])
+    assert teal.assemble(source) == bytes.fromhex(
+        "08" "2006050403020100" + "2105" * 2 + "2104" * 3 + "25" * 4 + "24" * 5 + "23" * 6 + "22" * 7)
+
+    assert teal.assemble("#pragma version 2\nint 1\nreturn") == bytes.fromhex("0220010122" "43")
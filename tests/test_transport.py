@@ -0,0 +1,121 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fake_algod
+import transport
+
+class OneRequestHandler(BaseHTTPRequestHandler):
+    """Answers one request per connection and then closes it, without telling the client to."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _answer(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append((self.command, self.client_address))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+        self.close_connection = True
+
+    def do_GET(self):
+        self._answer()
+
+    def do_POST(self):
+        self._answer()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def closing_server():
+    """An HTTP server that closes every kept-alive connection right after its first request."""
+    server = ThreadingHTTPServer(('localhost', 0), OneRequestHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_retry_stale_connection(closing_server):
+    """Test that a GET over a connection the server closed while idle is retried once over a new one."""
+    pool = transport.ConnectionPool("http://localhost:{}".format(closing_server.server_address[1]))
+
+    assert pool.request('GET', '/first')[0] == 200
+    time.sleep(0.1)
+    assert pool.request('GET', '/second')[0] == 200
+
+    # Only the retry reaches the server, over a connection of its own
+    assert [method for method, _ in closing_server.requests] == ['GET', 'GET']
+    assert closing_server.requests[0][1] != closing_server.requests[1][1]
+    pool.close()
+
+def test_post_after_stale_connection(closing_server):
+    """Test that a POST after the server closed the idle connection is sent over a new one."""
+    pool = transport.ConnectionPool("http://localhost:{}".format(closing_server.server_address[1]))
+
+    assert pool.request('POST', '/first', body=b'{}')[0] == 200
+    time.sleep(0.1)
+    assert pool.request('POST', '/second', body=b'{}')[0] == 200
+
+    assert [method for method, _ in closing_server.requests] == ['POST', 'POST']
+    assert closing_server.requests[0][1] != closing_server.requests[1][1]
+    pool.close()
+
+class DroppingHandler(OneRequestHandler):
+    """Answers the first request of a connection and keeps it alive, then drops any later request unanswered."""
+
+    def setup(self):
+        super().setup()
+        self.answered = False
+
+    def _answer(self):
+        if self.answered:
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.server.requests.append((self.command, self.client_address))
+            self.close_connection = True
+            return
+        super()._answer()
+        self.answered = True
+        self.close_connection = False
+
+@pytest.fixture
+def dropping_server():
+    """An HTTP server that drops the second request of every connection after receiving it."""
+    server = ThreadingHTTPServer(('localhost', 0), DroppingHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_no_retry_received_post(dropping_server):
+    """Test that a POST the server received before dropping the connection is not repeated, unlike a GET."""
+    pool = transport.ConnectionPool("http://localhost:{}".format(dropping_server.server_address[1]))
+
+    assert pool.request('POST', '/first', body=b'{}')[0] == 200
+    with pytest.raises(transport.STALE_CONNECTION_ERRORS):
+        pool.request('POST', '/second', body=b'{}')
+    assert len(dropping_server.requests) == 2
+
+    assert pool.request('GET', '/third')[0] == 200
+    assert pool.request('GET', '/fourth')[0] == 200
+    assert [method for method, _ in dropping_server.requests] == ['POST', 'POST', 'GET', 'GET', 'GET']
+    pool.close()
+
+def test_pooled_client_reuses_connection():
+    """Test that the requests of a ``PooledAlgodClient`` to the fake node share one kept-alive connection."""
+    node = fake_algod.FakeAlgod()
+    servers = fake_algod.serve(node, algod_port=0, kmd_port=0, indexer_port=0)
+    try:
+        client = transport.PooledAlgodClient("", "http://localhost:{}".format(servers[0].server_address[1]))
+        assert client.status()['last-round'] == client.suggested_params().first
+        assert len(client.pool._idle) == 1
+        client.close()
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
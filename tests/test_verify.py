@@ -0,0 +1,106 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from algosdk import account, encoding
+
+import async_client
+import batch
+import confirmation
+import diploma_codec
+import verify
+from conftest import fake_students
+
+DIPLOMA = diploma_codec.encode("Damian Barabonkov :: MIT :: BSc :: Mathematics :: 2020", 4)
+
+def test_touched_addresses(fake_app):
+    """Test that a block touches the sender and accounts of the calls to the app, and all of them on an update."""
+    node, client, private_key, app_id = fake_app
+    registrar = account.address_from_private_key(private_key)
+    student, = fake_students(node, client, app_id, 1)
+
+    async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                          batch.issue_diploma_args(DIPLOMA), [student])
+    block = confirmation.fetch_block(client, node.last_round)
+    assert verify.touched_addresses(block, app_id) == {registrar, student}
+    assert verify.touched_addresses(block, app_id + 1) == set()
+
+    async_client.run_sync(client, async_client.pay, private_key, student, 1000)
+    assert verify.touched_addresses(confirmation.fetch_block(client, node.last_round), app_id) == set()
+
+    app = node.apps[app_id]
+    async_client.run_sync(client, async_client.update_app, private_key, app_id, app['approval'], app['clear'])
+    assert verify.touched_addresses(confirmation.fetch_block(client, node.last_round), app_id) is None
+
+def test_cache_invalidation(fake_app):
+    """Test that a cached diploma is only dropped by a block touching its address."""
+    node, client, private_key, app_id = fake_app
+    student1, student2 = fake_students(node, client, app_id, 2)
+    cache = verify.DiplomaCache(client, app_id)
+
+    assert cache.get(student1)['local'] is None
+    async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                          batch.issue_diploma_args(DIPLOMA), [student1])
+    assert cache.get(student1)['local'] is None
+
+    cache.invalidate(node.last_round, {student2})
+    assert cache.get(student1)['local'] is None
+    cache.invalidate(node.last_round, {student1})
+    assert cache.get(student1)['local'] == {'diploma': DIPLOMA}
+    assert cache.metrics()['hits'] == 2
+
+def test_cache_epoch_race(fake_app, monkeypatch):
+    """Test that a miss fetched while a block was applied is answered but not cached."""
+    node, client, private_key, app_id = fake_app
+    student, = fake_students(node, client, app_id, 1)
+    cache = verify.DiplomaCache(client, app_id)
+    fetch_diploma = verify.fetch_diploma
+
+    # A block touching another address is applied after the diploma was read from the node
+    def racing_fetch_diploma(client, addr, app_id):
+        diploma = fetch_diploma(client, addr, app_id)
+        cache.invalidate(node.last_round, {encoding.encode_address(bytes(32))})
+        return diploma
+    monkeypatch.setattr(verify, "fetch_diploma", racing_fetch_diploma)
+
+    assert cache.get(student)['local'] is None
+    assert cache.metrics()['size'] == 0
+
+    monkeypatch.setattr(verify, "fetch_diploma", fetch_diploma)
+    cache.get(student)
+    cache.get(student)
+    assert cache.metrics()['size'] == 1
+    assert (cache.metrics()['hits'], cache.metrics()['misses']) == (1, 2)
+
+def test_server_paths(fake_app):
+    """Test that the server answers paths with a query string or a trailing slash, and rejects unknown ones."""
+    node, client, private_key, app_id = fake_app
+    student, = fake_students(node, client, app_id, 1)
+    async_client.run_sync(client, async_client.call_app, private_key, app_id,
+                          batch.issue_diploma_args(DIPLOMA), [student])
+
+    server = verify.VerificationServer(('127.0.0.1', 0), verify.DiplomaCache(client, app_id))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}".format(server.server_address[1])
+    try:
+        for path in ["/diploma/{}", "/diploma/{}/", "/diploma/{}?fields=local"]:
+            with urllib.request.urlopen(url + path.format(student)) as response:
+                answer = json.load(response)
+            assert answer['address'] == student and answer['has_diploma']
+
+        request = urllib.request.Request(url + "/diplomas/?pretty", data=json.dumps({'addresses': [student]}).encode())
+        with urllib.request.urlopen(request) as response:
+            assert json.load(response)['diplomas'][0]['has_diploma']
+
+        with urllib.request.urlopen(url + "/metrics?format=json") as response:
+            assert 'hits' in json.load(response)
+
+        with pytest.raises(urllib.error.HTTPError, match="400"):
+            urllib.request.urlopen(url + "/diploma/{}x".format(student))
+        with pytest.raises(urllib.error.HTTPError, match="404"):
+            urllib.request.urlopen(url + "/unknown")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,200 @@
+import gzip
+import http.client
+import json
+import select
+import threading
+import time
+import zlib
+from urllib.parse import urlencode, urlsplit
+
+from algosdk import constants
+from algosdk.error import AlgodHTTPError, AlgodResponseError
+from algosdk.v2client import algod
+
+import metrics
+
+# The default maximum number of connections, and so of concurrent requests, to one host
+MAX_CONNECTIONS = 32
+
+# The seconds after which an idle connection is closed rather than reused, which is kept below
+# the keep-alive timeout of the node so that a reused connection is rarely already closed
+IDLE_TIMEOUT = 30
+
+# The errors raised when the node closed a kept-alive connection, after which a reused
+# connection is replaced and an idempotent request is retried once
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                           ConnectionResetError, BrokenPipeError)
+
+class ConnectionPool:
+    """A pool of keep-alive HTTP connections to one host, shared by every thread.
+
+    At most `max_connections` requests are in flight at once, further requests
+    wait for a connection to be returned. Idle connections are reused most
+    recently returned first, so that the pool shrinks back when the load drops.
+    """
+
+    def __init__(self, address, max_connections=MAX_CONNECTIONS, idle_timeout=IDLE_TIMEOUT):
+        url = urlsplit(address)
+        if url.scheme not in ('http', 'https'):
+            raise ValueError("Unsupported node address: {}".format(address))
+
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip('/')
+        self.idle_timeout = idle_timeout
+
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _new_connection(self, timeout):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    # Take the most recently returned idle connection, closing those idle for too long or already
+    # closed by the node
+    def _take(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, returned_at = self._idle.pop()
+                if now - returned_at < self.idle_timeout and not _is_closed(conn):
+                    return conn
+                conn.close()
+        return None
+
+    def _give_back(self, conn):
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    # Send a request over a pooled connection, returning its status, headers and body
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        with self._slots:
+            conn = self._take()
+            reused = conn is not None
+            if conn is None:
+                conn = self._new_connection(timeout)
+
+            while True:
+                # The timeout applies to this request only, since it differs between requests
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+
+                sent = False
+                try:
+                    conn.request(method, self.base_path + path, body=body, headers=headers or {})
+                    sent = True
+                    resp = conn.getresponse()
+                    data = resp.read()
+                except STALE_CONNECTION_ERRORS:
+                    conn.close()
+                    # Only a reused connection may have been closed by the node while idle. A request
+                    # that failed while being sent was not received, but a POST that was sent is not
+                    # repeated since it may have been
+                    if not reused or (sent and method != 'GET'):
+                        raise
+                    conn = self._new_connection(timeout)
+                    reused = False
+                    continue
+                except BaseException:
+                    conn.close()
+                    raise
+                break
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self._give_back(conn)
+            return resp.status, resp.headers, data
+
+    def close(self):
+        with self._lock:
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle.clear()
+
+# Helper function that returns whether the node closed the idle connection `conn`. Nothing is
+# expected from the node between requests, so a readable socket is at its end or out of step
+def _is_closed(conn):
+    if conn.sock is None:
+        return False
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+# Helper function that decompresses a response body according to its `Content-Encoding`
+def decode_body(headers, body):
+    encoding = (headers.get('Content-Encoding') or '').lower()
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        return zlib.decompress(body)
+    return body
+
+class PooledAlgodClient(algod.AlgodClient):
+    """An `AlgodClient` sending every request over a pool of keep-alive connections.
+
+    The stock client opens a new connection for every request, so against a
+    remote node most of the time of a request goes to the TCP and TLS handshakes.
+    With `compress` responses are requested gzip compressed, which pays off for
+    large responses such as blocks. Every request is recorded by `metrics`, with
+    the bytes actually sent and received.
+    """
+
+    def __init__(self, algod_token, algod_address, headers=None, max_connections=MAX_CONNECTIONS,
+                 idle_timeout=IDLE_TIMEOUT, compress=False):
+        super().__init__(algod_token, algod_address, headers)
+        self.compress = compress
+        self.pool = ConnectionPool(algod_address, max_connections, idle_timeout)
+
+    def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format='json',
+                      timeout=30):
+        header = {"User-Agent": "py-algorand-sdk"}
+        if self.headers:
+            header.update(self.headers)
+        if headers:
+            header.update(headers)
+        if requrl not in constants.no_auth:
+            header[constants.algod_auth_header] = self.algod_token
+        if self.compress:
+            header['Accept-Encoding'] = 'gzip'
+
+        path = requrl if requrl in constants.unversioned_paths else algod.api_version_path_prefix + requrl
+        if params:
+            path = path + "?" + urlencode(params)
+
+        started = time.perf_counter()
+        try:
+            status, resp_headers, body = self.pool.request(method, path, data, header, timeout)
+        except (OSError, http.client.HTTPException):
+            metrics.observe_node_request(method, requrl, time.perf_counter() - started, len(data or b''), 0, True)
+            raise
+        metrics.observe_node_request(method, requrl, time.perf_counter() - started, len(data or b''), len(body),
+                                     status >= 400)
+        body = decode_body(resp_headers, body)
+
+        if status >= 400:
+            message, details = body.decode('utf-8', 'replace'), None
+            try:
+                response = json.loads(body)
+                message, details = response['message'], response.get('data')
+            except (ValueError, KeyError, TypeError):
+                pass
+            raise AlgodHTTPError(message, status, details)
+
+        if response_format == 'json':
+            # Some algod responses are a 200 OK with an empty body
+            if not body:
+                return {}
+            try:
+                return json.loads(body)
+            except ValueError as e:
+                raise AlgodResponseError("Failed to parse JSON response from algod") from e
+        return body
+
+    def close(self):
+        self.pool.close()
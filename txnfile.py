@@ -0,0 +1,170 @@
+import base64
+import collections
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import msgpack
+from algosdk.error import AlgodHTTPError
+
+import batch
+import confirmation
+import signing
+
+# Every signed transaction file starts with this magic string followed by its records. A record
+# is a 4-byte big-endian length followed by a msgpack map holding the concatenated signed
+# transactions of one atomic group (`stxn`), the txid of its first transaction (`txid`),
+# its last valid round (`lv`), its number of transactions (`n`) and of diplomas (`d`). The
+# offsets of records count the bytes after the magic string, so the first record is at 0
+MAGIC = b'DIPLTXN1'
+LENGTH_PREFIX = struct.Struct('>I')
+
+# The default number of groups sent to the node concurrently while submitting
+SUBMIT_WORKERS = 8
+
+# Write every window of `(txns, signed_blobs)` groups in `windows` to the file at `path`.
+# Returns the number of groups written
+def write_groups(path, windows):
+    num_groups = 0
+    with open(path, 'wb') as tfile:
+        tfile.write(MAGIC)
+        for window in windows:
+            for txns, signed_blobs in window:
+                record = msgpack.packb({
+                    'stxn': b''.join(signed_blobs),
+                    'txid': txns[0].get_txid(),
+                    'lv': txns[0].last_valid_round,
+                    'n': len(txns),
+                    'd': sum(len(txn.accounts) for txn in txns),
+                }, use_bin_type=True)
+                tfile.write(LENGTH_PREFIX.pack(len(record)))
+                tfile.write(record)
+                num_groups += 1
+
+    return num_groups
+
+# Helper function that reads the length prefix of the record at the current position of `tfile`,
+# returning `None` at the end of the file
+def _read_length(path, tfile):
+    prefix = tfile.read(LENGTH_PREFIX.size)
+    if not prefix:
+        return None
+    if len(prefix) != LENGTH_PREFIX.size:
+        raise ValueError("{} is truncated at byte {}".format(path, tfile.tell() - len(MAGIC)))
+    return LENGTH_PREFIX.unpack(prefix)[0]
+
+# Helper generator that streams the records of the file at `path` starting at the record at
+# `offset`. Yields `(next_offset, record)` pairs, where `next_offset` is where the following
+# record starts. The records before `offset` are skipped by their length prefixes alone, so an
+# offset that is not the start of a record is refused rather than decoded
+def read_records(path, offset=None):
+    with open(path, 'rb') as tfile:
+        if tfile.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a signed transaction file".format(path))
+
+        position = 0
+        while offset is not None and position < offset:
+            length = _read_length(path, tfile)
+            if length is None:
+                break
+            position += LENGTH_PREFIX.size + length
+            tfile.seek(length, os.SEEK_CUR)
+        if offset is not None and position != offset:
+            raise ValueError("Offset {} is not the start of a record of {}".format(offset, path))
+
+        while True:
+            length = _read_length(path, tfile)
+            if length is None:
+                return
+
+            payload = tfile.read(length)
+            if len(payload) != length:
+                raise ValueError("{} is truncated at byte {}".format(path, tfile.tell() - len(MAGIC)))
+
+            yield tfile.tell() - len(MAGIC), msgpack.unpackb(payload, raw=False)
+
+# Sign a diploma for every row streamed from `rows` without any node access and write the
+# signed groups to the file at `path`. The `params` are typically exported by an online host
+def prepare_diplomas(path, params, private_key, app_id, rows, sign_workers=None):
+    signing_pool = signing.SigningPool([private_key], sign_workers) if sign_workers else None
+
+    try:
+        windows = batch.signed_issue_windows(lambda: params, private_key, app_id, rows, signing_pool=signing_pool)
+        return write_groups(path, windows)
+    finally:
+        if signing_pool is not None:
+            signing_pool.close()
+
+# Helper function that sends one record, returning whether it still has to be confirmed
+def _send_record(client, record):
+    try:
+        client.send_raw_transaction(base64.b64encode(record['stxn']))
+    except AlgodHTTPError as e:
+        # A record that was already confirmed before a restart needs no confirmation
+        if 'already in ledger' in str(e):
+            return False
+        raise
+    return True
+
+# Helper function that writes the submission progress of a file atomically
+def _save_offset(progress_path, offset):
+    with open(progress_path + '.tmp', 'w') as pfile:
+        pfile.write(str(offset))
+    os.replace(progress_path + '.tmp', progress_path)
+
+# Submit every group of the signed transaction file at `path`, sending up to `workers` groups
+# concurrently while the previous window is being confirmed. The offset after the last confirmed
+# window is recorded next to the file, so an interrupted submission resumes where it stopped
+# unless an explicit `offset` is given. Returns the number of confirmed and failed diplomas
+def submit_file(client, path, offset=None, workers=SUBMIT_WORKERS, groups_per_round=batch.GROUPS_PER_ROUND):
+    progress_path = path + '.offset'
+    if offset is None and os.path.exists(progress_path):
+        with open(progress_path, 'r') as pfile:
+            offset = int(pfile.read())
+        print("Resuming {} from offset {}".format(path, offset))
+
+    tracker = confirmation.ConfirmationTracker(client)
+    counts = {'confirmed': 0, 'failed': 0, 'sent': 0}
+    windows = collections.deque()
+
+    # Wait for the oldest window to be confirmed and record the progress past it
+    def _settle_oldest():
+        end_offset, futures = windows.popleft()
+        while not all(future.done() for future, _ in futures):
+            tracker.poll()
+
+        for future, num_diplomas in futures:
+            if future.exception() is None:
+                counts['confirmed'] += num_diplomas
+            else:
+                print(future.exception())
+                counts['failed'] += num_diplomas
+        _save_offset(progress_path, end_offset)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for window in batch.chunked(read_records(path, offset), groups_per_round):
+            sends = [executor.submit(_send_record, client, record) for (_, record) in window]
+
+            futures = []
+            for (_, record), send in zip(window, sends):
+                try:
+                    if send.result():
+                        futures.append((tracker.track(record['txid'], record['lv']), record['d']))
+                    else:
+                        counts['confirmed'] += record['d']
+                except AlgodHTTPError as e:
+                    print("Group {} rejected: {}".format(record['txid'], e))
+                    counts['failed'] += record['d']
+                counts['sent'] += record['d']
+
+            windows.append((window[-1][0], futures))
+
+            # Keep at most one window in flight while the next one is being sent
+            while len(windows) > 1:
+                _settle_oldest()
+            print("Submitted {} diplomas so far".format(counts['sent']))
+
+        while windows:
+            _settle_oldest()
+
+    return counts['confirmed'], counts['failed']
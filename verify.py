@@ -0,0 +1,278 @@
+# A read-only HTTP service answering whether an address holds a diploma of an app, and what
+# it says. Only the app id and a node are needed, so third parties can run it without the
+# accounts of `config.yml`. The answers are cached until a new block touches their address.
+#
+# Usage: python3 verify.py <app-id> [port]
+#
+#   GET  /diploma/<address>                      The diploma of one address
+#   POST /diplomas {"addresses": [<address>...]}  The diplomas of many addresses, in order
+#   GET  /metrics                                The cache hit ratio and counters
+import collections
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from algosdk import encoding
+
+import common
+import confirmation
+import diploma_codec
+import node_config
+import transport
+
+# The default number of addresses whose diplomas are cached
+CACHE_CAPACITY = 100_000
+
+# The most addresses answered by one batch query
+MAX_BATCH = 1000
+
+# The default port of the service
+DEFAULT_PORT = 8080
+
+# The seconds to wait before following the blocks again after the node failed
+RETRY_DELAY = 5
+
+# The `OnComplete` of the calls that change the whole app, as stored in a block
+UPDATE_APPLICATION, DELETE_APPLICATION = 4, 5
+
+# Fetch the diplomas of `addr` in `app_id` from the node, in local state and in a box
+def fetch_diploma(client, addr, app_id):
+    local_state = common.get_local_state(client, addr, app_id)
+    return {
+        'local': local_state if local_state and 'diploma' in local_state else None,
+        'box': common.get_box_diploma(client, addr, app_id),
+    }
+
+# Helper function that returns the addresses whose diplomas may have changed by the calls to
+# `app_id` in `block`, or `None` if the app itself changed so that any diploma may have
+def touched_addresses(block, app_id):
+    addrs = set()
+    for stxn in block.get('txns', []):
+        txn = stxn['txn']
+        if txn.get('type') != 'appl' or (txn.get('apid') or stxn.get('apid')) != app_id:
+            continue
+        if txn.get('apan', 0) in (UPDATE_APPLICATION, DELETE_APPLICATION):
+            return None
+
+        # A diploma is only ever written for the sender or a foreign account of the call
+        addrs.add(encoding.encode_address(txn['snd']))
+        addrs.update(encoding.encode_address(addr) for addr in txn.get('apat', []))
+
+    return addrs
+
+class DiplomaCache:
+    """A bounded LRU cache of the diplomas of an app, invalidated by the blocks.
+
+    An address stays cached until a block touching it is applied with `invalidate`.
+    A miss fetched while a block was being applied is answered but not cached, since
+    it may have been read from the node before that block.
+    """
+
+    def __init__(self, client, app_id, capacity=CACHE_CAPACITY):
+        self.client = client
+        self.app_id = app_id
+        self.capacity = capacity
+        self.round = None
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._counts = collections.Counter()
+
+    # Return the diplomas of `addr`, from the cache if possible
+    def get(self, addr):
+        with self._lock:
+            if addr in self._entries:
+                self._entries.move_to_end(addr)
+                self._counts['hits'] += 1
+                return self._entries[addr]
+            self._counts['misses'] += 1
+            epoch = self._epoch
+
+        diploma = fetch_diploma(self.client, addr, self.app_id)
+
+        with self._lock:
+            if epoch == self._epoch:
+                self._entries[addr] = diploma
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+                    self._counts['evictions'] += 1
+
+        return diploma
+
+    # Return the diplomas of every address in `addrs` in order, fetching the misses on `executor`
+    def get_many(self, addrs, executor):
+        return list(executor.map(self.get, addrs))
+
+    # Drop the cached diplomas of `addrs` touched by the block of round `rnd`, or every cached
+    # diploma if `addrs` is `None`
+    def invalidate(self, rnd, addrs):
+        with self._lock:
+            if addrs is None:
+                self._counts['invalidations'] += len(self._entries)
+                self._entries.clear()
+                self._epoch += 1
+            elif addrs:
+                for addr in addrs:
+                    if self._entries.pop(addr, None) is not None:
+                        self._counts['invalidations'] += 1
+                self._epoch += 1
+            self.round = rnd
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._counts['hits'] + self._counts['misses']
+            return {
+                'hits': self._counts['hits'],
+                'misses': self._counts['misses'],
+                'hit_ratio': self._counts['hits'] / lookups if lookups else None,
+                'evictions': self._counts['evictions'],
+                'invalidations': self._counts['invalidations'],
+                'size': len(self._entries),
+                'capacity': self.capacity,
+                'round': self.round,
+            }
+
+# Invalidate the `cache` by every new block, from the current round on, until `stop` is set.
+# A block that could not be fetched may have touched any address, so the whole cache is
+# dropped whenever following the blocks failed
+def follow_blocks(cache, stop):
+    client = cache.client
+    rnd = None
+    while not stop.is_set():
+        try:
+            if rnd is None:
+                rnd = client.status().get('last-round')
+                cache.invalidate(rnd, None)
+
+            client.status_after_block(rnd)
+            rnd += 1
+            cache.invalidate(rnd, touched_addresses(confirmation.fetch_block(client, rnd), cache.app_id))
+        except Exception as e:
+            print("Following the blocks failed: {}".format(e))
+            rnd = None
+            stop.wait(RETRY_DELAY)
+
+# Helper function that encodes the diplomas of `addr` as a JSON answer, with the fields of each
+# diploma decoded by `diploma_codec`, or its raw bytes in hex if it cannot be decoded
+def _diploma_json(addr, diploma):
+    def _decode(state):
+        if state is None:
+            return None
+        try:
+            return diploma_codec.decode(state['diploma'])
+        except ValueError:
+            return {'raw': state['diploma'].hex()}
+
+    return {
+        'address': addr,
+        'has_diploma': diploma['local'] is not None or diploma['box'] is not None,
+        'local': _decode(diploma['local']),
+        'box': _decode(diploma['box']),
+    }
+
+# Helper function that returns the path of a request's target, without its query string or
+# any trailing slash
+def _route(target):
+    return urlsplit(target).path.rstrip('/')
+
+class VerificationServer(ThreadingHTTPServer):
+    """Serves the diplomas of one app from a `DiplomaCache` over HTTP."""
+
+    daemon_threads = True
+
+    def __init__(self, address, cache, workers=common.INSPECT_WORKERS):
+        super().__init__(address, _Handler)
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        cache = self.server.cache
+        path = _route(self.path)
+
+        if path == '/metrics':
+            self._reply(200, cache.metrics())
+        elif path.startswith('/diploma/'):
+            addr = path[len('/diploma/'):]
+            if not encoding.is_valid_address(addr):
+                self._reply(400, {'error': "Invalid address: {}".format(addr)})
+                return
+            self._reply(200, dict(_diploma_json(addr, cache.get(addr)), app_id=cache.app_id, round=cache.round))
+        else:
+            self._reply(404, {'error': "Unknown path: {}".format(self.path)})
+
+    def do_POST(self):
+        cache = self.server.cache
+
+        if _route(self.path) != '/diplomas':
+            self._reply(404, {'error': "Unknown path: {}".format(self.path)})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            addrs = body['addresses']
+            if not isinstance(addrs, list) or len(addrs) > MAX_BATCH:
+                raise ValueError("addresses must be a list of at most {}".format(MAX_BATCH))
+            invalid = [addr for addr in addrs if not isinstance(addr, str) or not encoding.is_valid_address(addr)]
+            if invalid:
+                raise ValueError("Invalid addresses: {}".format(invalid))
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {'error': "Malformed request: {}".format(e)})
+            return
+
+        diplomas = cache.get_many(addrs, self.server.executor)
+        self._reply(200, {
+            'app_id': cache.app_id,
+            'round': cache.round,
+            'diplomas': [_diploma_json(addr, diploma) for addr, diploma in zip(addrs, diplomas)],
+        })
+
+    # Requests are not logged one by one, the metrics summarize them
+    def log_message(self, format, *args):
+        pass
+
+# Serve the diplomas of `app_id` on `port` until interrupted, invalidating the cache by the blocks
+def serve(client, app_id, port=DEFAULT_PORT, capacity=CACHE_CAPACITY):
+    cache = DiplomaCache(client, app_id, capacity)
+    stop = threading.Event()
+    follower = threading.Thread(target=follow_blocks, args=(cache, stop), daemon=True)
+    follower.start()
+
+    with VerificationServer(('', port), cache) as http_server:
+        print("Serving the diplomas of app-id {} on port {}".format(app_id, port))
+        try:
+            http_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python3 verify.py <app-id> [port]")
+        sys.exit(2)
+
+    # Only the node is shared with the DApp Interface Program, not its accounts
+    client = transport.PooledAlgodClient(node_config.algod_token, node_config.algod_address,
+                                         max_connections=node_config.algod_max_connections,
+                                         compress=node_config.algod_compress)
+    serve(client, int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) == 3 else DEFAULT_PORT)
+
+if __name__ == '__main__':
+    main()